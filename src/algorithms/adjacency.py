@@ -0,0 +1,84 @@
+from typing import Iterable, Tuple
+
+
+class TypedAdjacency:
+    """
+    Parent and child lookup per relationship type. For every type, each node
+    maps to its parents (edge targets) and children (edge sources) in the order
+    the relationships were added. Duplicate relationships are stored once.
+    """
+
+    def __init__(self, edges: Iterable[Tuple[str, str, str]] = ()):
+        self._parents = {}
+        self._children = {}
+        for start, end, rel_type in edges:
+            self.add(start, end, rel_type)
+
+    def add(self, start: str, end: str, rel_type: str):
+        """
+        Records a relationship of the given type from start (child) to end (parent).
+        """
+        self._parents.setdefault(rel_type, {}).setdefault(start, {})[end] = None
+        self._children.setdefault(rel_type, {}).setdefault(end, {})[start] = None
+
+    def remove_type(self, rel_type: str):
+        """
+        Drops all relationships of the given type.
+        """
+        self._parents.pop(rel_type, None)
+        self._children.pop(rel_type, None)
+
+    def updated(self, added: Iterable[Tuple[str, str, str]], removed: Iterable[Tuple[str, str, str]]) -> 'TypedAdjacency':
+        """
+        Returns an adjacency with the given relationships added and removed. Only
+        the lookups of the nodes involved are copied, all others are shared with
+        this one, which is not modified.
+        """
+        adjacency = TypedAdjacency()
+        adjacency._parents = {t: dict(p) for t, p in self._parents.items()}
+        adjacency._children = {t: dict(c) for t, c in self._children.items()}
+        copied = set()
+
+        def own(lookups: dict, rel_type: str, node: str) -> dict:
+            nodes = lookups.setdefault(rel_type, {})
+            if (id(lookups), rel_type, node) not in copied:
+                copied.add((id(lookups), rel_type, node))
+                nodes[node] = dict(nodes.get(node, {}))
+            return nodes[node]
+
+        for start, end, rel_type in removed:
+            own(adjacency._parents, rel_type, start).pop(end, None)
+            own(adjacency._children, rel_type, end).pop(start, None)
+        for start, end, rel_type in added:
+            own(adjacency._parents, rel_type, start)[end] = None
+            own(adjacency._children, rel_type, end)[start] = None
+        return adjacency
+
+    def without(self, rel_types: Iterable[str]) -> 'TypedAdjacency':
+        """
+        Returns an adjacency that shares the lookups of this one, except for the
+        given relationship types.
+        """
+        adjacency = TypedAdjacency()
+        adjacency._parents = {t: p for t, p in self._parents.items() if t not in rel_types}
+        adjacency._children = {t: c for t, c in self._children.items() if t not in rel_types}
+        return adjacency
+
+    def parents(self, node: str, rel_type: str) -> list:
+        """
+        Returns all parents of a node via relationships of the given type.
+        """
+        return list(self._parents.get(rel_type, {}).get(node, ()))
+
+    def children(self, node: str, rel_type: str) -> list:
+        """
+        Returns all children of a node via relationships of the given type.
+        """
+        return list(self._children.get(rel_type, {}).get(node, ()))
+
+    def parent(self, node: str, rel_type: str) -> str:
+        """
+        Returns the first recorded parent of a node via relationships of the
+        given type, or None if there is none.
+        """
+        return next(iter(self._parents.get(rel_type, {}).get(node, ())), None)
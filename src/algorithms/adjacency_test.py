@@ -0,0 +1,26 @@
+from adjacency import TypedAdjacency
+
+DIRECT = 'IS_DIRECTLY_CONSOLIDATED_BY'
+ULTIMATE = 'IS_ULTIMATELY_CONSOLIDATED_BY'
+
+
+def test_typed_adjacency():
+    adjacency = TypedAdjacency([
+        ('C1', 'P1', DIRECT),
+        ('C1', 'P1', DIRECT),  # duplicates are stored once
+        ('C2', 'P1', DIRECT),
+        ('C1', 'UP', ULTIMATE),
+    ])
+
+    assert adjacency.parent('C1', DIRECT) == 'P1'
+    assert adjacency.parents('C1', DIRECT) == ['P1']
+    assert adjacency.parent('C1', ULTIMATE) == 'UP'
+    assert adjacency.parent('P1', DIRECT) is None
+    assert adjacency.children('P1', DIRECT) == ['C1', 'C2']
+    assert adjacency.children('UP', ULTIMATE) == ['C1']
+    assert adjacency.children('UP', DIRECT) == []
+
+    adjacency.remove_type(DIRECT)
+    assert adjacency.parent('C1', DIRECT) is None
+    assert adjacency.children('P1', DIRECT) == []
+    assert adjacency.parent('C1', ULTIMATE) == 'UP'
@@ -0,0 +1,225 @@
+from typing import Callable, Iterable, List, Tuple
+
+import numpy as np
+
+# flags of the anomalies of a node, several can be set at once
+CYCLE = 1
+MULTIPLE_PARENTS = 2
+ORPHAN_ULTIMATE_PARENT = 4
+
+NAMES = {
+    CYCLE: 'cycle',
+    MULTIPLE_PARENTS: 'multiple_parents',
+    ORPHAN_ULTIMATE_PARENT: 'orphan_ultimate_parent',
+}
+
+
+def strongly_connected_components(n: int, starts: np.ndarray, ends: np.ndarray,
+                                   component: np.ndarray = None) -> np.ndarray:
+    """
+    Labels the strongly connected components of the graph of the given edges
+    with Tarjan's algorithm, -1 for nodes without edges. If the weakly connected
+    component of every node is given, only components with at least as many
+    distinct edges as nodes are searched, as all others are trees and can not
+    contain a cycle; their nodes are labelled -1 as well. This keeps the
+    search to the few irregular components. Apart from one sort of the edges,
+    everything is linear in the number of nodes and edges.
+    """
+    labels = np.full(n, -1, dtype=np.int32)
+    keep = np.ones(len(starts), dtype=bool)
+    if component is not None and len(starts):
+        pairs = np.unique(starts.astype(np.int64) * n + ends)
+        size = int(component.max()) + 1
+        edge_counts = np.bincount(component[pairs // n], minlength=size)
+        node_counts = np.bincount(component[component >= 0], minlength=size)
+        keep = (edge_counts >= node_counts)[component[starts]]
+    alive = np.zeros(n, dtype=bool)
+    alive[starts[keep]] = True
+    alive[ends[keep]] = True
+
+    core = np.flatnonzero(alive)
+    if len(core) == 0:
+        return labels
+    sources = np.searchsorted(core, starts[keep])
+    targets = np.searchsorted(core, ends[keep])
+    order = np.argsort(sources, kind='stable')
+    offsets = np.zeros(len(core) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=len(core)), out=offsets[1:])
+    offsets, targets = offsets.tolist(), targets[order].tolist()
+
+    # iterative Tarjan, every work item is a node and the position of its next edge
+    index, low = {}, {}
+    stack, on_stack = [], set()
+    label = 0
+    local = [-1] * len(core)
+    for root in range(len(core)):
+        if root in index:
+            continue
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, offsets[root])]
+        while work:
+            v, position = work[-1]
+            if position < offsets[v + 1]:
+                work[-1] = (v, position + 1)
+                w = targets[position]
+                if w not in index:
+                    index[w] = low[w] = len(index)
+                    stack.append(w)
+                    on_stack.add(w)
+                    work.append((w, offsets[w]))
+                elif w in on_stack:
+                    low[v] = min(low[v], index[w])
+                continue
+            work.pop()
+            if work:
+                u = work[-1][0]
+                low[u] = min(low[u], low[v])
+            if low[v] == index[v]:
+                while True:
+                    w = stack.pop()
+                    on_stack.discard(w)
+                    local[w] = label
+                    if w == v:
+                        break
+                label += 1
+    labels[core] = local
+    return labels
+
+
+def find_anomalies(n: int, starts: np.ndarray, ends: np.ndarray, direct: np.ndarray, ultimate_starts: np.ndarray,
+                   ultimate_ends: np.ndarray, component: np.ndarray) -> np.ndarray:
+    """
+    Computes the anomaly flags of all nodes from their direct (child, parent)
+    relationships, i.e. all except the ultimate parent ones, which of them are
+    direct consolidations (RR.DIRECT), their ultimate (child, parent)
+    relationships and the direct component of every node:
+
+        - CYCLE: the node is on a cycle of direct relationships, including
+          relationships of a node with itself
+        - MULTIPLE_PARENTS: the node has more than one direct parent via
+          direct consolidations, the ones get_direct_parent chooses from
+        - ORPHAN_ULTIMATE_PARENT: an ultimate parent of the node is not in its
+          direct component, so it can not be reached via direct parents
+    """
+    flags = np.zeros(n, dtype=np.uint8)
+
+    labels = strongly_connected_components(n, starts, ends, component)
+    sizes = np.bincount(labels[labels >= 0])
+    cyclic = labels >= 0
+    cyclic[cyclic] = sizes[labels[cyclic]] > 1
+    cyclic[starts[starts == ends]] = True
+    flags[cyclic] |= CYCLE
+
+    pairs = np.unique(starts[direct].astype(np.int64) * n + ends[direct])
+    flags[np.bincount(pairs // n, minlength=n) > 1] |= MULTIPLE_PARENTS
+
+    flags[orphans(ultimate_starts, ultimate_ends, component)] |= ORPHAN_ULTIMATE_PARENT
+    return flags
+
+
+def orphans(ultimate_starts: np.ndarray, ultimate_ends: np.ndarray, component: np.ndarray) -> np.ndarray:
+    """
+    Returns the nodes with an ultimate parent outside their direct component,
+    see ORPHAN_ULTIMATE_PARENT in find_anomalies.
+    """
+    orphan = (ultimate_starts != ultimate_ends) & (
+        (component[ultimate_starts] != component[ultimate_ends]) | (component[ultimate_ends] == -1)
+    )
+    return ultimate_starts[orphan]
+
+
+class AnomalyIndex:
+    """
+    Anomalies of the direct parent hierarchy found once when the graph is
+    loaded, as one byte of flags per node, see find_anomalies. Level
+    assignment and traversals check the flags to know up front where the
+    hierarchy is not a tree, and responses report them.
+    """
+
+    def __init__(self, id_of: Callable, flags: np.ndarray, ids: dict = None):
+        self.id_of = id_of
+        self.flags = flags
+        self.ids = ids
+
+    def flags_of(self, lei: str) -> int:
+        i = self.id_of(lei)
+        return 0 if i is None else int(self.flags[i])
+
+    def names(self, lei: str) -> List[str]:
+        """
+        Returns the names of the anomalies of a node, see NAMES.
+        """
+        flags = self.flags_of(lei)
+        return [name for flag, name in NAMES.items() if flags & flag]
+
+    def of(self, nodes: Iterable[str]) -> dict:
+        """
+        Returns the names of the anomalies of all given nodes that have any.
+        """
+        return {node: self.names(node) for node in nodes if self.flags_of(node)}
+
+    def counts(self) -> dict:
+        """
+        Returns the number of nodes with each anomaly.
+        """
+        return {name: int(np.count_nonzero(self.flags & flag)) for flag, name in NAMES.items()}
+
+    def updated(self, nodes: list, edges: Iterable[Tuple[str, str, bool]], ultimate_edges: Iterable[Tuple[str, str]],
+                component_of: Callable, removed: Iterable[str] = ()) -> 'AnomalyIndex':
+        """
+        Returns a new index in which the anomalies of the given nodes are found
+        again from their direct and ultimate edges as for from_edges, which have to
+        cover complete components of the changed hierarchy, as for
+        LevelIndex.updated. Removed nodes lose their flags. Only indexes built
+        with from_edges can be updated. This index is not modified.
+        """
+        ids = dict(self.ids)
+        for node in nodes:
+            ids.setdefault(node, len(ids))
+        flags = np.zeros(len(ids), dtype=np.uint8)
+        flags[:len(self.flags)] = self.flags
+        flags[np.array([ids[node] for node in removed if node in ids], dtype=np.int64)] = 0
+
+        patch = AnomalyIndex.from_edges(nodes, edges, ultimate_edges, component_of)
+        flags[np.array([ids[node] for node in nodes], dtype=np.int64)] = patch.flags[:len(nodes)]
+        return AnomalyIndex(ids.get, flags, ids)
+
+    @staticmethod
+    def from_arrays(n: int, id_of: Callable, starts: np.ndarray, ends: np.ndarray, direct: np.ndarray,
+                    ultimate_starts: np.ndarray, ultimate_ends: np.ndarray, component: np.ndarray) -> 'AnomalyIndex':
+        """
+        Builds the index from direct and ultimate (child, parent) edges given as
+        arrays of node ids, a mask of the direct edges that are direct
+        consolidations, and the component id of every node.
+        """
+        return AnomalyIndex(id_of, find_anomalies(n, starts, ends, direct, ultimate_starts, ultimate_ends, component))
+
+    @staticmethod
+    def from_edges(nodes: list, edges: Iterable[Tuple[str, str, bool]], ultimate_edges: Iterable[Tuple[str, str]],
+                   component_of: Callable) -> 'AnomalyIndex':
+        """
+        Builds the index from a node list, direct (child, parent, whether it is a
+        direct consolidation) edges, ultimate (child, parent) edges and a lookup
+        of the component id of a node. Ultimate parents that are not in the node
+        list are added to it.
+        """
+        ids = {node: i for i, node in enumerate(nodes)}
+        starts, ends, direct = [], [], []
+        for start, end, is_direct in edges:
+            starts.append(ids[start])
+            ends.append(ids[end])
+            direct.append(is_direct)
+        ultimate_starts, ultimate_ends = [], []
+        for start, end in ultimate_edges:
+            ultimate_starts.append(ids.setdefault(start, len(ids)))
+            ultimate_ends.append(ids.setdefault(end, len(ids)))
+        component = [component_of(node) for node in ids]
+        index = AnomalyIndex.from_arrays(
+            len(ids), ids.get, np.array(starts, dtype=np.int64), np.array(ends, dtype=np.int64),
+            np.array(direct, dtype=bool), np.array(ultimate_starts, dtype=np.int64), np.array(ultimate_ends, dtype=np.int64),
+            np.array([-1 if c is None else c for c in component], dtype=np.int64)
+        )
+        index.ids = ids
+        return index
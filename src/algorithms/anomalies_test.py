@@ -0,0 +1,112 @@
+import random
+
+import networkx as nx
+import numpy as np
+import pytest
+from anomalies import CYCLE, MULTIPLE_PARENTS, ORPHAN_ULTIMATE_PARENT, AnomalyIndex, strongly_connected_components
+from conftest import mk_case, mk_compact, mk_graph
+from graph import RR, Graph
+from graph_builder import DirectNodeGraphWithParentNetworkBuilder
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_strongly_connected_components(seed):
+    r = random.Random(seed)
+    n = 40
+    edges = [(r.randrange(n), r.randrange(n)) for _ in range(50)]
+    starts, ends = np.array([u for u, _ in edges], dtype=np.int64), np.array([v for _, v in edges], dtype=np.int64)
+    labels = strongly_connected_components(n, starts, ends)
+
+    expected = {frozenset(c) for c in nx.strongly_connected_components(nx.DiGraph(edges)) if len(c) > 1}
+    found = {}
+    for node in range(n):
+        if labels[node] >= 0:
+            found.setdefault(labels[node], set()).add(node)
+    assert {frozenset(c) for c in found.values() if len(c) > 1} == expected
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_strongly_connected_components_by_component(seed):
+    r = random.Random(seed)
+    n = 60
+    # trees with a few extra edges
+    edges = [(i, r.randrange(i)) for i in range(1, n) if i % 20] + [(r.randrange(n), r.randrange(n)) for _ in range(3)]
+    starts, ends = np.array([u for u, _ in edges], dtype=np.int64), np.array([v for _, v in edges], dtype=np.int64)
+    component = np.full(n, -1, dtype=np.int64)
+    for i, c in enumerate(nx.weakly_connected_components(nx.DiGraph(edges))):
+        component[list(c)] = i
+    labels = strongly_connected_components(n, starts, ends, component)
+
+    expected = {frozenset(c) for c in nx.strongly_connected_components(nx.DiGraph(edges)) if len(c) > 1}
+    found = {}
+    for node in range(n):
+        if labels[node] >= 0:
+            found.setdefault(labels[node], set()).add(node)
+    assert {frozenset(c) for c in found.values() if len(c) > 1} == expected
+
+
+def test_strongly_connected_components_skips_trees():
+    n = 100000
+    starts = np.arange(1, n)
+    labels = strongly_connected_components(n, starts, starts - 1, np.zeros(n, dtype=np.int64))
+    assert (labels == -1).all()
+
+
+@pytest.fixture
+def g():
+    # A <- B <- C, C also reports to D, X <-> Y, S reports to itself and E's
+    # ultimate parent Z is not connected with it via direct relationships
+    return Graph([
+        RR('B', 'A', RR.DIRECT),
+        RR('C', 'B', RR.DIRECT),
+        RR('C', 'D', RR.DIRECT),
+        RR('C', 'A', RR.ULTIMATE),
+        RR('X', 'Y', RR.DIRECT),
+        RR('Y', 'X', RR.DIRECT),
+        RR('S', 'S', RR.DIRECT),
+        RR('E', 'F', RR.BRANCH),
+        RR('E', 'Z', RR.ULTIMATE),
+    ]).build_indexes()
+
+
+def test_anomalies(g):
+    index = g.anomaly_index
+    assert index.names('A') == []
+    assert index.names('C') == ['multiple_parents']
+    assert index.names('X') == index.names('Y') == index.names('S') == ['cycle']
+    assert index.names('E') == ['orphan_ultimate_parent']
+    assert index.names('UNKNOWN') == []
+    assert index.of(['A', 'C', 'E']) == {'C': ['multiple_parents'], 'E': ['orphan_ultimate_parent']}
+    assert index.counts() == {'cycle': 3, 'multiple_parents': 1, 'orphan_ultimate_parent': 1}
+
+
+def test_several_anomalies():
+    index = AnomalyIndex.from_edges(['A', 'B', 'C'], [('A', 'B', True), ('B', 'A', True), ('A', 'C', True)],
+                                    [('A', 'D')], {'A': 0, 'B': 0, 'C': 0, 'D': 1}.get)
+    assert index.flags_of('A') == CYCLE | MULTIPLE_PARENTS | ORPHAN_ULTIMATE_PARENT
+    assert index.names('A') == ['cycle', 'multiple_parents', 'orphan_ultimate_parent']
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_anomaly_index_of_engines_and_deltas(seed):
+    rr, names, delta, expected_rr, expected_names = mk_case(seed)
+    graph = mk_graph(rr, names)
+    updated = graph.apply_delta(delta)
+    for g, expected in ((mk_compact(rr, names), graph), (updated, mk_graph(expected_rr, expected_names)),
+                        (mk_compact(expected_rr, expected_names), mk_graph(expected_rr, expected_names))):
+        assert {node: g.anomaly_index.names(node) for node in g.nodes} == \
+            {node: expected.anomaly_index.names(node) for node in expected.nodes}
+
+
+def test_branch_is_not_a_second_parent():
+    rr = [('B', 'A', RR.DIRECT), ('B', 'C', RR.BRANCH), ('D', 'A', RR.DIRECT), ('D', 'E', RR.DIRECT)]
+    for g in (mk_graph(rr, []), mk_compact(rr, [])):
+        assert g.anomaly_index.names('B') == []
+        assert g.anomaly_index.names('D') == ['multiple_parents']
+
+
+def test_structure_reports_anomalies(g):
+    builder = DirectNodeGraphWithParentNetworkBuilder()
+    assert builder.structure(g, 'B')['anomalies'] == {'C': ['multiple_parents']}
+    assert builder.structure(g, 'X')['anomalies'] == {'X': ['cycle'], 'Y': ['cycle']}
+    assert builder.structure(g, 'B', max_depth=0)['anomalies'] == {}
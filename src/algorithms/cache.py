@@ -0,0 +1,114 @@
+import sys
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+
+def payload_size(value) -> int:
+    """
+    Approximates the memory used by a payload of nested dicts, lists and scalars.
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(payload_size(k) + payload_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(payload_size(v) for v in value)
+    return size
+
+
+class StructureCache:
+    """
+    Thread-safe LRU cache for structure payloads, bounded by the approximate
+    memory used by the cached values. Least recently used entries are evicted
+    once `max_bytes` is exceeded. Hits, misses and evictions are counted.
+    """
+
+    def __init__(self, max_bytes: int, sizeof: Callable = payload_size):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def get(self, key: Hashable):
+        """
+        Returns the cached value for a key, or None if it is not cached.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value):
+        """
+        Caches a value. Values larger than the whole cache are not stored.
+        """
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+    def get_or_build(self, key: Hashable, build: Callable):
+        """
+        Returns the cached value for a key, building and caching it on a miss.
+        """
+        value = self.get(key)
+        if value is None:
+            value = build()
+            self.put(key, value)
+        return value
+
+    def rekey(self, migrate: Callable):
+        """
+        Replaces the key of every entry by migrate(key), dropping the entries for
+        which it returns None, e.g. after a dataset update. The order of use is
+        kept.
+        """
+        with self._lock:
+            entries = OrderedDict()
+            for key, (value, size) in self._entries.items():
+                new_key = migrate(key)
+                if new_key is None:
+                    self.bytes -= size
+                else:
+                    entries[new_key] = (value, size)
+            self._entries = entries
+
+    def clear(self):
+        """
+        Drops all entries, e.g. after the dataset was reloaded. Counters are kept.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        return {
+            'entries': len(self._entries),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
@@ -0,0 +1,56 @@
+from cache import StructureCache, payload_size
+
+
+def test_structure_cache_hits_and_misses():
+    cache = StructureCache(max_bytes=10 ** 6)
+
+    assert cache.get('a') is None
+    cache.put('a', {'nodes': [], 'edges': []})
+    assert cache.get('a') == {'nodes': [], 'edges': []}
+
+    builds = []
+    assert cache.get_or_build('b', lambda: builds.append(1) or 'B') == 'B'
+    assert cache.get_or_build('b', lambda: builds.append(1) or 'B') == 'B'
+    assert builds == [1]
+
+    assert cache.stats()['hits'] == 2
+    assert cache.stats()['misses'] == 2
+    assert len(cache) == 2
+
+
+def test_structure_cache_evicts_least_recently_used():
+    cache = StructureCache(max_bytes=30, sizeof=len)
+    cache.put('a', 'x' * 10)
+    cache.put('b', 'x' * 10)
+    cache.put('c', 'x' * 10)
+    cache.get('a')
+    cache.put('d', 'x' * 10)
+
+    assert 'b' not in cache
+    assert 'a' in cache and 'c' in cache and 'd' in cache
+    assert cache.bytes == 30
+    assert cache.evictions == 1
+
+    cache.put('huge', 'x' * 31)
+    assert 'huge' not in cache
+
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.bytes == 0
+
+
+def test_payload_size():
+    assert payload_size({'nodes': ['a' * 100]}) > payload_size({'nodes': ['a']})
+
+
+def test_structure_cache_rekey():
+    cache = StructureCache(max_bytes=100, sizeof=len)
+    cache.put(('a', 1), 'x' * 10)
+    cache.put(('b', 1), 'x' * 10)
+    cache.put(('c', 1), 'x' * 10)
+
+    cache.rekey(lambda key: None if key[0] == 'b' else (key[0], 2))
+
+    assert list(cache._entries) == [('a', 2), ('c', 2)]
+    assert cache.bytes == 20
+    assert cache.get(('a', 2)) == 'x' * 10
@@ -0,0 +1,593 @@
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from algorithms.anomalies import ORPHAN_ULTIMATE_PARENT, AnomalyIndex, find_anomalies, orphans
+from algorithms.encoding import dumps
+from algorithms.graph import RR, Graph, iter_rr_chunks
+from algorithms.hierarchy import HierarchyIndex
+from algorithms.levels import LevelIndex, gather
+from algorithms.snapshot import Snapshot, delta_path
+
+
+class CompactAdjacency:
+    """
+    Parent and child lookup per relationship type on top of the CSR adjacency
+    of a snapshot. It offers the same lookups as TypedAdjacency, but keeps no
+    Python objects per node or edge.
+    """
+
+    def __init__(self, graph: 'CompactGraph'):
+        self.graph = graph
+        self.snapshot = graph.snapshot
+
+    def parents(self, node: str, rel_type: str) -> list:
+        """
+        Returns all parents of a node via relationships of the given type.
+        """
+        i, code = self.graph._id(node), self.graph.type_codes.get(rel_type)
+        if i is None or code is None:
+            return []
+        targets, types = self.snapshot.out_edges(i)
+        return [self.snapshot.lei(j) for j in dict.fromkeys(targets[types == code].tolist())]
+
+    def children(self, node: str, rel_type: str) -> list:
+        """
+        Returns all children of a node via relationships of the given type.
+        """
+        i, code = self.graph._id(node), self.graph.type_codes.get(rel_type)
+        if i is None or code is None:
+            return []
+        sources, types = self.snapshot.in_edges(i)
+        return [self.snapshot.lei(j) for j in dict.fromkeys(sources[types == code].tolist())]
+
+    def parent(self, node: str, rel_type: str) -> str:
+        """
+        Returns the parent of a node via relationships of the given type, or None
+        if there is none. If there are several, the one whose first relationship
+        with the node comes first is returned, as in Graph.
+        """
+        i, code = self.graph._id(node), self.graph.type_codes.get(rel_type)
+        if i is None or code is None:
+            return None
+        targets, types = self.snapshot.out_edges(i)
+        matches = targets[types == code]
+        if len(matches) == 0:
+            return None
+        if len(matches) > 1:
+            first_seen = {}
+            for target in targets.tolist():
+                first_seen.setdefault(target, len(first_seen))
+            matches = [min(matches.tolist(), key=first_seen.get)]
+        return self.snapshot.lei(int(matches[0]))
+
+
+def _component_labels(n: int, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """
+    Helper function that joins the nodes of the given relationships with
+    union-find. Returns the smallest id of its component for every node, nodes
+    without relationships keep their own id.
+    """
+    # the smaller id always becomes the root, so that every node ends up with
+    # the smallest id of its component
+    parent = list(range(n))
+
+    def find(node: int) -> int:
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    for u, v in zip(starts.tolist(), ends.tolist()):
+        root_u, root_v = find(u), find(v)
+        if root_u < root_v:
+            parent[root_v] = root_u
+        elif root_v < root_u:
+            parent[root_u] = root_v
+    labels = np.arange(n, dtype=np.int32)
+    linked = np.unique(np.concatenate([starts, ends]))
+    labels[linked] = [find(node) for node in linked.tolist()]
+    return labels
+
+
+class CompactComponentIndex:
+    """
+    Index of the components connected via direct relationships, stored as an
+    array of component ids per LEI id and the LEI ids grouped by component.
+    It offers the same lookups as ComponentIndex.
+    """
+
+    def __init__(self, graph: 'CompactGraph', labels: np.ndarray = None):
+        self.graph = graph
+        snapshot = graph.snapshot
+        if labels is None:
+            keep = snapshot.edge_type != graph.type_codes.get(RR.ULTIMATE, -1)
+            labels = _component_labels(len(snapshot), snapshot.edge_start[keep], snapshot.edge_end[keep])
+
+        # only nodes with relationships form components, numbered in id order
+        nodes = np.flatnonzero(graph._degrees() > 0)
+        roots, component = np.unique(labels[nodes], return_inverse=True)
+        self.component = np.full(len(snapshot), -1, dtype=np.int32)
+        self.component[nodes] = component
+        order = np.argsort(component, kind='stable')
+        self.members = nodes[order].astype(np.int32)
+        self.offsets = np.zeros(len(roots) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(component, minlength=len(roots)), out=self.offsets[1:])
+
+    def affected(self, ids: np.ndarray) -> np.ndarray:
+        """
+        Returns the given LEI ids together with the ids of all nodes of their
+        components, sorted, i.e. all nodes whose component can change if
+        relationships of the given nodes change.
+        """
+        components = np.unique(self.component[ids])
+        components = components[components >= 0]
+        _, positions = gather(self.offsets, self.members, components)
+        return np.union1d(ids, self.members[positions]).astype(np.int64)
+
+    def updated(self, graph: 'CompactGraph', remap: np.ndarray, affected: np.ndarray) -> 'CompactComponentIndex':
+        """
+        Returns the index of a graph that a delta was applied to, see
+        CompactGraph.apply_delta. The old LEI ids map to the ids of the new
+        graph via `remap`, and `affected` are the new ids of all nodes whose
+        component can change (see affected). Only their relationships are joined
+        again, all other nodes keep the components of this index. The result is
+        the same as building the index of the new graph from scratch. This index
+        is not modified.
+        """
+        snapshot = graph.snapshot
+        labels = np.arange(len(snapshot), dtype=np.int32)
+        indexed = np.flatnonzero(self.component >= 0)
+        labels[remap[indexed]] = remap[self.members[self.offsets[self.component[indexed]]]]
+
+        keep = (snapshot.edge_type != graph.type_codes.get(RR.ULTIMATE, -1)) & np.isin(snapshot.edge_start, affected)
+        joined = _component_labels(len(snapshot), snapshot.edge_start[keep], snapshot.edge_end[keep])
+        labels[affected] = joined[affected]
+        return CompactComponentIndex(graph, labels)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __contains__(self, node: str) -> bool:
+        return self.component_of(node) is not None
+
+    def component_ids(self) -> Iterable[int]:
+        return range(len(self))
+
+    def component_of(self, node: str) -> int:
+        """
+        Returns the component id of a node, or None if the node is not indexed.
+        """
+        i = self.graph._id(node)
+        return None if i is None else int(self.component[i])
+
+    def nodes(self, node: str) -> list:
+        """
+        Returns all nodes in the component of the given node. A node that is not
+        indexed is only connected to itself.
+        """
+        component_id = self.component_of(node)
+        if component_id is None:
+            return [node]
+        return self.members_of(component_id)
+
+    def members_of(self, component_id: int) -> list:
+        """
+        Returns all nodes of the component with the given id.
+        """
+        members = self.members[self.offsets[component_id]:self.offsets[component_id + 1]]
+        return self.graph.snapshot.leis[members].astype(str).tolist()
+
+    def size(self, node: str) -> int:
+        """
+        Returns the number of nodes in the component of the given node.
+        """
+        component_id = self.component_of(node)
+        return 1 if component_id is None else int(self.offsets[component_id + 1] - self.offsets[component_id])
+
+
+class CompactGraph:
+    """
+    Read-only graph engine with dense integer node ids. The LEI table of the
+    snapshot interns LEIs to ids, and relationships are read from its CSR
+    adjacency with small integer type codes, so no per-node or per-edge Python
+    objects are kept in memory. When the snapshot is memory-mapped, all worker
+    processes share the same pages.
+
+    It offers the same lookups as Graph. Queries that return a graph return a
+    regular (networkx based) Graph, which only contains the nodes and edges of
+    the answer.
+    """
+
+    # names for the labels of query results, None to use the names of Graph
+    lookup_table = None
+
+    def __init__(self, snapshot: Snapshot):
+        self.snapshot = snapshot
+        self.type_codes = {rel_type: code for code, rel_type in enumerate(snapshot.types)}
+        self.adjacency = CompactAdjacency(self)
+        self.levels = None
+        self._component_index = None
+        self._level_index = None
+        self._hierarchy_index = None
+        self._anomaly_index = None
+
+    def __contains__(self, lei: str) -> bool:
+        return self._id(lei) is not None
+
+    def __len__(self):
+        return int(np.count_nonzero(self._degrees()))
+
+    def __str__(self):
+        return self.to_json()
+
+    @property
+    def nodes(self) -> list:
+        """
+        All LEIs that take part in at least one relationship.
+        """
+        return self.snapshot.leis[self._degrees() > 0].astype(str).tolist()
+
+    def _degrees(self) -> np.ndarray:
+        return np.diff(self.snapshot.out_offsets) + np.diff(self.snapshot.in_offsets)
+
+    def _id(self, lei: str) -> int:
+        """
+        Helper function to intern a LEI. Returns None if the LEI has no relationships.
+        """
+        i = self.snapshot.id_of(lei)
+        if i is None or (self.snapshot.out_offsets[i] == self.snapshot.out_offsets[i + 1] and
+                         self.snapshot.in_offsets[i] == self.snapshot.in_offsets[i + 1]):
+            return None
+        return i
+
+    def _codes(self, rel_types: set) -> set:
+        return {self.type_codes[rel_type] for rel_type in rel_types or () if rel_type in self.type_codes}
+
+    def get_direct_parent(self, node: str) -> str:
+        return self.adjacency.parent(node, RR.DIRECT)
+
+    def get_ultimate_parent(self, node: str) -> str:
+        return self.adjacency.parent(node, RR.ULTIMATE)
+
+    def has_direct_parent(self, node: str) -> bool:
+        return self.get_direct_parent(node) is not None
+
+    def has_ultimate_parent(self, node: str) -> bool:
+        return self.get_ultimate_parent(node) is not None
+
+    def get_direct_children(self, node: str) -> list:
+        return self.adjacency.children(node, RR.DIRECT)
+
+    def get_ultimate_children(self, node: str) -> list:
+        return self.adjacency.children(node, RR.ULTIMATE)
+
+    def get_branches(self, node: str) -> list:
+        return self.adjacency.children(node, RR.BRANCH)
+
+    def _neighbours(self, lei: str, edges, exclude: set) -> list:
+        i = self._id(lei)
+        if i is None:
+            return []
+        neighbours, types = edges(i)
+        excluded = list(self._codes(exclude))
+        if excluded:
+            neighbours = neighbours[~np.isin(types, excluded)]
+        return [self.snapshot.lei(j) for j in dict.fromkeys(neighbours.tolist())]
+
+    def get_node_labels(self, leis: list) -> list:
+        """
+        Looks up the legal names of the given LEIs, from the names of this graph
+        or else from those of Graph.
+        """
+        lookup_table = self.lookup_table if self.lookup_table is not None else Graph.lookup_table
+        return [label if label is not None else 'id not found' for label in lookup_table.get_labels(leis)]
+
+    def get_parents(self, node: str, exclude: set = None) -> list:
+        """
+        Returns all parents of a node via relationships of any type that is not
+        in `exclude`.
+        """
+        return self._neighbours(node, self.snapshot.out_edges, exclude)
+
+    def get_children(self, node: str, exclude: set = None) -> list:
+        """
+        Returns all children of a node via relationships of any type that is not
+        in `exclude`.
+        """
+        return self._neighbours(node, self.snapshot.in_edges, exclude)
+
+    def _connected_ids(self, i: int, exclude: set = None) -> list:
+        """
+        Helper function to collect the ids connected with node id i, following
+        relationships in both directions except those of the excluded types.
+        """
+        excluded = list(self._codes(exclude))
+        seen = {i: None}
+        queue = [i]
+        while queue:
+            node = queue.pop()
+            for neighbours, types in (self.snapshot.out_edges(node), self.snapshot.in_edges(node)):
+                if excluded:
+                    neighbours = neighbours[~np.isin(types, excluded)]
+                for neighbour in neighbours.tolist():
+                    if neighbour not in seen:
+                        seen[neighbour] = None
+                        queue.append(neighbour)
+        return list(seen)
+
+    def connected_nodes(self, lei: str, exclude: set = None) -> list:
+        """
+        This function finds all nodes connected with a given LEI, regardless of
+        the edge direction. Edges whose type is in `exclude` are not followed.
+        """
+        i = self._id(lei)
+        if i is None:
+            return [lei]
+        return [self.snapshot.lei(j) for j in self._connected_ids(i, exclude)]
+
+    @property
+    def component_index(self) -> CompactComponentIndex:
+        """
+        Index of the components connected via direct relationships. It is built
+        on first access.
+        """
+        if self._component_index is None:
+            self._component_index = CompactComponentIndex(self)
+        return self._component_index
+
+    @property
+    def level_index(self) -> LevelIndex:
+        """
+        Precomputed levels of all nodes with respect to the root of their direct
+        parent hierarchy. It is built on first access.
+        """
+        if self._level_index is None:
+            snapshot = self.snapshot
+            keep = snapshot.edge_type != self.type_codes.get(RR.ULTIMATE, -1)
+            self._level_index = LevelIndex.from_arrays(
+                len(snapshot), self._id, snapshot.edge_start[keep], snapshot.edge_end[keep]
+            )
+        return self._level_index
+
+    @property
+    def hierarchy_index(self) -> HierarchyIndex:
+        """
+        Parent pointers and child lists of the direct parent hierarchy. It is
+        built on first access. The parent pointers agree with get_direct_parent:
+        the direct parents of every node are ordered by their first relationship
+        with the node.
+        """
+        if self._hierarchy_index is None:
+            snapshot = self.snapshot
+            n = len(snapshot)
+            owners = np.repeat(np.arange(n, dtype=np.int64), np.diff(snapshot.out_offsets))
+            _, first, inverse = np.unique(owners * n + snapshot.out_targets, return_index=True, return_inverse=True)
+            direct = np.flatnonzero(snapshot.out_types == self.type_codes.get(RR.DIRECT, -1))
+            direct = direct[np.lexsort((first[inverse[direct]], owners[direct]))]
+            self._hierarchy_index = HierarchyIndex.from_arrays(
+                n, self._id, snapshot.lei, owners[direct], snapshot.out_targets[direct]
+            )
+        return self._hierarchy_index
+
+    @property
+    def anomaly_index(self) -> AnomalyIndex:
+        """
+        Cycles, nodes with several direct parents and ultimate parents outside
+        the direct component of a node, found in one pass over the relationship
+        arrays. It is built on first access.
+        """
+        if self._anomaly_index is None:
+            snapshot = self.snapshot
+            ultimate = snapshot.edge_type == self.type_codes.get(RR.ULTIMATE, -1)
+            direct = snapshot.edge_type[~ultimate] == self.type_codes.get(RR.DIRECT, -1)
+            self._anomaly_index = AnomalyIndex.from_arrays(
+                len(snapshot), self._id, snapshot.edge_start[~ultimate], snapshot.edge_end[~ultimate], direct,
+                snapshot.edge_start[ultimate], snapshot.edge_end[ultimate], self.component_index.component
+            )
+        return self._anomaly_index
+
+    def build_indexes(self) -> 'CompactGraph':
+        """
+        This function builds all lookup indexes of the graph up front, so that
+        the first request does not have to pay for it.
+        """
+        self.component_index
+        self.level_index
+        self.hierarchy_index
+        self.anomaly_index
+        return self
+
+    def direct_component(self, lei: str) -> list:
+        """
+        This function returns all nodes connected with the given LEI via direct
+        relationships, regardless of the edge direction.
+        """
+        return self.component_index.nodes(lei)
+
+    def induced(self, nodes: list, exclude: set = None) -> Graph:
+        """
+        This function builds a Graph from the given nodes and all relationships
+        between them whose type is not in `exclude`. Edges and their keys are the
+        same as in a Graph loaded from the same relationships.
+        """
+        excluded = self._codes(exclude)
+        nodes = list(dict.fromkeys(nodes))
+        ids = {lei: self._id(lei) for lei in nodes}
+        members = {i for i in ids.values() if i is not None}
+
+        def mk_edges(lei: str, i: int) -> Iterator[tuple]:
+            targets, types = self.snapshot.out_edges(i)
+            grouped = {}
+            for target, code in zip(targets.tolist(), types.tolist()):
+                grouped.setdefault(target, []).append(code)
+            for target, codes in grouped.items():
+                if target not in members:
+                    continue
+                for key, code in enumerate(codes):
+                    if code not in excluded:
+                        yield lei, self.snapshot.lei(target), key, {'type': self.snapshot.types[code]}
+
+        sub = Graph([])
+        if self.lookup_table is not None:
+            sub.lookup_table = self.lookup_table
+        sub.g.add_nodes_from(nodes)
+        for lei in nodes:
+            if ids[lei] is None:
+                continue
+            for start, end, key, data in mk_edges(lei, ids[lei]):
+                sub.g.add_edge(start, end, key=key, **data)
+                sub.adjacency.add(start, end, data['type'])
+        return sub
+
+    def sub(self, lei: str) -> Graph:
+        """
+        This function subsets the graph based on the nodes connected with the
+        given LEI node.
+        """
+        return self.induced(self.connected_nodes(lei))
+
+    def set_levels(self, parent: str = None) -> 'CompactGraph':
+        """
+        This function computes the levels of all nodes with respect to the given
+        root node, following direct and branch relationships towards the root.
+        Nodes that do not reach the root get no_parent. The levels are kept as an
+        array of LEI ids, -1 marks no_parent.
+        """
+        root = self._id(parent) if parent else None
+        if root is None:
+            raise ValueError('{} is not part of the graph'.format(parent))
+        excluded = list(self._codes({RR.ULTIMATE}))
+        levels = np.full(len(self.snapshot), -1, dtype=np.int32)
+        levels[root] = 0
+        frontier = [root]
+        while frontier:
+            reached = []
+            for node in frontier:
+                sources, types = self.snapshot.in_edges(node)
+                for source in sources[~np.isin(types, excluded)].tolist():
+                    if levels[source] == -1:
+                        levels[source] = levels[node] + 1
+                        reached.append(source)
+            frontier = reached
+        self.levels = levels
+        return self
+
+    def to_array(self) -> dict:
+        """
+        Convenience function for preparing the graph data to json dump.
+        """
+        g = self.induced(self.nodes)
+        if self.levels is not None:
+            for lei in g.nodes:
+                level = int(self.levels[self._id(lei)])
+                g.nodes[lei].update({'level': level if level != -1 else 1, 'no_parent': level == -1})
+        return g.to_array()
+
+    def to_json(self) -> str:
+        return dumps(self.to_array()).decode('utf-8')
+
+    def _local_edges(self, affected: np.ndarray) -> tuple:
+        """
+        Helper function that returns the relationships of the given sorted LEI
+        ids except the ultimate parent ones, with the positions of their nodes in
+        `affected` and their type codes, in file order.
+        """
+        snapshot = self.snapshot
+        keep = (snapshot.edge_type != self.type_codes.get(RR.ULTIMATE, -1)) & np.isin(snapshot.edge_start, affected)
+        starts = np.searchsorted(affected, snapshot.edge_start[keep]).astype(np.int32)
+        ends = np.searchsorted(affected, snapshot.edge_end[keep]).astype(np.int32)
+        return starts, ends, snapshot.edge_type[keep]
+
+    def _updated_levels(self, graph: 'CompactGraph', remap: np.ndarray, affected: np.ndarray) -> LevelIndex:
+        """
+        Helper function that moves the levels of this graph to the LEI ids of
+        the new graph and computes them again for the affected nodes only.
+        """
+        old, n = self.level_index, len(graph.snapshot)
+        depth = np.zeros(n, dtype=np.int32)
+        root = np.arange(n, dtype=np.int32)
+        ambiguous = np.zeros(n, dtype=bool)
+        depth[remap] = old.depth
+        root[remap] = np.where(old.root >= 0, remap[old.root], -1)
+        ambiguous[remap] = old.ambiguous
+
+        starts, ends, _ = graph._local_edges(affected)
+        patch = LevelIndex.from_arrays(len(affected), None, starts, ends)
+        depth[affected] = patch.depth
+        root[affected] = np.where(patch.root >= 0, affected[patch.root], -1)
+        ambiguous[affected] = patch.ambiguous
+        return LevelIndex(graph._id, depth, root, ambiguous)
+
+    def _updated_anomalies(self, graph: 'CompactGraph', remap: np.ndarray, affected: np.ndarray) -> AnomalyIndex:
+        """
+        Helper function that moves the anomaly flags of this graph to the LEI
+        ids of the new graph and finds the cycles and multiple parents of the
+        affected nodes again. Orphan ultimate parents depend on the components of
+        both ends of an ultimate relationship, so they are checked again for all
+        of them, in one pass over the arrays.
+        """
+        snapshot, component = graph.snapshot, graph.component_index.component
+        flags = np.zeros(len(snapshot), dtype=np.uint8)
+        flags[remap] = self.anomaly_index.flags
+
+        starts, ends, types = graph._local_edges(affected)
+        none = np.zeros(0, dtype=np.int32)
+        flags[affected] = find_anomalies(len(affected), starts, ends, types == graph.type_codes.get(RR.DIRECT, -1),
+                                         none, none, component[affected])
+
+        ultimate = snapshot.edge_type == graph.type_codes.get(RR.ULTIMATE, -1)
+        flags &= np.uint8(~ORPHAN_ULTIMATE_PARENT & 0xff)
+        flags[orphans(snapshot.edge_start[ultimate], snapshot.edge_end[ultimate], component)] |= ORPHAN_ULTIMATE_PARENT
+        return AnomalyIndex(graph._id, flags)
+
+    def apply_delta(self, delta: 'Delta') -> 'CompactGraph':
+        """
+        This function returns a new graph with the changes of a delta applied,
+        while this graph stays untouched and can serve requests in the meantime.
+        The arrays of the snapshot are merged in bulk into a new snapshot. If this
+        graph was opened from a snapshot file, the new snapshot is written to the
+        file of delta_path next to it and memory-mapped, so that worker processes
+        forked afterwards share its pages again instead of each one holding a
+        private copy. This costs one write of the whole snapshot per delta.
+
+        The component, level and anomaly indexes are computed again for the
+        components of the changed LEIs only, all other nodes keep their entries,
+        which are just moved to the LEI ids of the new snapshot. The hierarchy
+        index is built from the arrays in bulk, as the one of Graph.
+        """
+        snapshot = self.snapshot.updated(delta.added, delta.removed, delta.names)
+        if self.snapshot.path is not None:
+            path = delta_path(self.snapshot.path)
+            snapshot.write(path)
+            snapshot = Snapshot.open(path)
+        graph = CompactGraph(snapshot)
+        if self.lookup_table is not None:
+            graph.lookup_table = self.lookup_table.updated(delta.names)
+
+        touched = [lei for lei in delta.nodes() if lei in self]
+        remap = np.searchsorted(snapshot.leis, self.snapshot.leis)
+        affected = self.component_index.affected(np.array([self._id(lei) for lei in touched], dtype=np.int64))
+        ids = [snapshot.id_of(lei) for lei in delta.nodes()]
+        affected = np.union1d(remap[affected], [i for i in ids if i is not None]).astype(np.int64)
+
+        graph._component_index = self.component_index.updated(graph, remap, affected)
+        graph._level_index = self._updated_levels(graph, remap, affected)
+        graph._anomaly_index = self._updated_anomalies(graph, remap, affected)
+        return graph.build_indexes()
+
+    @staticmethod
+    def from_snapshot(snapshot: Snapshot) -> 'CompactGraph':
+        return CompactGraph(snapshot)
+
+    @staticmethod
+    def from_rr(rr: Iterator[RR]) -> 'CompactGraph':
+        """
+        Builds the graph in memory from relationships, without a snapshot file.
+        """
+        return CompactGraph(Snapshot.from_records(((r.start, r.end, r.rel_type) for r in rr), []))
+
+    @staticmethod
+    def from_csv(f: str, limit: int = None, status: str = None) -> 'CompactGraph':
+        rr = (rr for chunk in iter_rr_chunks(f, limit, status) for rr in chunk)
+        return CompactGraph(Snapshot.from_records(rr, []))
@@ -0,0 +1,90 @@
+from os import path
+import pytest
+from compact import CompactGraph
+from graph import RR
+from graph_builder import DirectNodeGraphWithParentNetworkBuilder
+from conftest import mk_compact, mk_graph, mk_rr
+
+
+@pytest.fixture
+def rr_test_csv(request):
+    return path.join(request.config.rootdir, 'src/test_data', 'rr-test.csv')
+
+
+@pytest.fixture
+def builder():
+    return DirectNodeGraphWithParentNetworkBuilder()
+
+
+def test_compact_graph_parents_and_children():
+    g = mk_compact([
+        ('ROI', 'UP', RR.ULTIMATE),
+        ('ROI', 'P1', RR.DIRECT),
+        ('C1', 'ROI', RR.DIRECT),
+        ('C2', 'ROI', RR.DIRECT),
+        ('B1', 'ROI', RR.BRANCH),
+    ])
+
+    assert g.get_direct_parent('ROI') == 'P1'
+    assert g.get_ultimate_parent('ROI') == 'UP'
+    assert g.get_direct_parent('P1') is None
+    assert g.get_direct_parent('UNKNOWN') is None
+    assert g.get_direct_children('ROI') == ['C1', 'C2']
+    assert g.get_ultimate_children('UP') == ['ROI']
+    assert g.get_branches('ROI') == ['B1']
+    assert sorted(g.direct_component('C1')) == ['B1', 'C1', 'C2', 'P1', 'ROI']
+    assert g.direct_component('UNKNOWN') == ['UNKNOWN']
+    assert 'ROI' in g and 'UNKNOWN' not in g
+    assert len(g) == 6
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_compact_graph_matches_graph(builder, seed):
+    rr = mk_rr(seed)
+    g = mk_graph(rr)
+    compact = mk_compact(rr)
+
+    assert sorted(compact.nodes) == sorted(g.nodes)
+    for node in list(g.nodes) + ['UNKNOWN']:
+        assert compact.get_direct_parent(node) == g.get_direct_parent(node)
+        assert compact.get_ultimate_parent(node) == g.get_ultimate_parent(node)
+        assert sorted(compact.sub(node).edges(keys=True, data='type')) == sorted(g.sub(node).edges(keys=True, data='type'))
+
+        expected, expected_parent = builder.build(g, node)
+        actual, actual_parent = builder.build(compact, node)
+        assert actual_parent == expected_parent
+        assert sorted(actual.nodes) == sorted(expected.nodes)
+        assert sorted(actual.edges(keys=True, data='type')) == sorted(expected.edges(keys=True, data='type'))
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_compact_graph_levels_and_components_match_graph(seed):
+    rr = mk_rr(seed)
+    g = mk_graph(rr)
+    compact = mk_compact(rr)
+
+    for node in g.nodes:
+        assert sorted(compact.direct_component(node)) == sorted(g.direct_component(node))
+        assert compact.component_index.size(node) == g.component_index.size(node)
+        component_id = compact.component_index.component_of(node)
+        assert sorted(compact.component_index.members_of(component_id)) == sorted(g.direct_component(node))
+    assert len(compact.component_index) == len(g.component_index)
+
+    root = rr[0][1]
+    expected = g.deepcopy().set_levels(root).to_array()
+    actual = compact.set_levels(root).to_array()
+    assert sorted(map(sorted, (n.items() for n in actual['nodes']))) == \
+        sorted(map(sorted, (n.items() for n in expected['nodes'])))
+    assert sorted(map(sorted, (e.items() for e in actual['edges']))) == \
+        sorted(map(sorted, (e.items() for e in expected['edges'])))
+
+
+def test_compact_graph_from_csv(rr_test_csv):
+    g = CompactGraph.from_csv(rr_test_csv)
+
+    assert sorted(g.nodes) == ['DIRECT_PARENT_LEI', 'LEI_1', 'ULTIMATE_PARENT_LEI']
+    assert g.get_direct_parent('LEI_1') == 'DIRECT_PARENT_LEI'
+    assert g.get_ultimate_parent('LEI_1') == 'ULTIMATE_PARENT_LEI'
+
+    with pytest.raises(ValueError):
+        g.set_levels('LEI_NOT_FOUND')
@@ -0,0 +1,115 @@
+from typing import Iterable, Tuple
+
+
+class ComponentIndex:
+    """
+    Index of the weakly connected components of a graph. Every node is mapped
+    to a component id and every component id to its member nodes, so looking up
+    the cluster of a node does not require a traversal of the graph.
+    """
+
+    def __init__(self, nodes: Iterable[str], edges: Iterable[Tuple[str, str]]):
+        self.component = {}
+        self.members = {}
+        self.__build(nodes, edges)
+
+    def __len__(self):
+        return len(self.members)
+
+    def __contains__(self, node: str) -> bool:
+        return node in self.component
+
+    def __build(self, nodes: Iterable[str], edges: Iterable[Tuple[str, str]]):
+        """
+        This helper function runs a union-find pass over the edges and assigns
+        component ids in order of the first appearance of their nodes.
+        """
+        parent = {node: node for node in nodes}
+        size = dict.fromkeys(parent, 1)
+
+        def find(node: str) -> str:
+            while parent[node] != node:
+                parent[node] = parent[parent[node]]
+                node = parent[node]
+            return node
+
+        for u, v in edges:
+            root_u, root_v = find(u), find(v)
+            if root_u == root_v:
+                continue
+            if size[root_u] < size[root_v]:
+                root_u, root_v = root_v, root_u
+            parent[root_v] = root_u
+            size[root_u] += size[root_v]
+
+        ids = {}
+        for node in parent:
+            component_id = ids.setdefault(find(node), len(ids))
+            self.component[node] = component_id
+            self.members.setdefault(component_id, []).append(node)
+        self._next_id = len(ids)
+
+    def affected(self, nodes: Iterable[str]) -> list:
+        """
+        Returns the given nodes together with all nodes of their components, i.e.
+        all nodes whose component can change if edges of the given nodes change.
+        """
+        affected = dict.fromkeys(nodes)
+        for component_id in dict.fromkeys(self.component[node] for node in nodes if node in self.component):
+            affected.update(dict.fromkeys(self.members[component_id]))
+        return list(affected)
+
+    def updated(self, touched: Iterable[str], nodes: Iterable[str], edges: Iterable[Tuple[str, str]]) -> 'ComponentIndex':
+        """
+        Returns a new index in which the components of the touched nodes are
+        replaced by the components of the given nodes and edges, which have to be
+        the affected nodes (see affected) after the change. All other components
+        keep their ids and share their member lists with this index, which is not
+        modified. The new components get fresh ids.
+        """
+        replaced = {self.component[node] for node in touched if node in self.component}
+        patch = ComponentIndex(nodes, edges)
+        index = ComponentIndex((), ())
+        index.component = dict(self.component)
+        index.members = {i: members for i, members in self.members.items() if i not in replaced}
+        for component_id in replaced:
+            for node in self.members[component_id]:
+                del index.component[node]
+        for component_id, members in patch.members.items():
+            index.members[self._next_id + component_id] = members
+            for node in members:
+                index.component[node] = self._next_id + component_id
+        index._next_id = self._next_id + len(patch.members)
+        return index
+
+    def component_ids(self) -> Iterable[int]:
+        return self.members.keys()
+
+    def component_of(self, node: str) -> int:
+        """
+        Returns the component id of a node, or None if the node is not indexed.
+        """
+        return self.component.get(node)
+
+    def nodes(self, node: str) -> list:
+        """
+        Returns all nodes in the component of the given node. A node that is not
+        indexed is only connected to itself.
+        """
+        component_id = self.component.get(node)
+        if component_id is None:
+            return [node]
+        return self.members[component_id]
+
+    def members_of(self, component_id: int) -> list:
+        """
+        Returns all nodes of the component with the given id.
+        """
+        return self.members[component_id]
+
+    def size(self, node: str) -> int:
+        """
+        Returns the number of nodes in the component of the given node.
+        """
+        component_id = self.component.get(node)
+        return 1 if component_id is None else len(self.members[component_id])
@@ -0,0 +1,24 @@
+from components import ComponentIndex
+
+
+def test_component_index():
+    index = ComponentIndex(
+        ['A', 'B', 'C', 'D', 'E', 'F'],
+        [('A', 'B'), ('C', 'B'), ('D', 'E'), ('E', 'D')],
+    )
+
+    assert len(index) == 3
+    assert index.component_of('A') == index.component_of('B') == index.component_of('C')
+    assert index.component_of('D') == index.component_of('E')
+    assert index.component_of('A') != index.component_of('D')
+    assert index.component_of('UNKNOWN') is None
+
+    assert index.nodes('C') == ['A', 'B', 'C']
+    assert index.nodes('E') == ['D', 'E']
+    assert index.nodes('F') == ['F']
+    assert index.nodes('UNKNOWN') == ['UNKNOWN']
+
+    assert index.size('A') == 3
+    assert index.size('F') == 1
+    assert index.size('UNKNOWN') == 1
+    assert index.members_of(index.component_of('D')) == ['D', 'E']
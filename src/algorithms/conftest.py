@@ -0,0 +1,60 @@
+import random
+from compact import CompactGraph
+from delta import Delta
+from graph import RR, Graph
+from names import NameStore
+from snapshot import Snapshot
+
+# relationship types of random graphs, direct ones twice as often as the others
+TYPES = [RR.DIRECT, RR.DIRECT, RR.ULTIMATE, RR.BRANCH]
+
+
+def mk_rr(seed: int, count: int = 35) -> list:
+    """
+    Random (child, parent, type) relationships between 30 nodes.
+    """
+    r = random.Random(seed)
+    return [('N%d' % r.randrange(30), 'N%d' % r.randrange(30), r.choice(TYPES)) for _ in range(count)]
+
+
+def mk_case(seed: int):
+    """
+    Random relationships and names, a delta for them, and the relationships
+    and names that applying the delta has to result in.
+    """
+    r = random.Random(seed)
+    leis = ['N%d' % i for i in range(25)]
+    rr = [(r.choice(leis), r.choice(leis), r.choice(TYPES)) for _ in range(35)]
+    names = [(lei, 'name of %s' % lei) for lei in leis if r.random() < 0.7]
+    removed = [x for x in rr if r.random() < 0.2] + [('N1', 'UNKNOWN', RR.DIRECT)]
+    added = [(r.choice(leis + ['NEW']), r.choice(leis), r.choice(TYPES)) for _ in range(8)]
+    renamed = [(lei, 'new name of %s' % lei) for lei in r.sample(leis, 3)]
+    retired = r.sample(leis, 2)
+    delta = Delta.from_records(added, removed, renamed, retired)
+
+    expected_rr = [x for x in rr if delta.relationships.get(x, True)]
+    for x in delta.added:
+        if x not in expected_rr:
+            expected_rr.append(x)
+    expected_names = dict(names)
+    for lei, name in delta.names.items():
+        expected_names[lei] = name
+    expected_names = [(lei, name) for lei, name in expected_names.items() if name is not None]
+    return rr, names, delta, expected_rr, expected_names
+
+
+def mk_graph(rr: list, names: list = ()) -> Graph:
+    g = Graph(RR(*x) for x in rr)
+    g.lookup_table = NameStore.from_records(names)
+    return g.build_indexes()
+
+
+def mk_compact(rr: list, names: list = ()) -> CompactGraph:
+    g = CompactGraph.from_snapshot(Snapshot.from_records(rr, names))
+    g.lookup_table = NameStore.from_records(names)
+    return g.build_indexes()
+
+
+def normalized(payload: dict) -> tuple:
+    return sorted(map(sorted, (n.items() for n in payload['nodes']))), \
+        sorted(map(sorted, (e.items() for e in payload['edges'])))
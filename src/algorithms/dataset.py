@@ -0,0 +1,68 @@
+import os
+from typing import Callable, Union
+
+from algorithms.compact import CompactGraph
+from algorithms.delta import Delta
+from algorithms.graph import Graph
+from algorithms.names import NameStore
+from algorithms.snapshot import Snapshot
+
+
+class Dataset:
+    """
+    One version of the GLEIF data: the relationship graph with its indexes and
+    its names, attached to the graph as lookup table. A dataset is never changed
+    after it was built, updates create a new dataset with a higher version, so
+    a request that holds a dataset always sees one consistent state.
+    """
+
+    def __init__(self, network: Union[Graph, CompactGraph], version: int = 1):
+        self.network = network
+        self.version = version
+
+    def apply_delta(self, delta: Delta) -> 'Dataset':
+        """
+        This function returns the next version of the dataset with the changes of
+        a delta applied. This dataset stays usable in the meantime.
+        """
+        return Dataset(self.network.apply_delta(delta), self.version + 1)
+
+    def migrate_key(self, new: 'Dataset', delta: Delta) -> Callable:
+        """
+        This function returns a function that maps a structure cache key
+        (component id, root, version) of this dataset to the key of the same
+        structure in the new dataset, or None if the structure is changed by the
+        delta. A structure is changed if its component or the component of its
+        root contains a LEI with changed relationships or name. Further elements
+        of a key, e.g. the wire format, are kept.
+        """
+        old_index, new_index = self.network.component_index, new.network.component_index
+        changed = delta.leis()
+        replaced = {old_index.component_of(lei) for lei in changed} - {None}
+
+        def migrate(key: tuple) -> tuple:
+            component_id, root, version = key[:3]
+            if version != self.version or component_id in replaced or root in changed:
+                return None
+            if old_index.component_of(root) in replaced:
+                return None
+            if component_id is not None:
+                component_id = new_index.component_of(old_index.members_of(component_id)[0])
+            return (component_id, root, new.version) + key[3:]
+
+        return migrate
+
+    @staticmethod
+    def load(rr: str, lei: str, snapshot: str = None, version: int = 1) -> 'Dataset':
+        """
+        Loads the dataset from a snapshot file if it exists, otherwise from the
+        csv files. All indexes are built up front.
+        """
+        if snapshot is not None and os.path.exists(snapshot):
+            snapshot = Snapshot.open(snapshot)
+            network = CompactGraph.from_snapshot(snapshot).build_indexes()
+            network.lookup_table = NameStore.from_snapshot(snapshot)
+        else:
+            network = Graph.from_csv(f=rr).build_indexes()
+            network.lookup_table = NameStore.from_csv(lei)
+        return Dataset(network, version)
@@ -0,0 +1,55 @@
+import pytest
+from dataset import Dataset
+from delta import Delta
+from conftest import mk_case, mk_compact, mk_graph
+from graph_builder import DirectNodeGraphWithParentNetworkBuilder
+
+
+@pytest.mark.parametrize('engine', [mk_graph, mk_compact])
+@pytest.mark.parametrize('seed', range(20))
+def test_migrate_key_keeps_unchanged_structures(engine, seed):
+    rr, names, delta, _, _ = mk_case(seed)
+    builder = DirectNodeGraphWithParentNetworkBuilder()
+    dataset = Dataset(engine(rr, names))
+    updated = dataset.apply_delta(delta)
+    migrate = dataset.migrate_key(updated, delta)
+
+    assert updated.version == 2
+    for node in list(dataset.network.nodes) + ['UNKNOWN']:
+        key = builder.structure_key(dataset.network, node) + (dataset.version,)
+        new_key = migrate(key)
+        if new_key is not None:
+            assert new_key == builder.structure_key(updated.network, node) + (updated.version,)
+            assert builder.structure(updated.network, node) == builder.structure(dataset.network, node)
+        assert migrate(key[:2] + (0,)) is None
+        assert migrate(key + ('compact', 'gzip')) == (new_key + ('compact', 'gzip') if new_key else None)
+
+
+def test_migrate_key_drops_changed_structures():
+    dataset = Dataset(mk_graph([('B', 'A', 'IS_DIRECTLY_CONSOLIDATED_BY'), ('D', 'C', 'IS_DIRECTLY_CONSOLIDATED_BY')],
+                               [('A', 'a'), ('C', 'c')]))
+    delta = Delta.from_records(names=[('A', 'new a')])
+    updated = dataset.apply_delta(delta)
+    migrate = dataset.migrate_key(updated, delta)
+    builder = DirectNodeGraphWithParentNetworkBuilder()
+
+    assert migrate(builder.structure_key(dataset.network, 'B') + (1,)) is None
+    assert migrate(builder.structure_key(dataset.network, 'D') + (1,)) == \
+        builder.structure_key(updated.network, 'D') + (2,)
+    assert updated.network.get_node_label('A') == 'new a'
+    assert dataset.network.get_node_label('A') == 'a'
+
+
+def test_dataset_load(tmp_path, request):
+    rr = request.config.rootdir.join('src/test_data/rr-test.csv')
+    lei = request.config.rootdir.join('src/test_data/lei-test.csv')
+
+    dataset = Dataset.load(str(rr), str(lei), str(tmp_path / 'missing.snapshot'))
+    assert type(dataset.network).__name__ == 'Graph'
+    assert dataset.network.get_node_label('LEI_1') == 'company1'
+
+    dataset.network.compile_snapshot(str(rr), str(lei), str(tmp_path / 'gleif.snapshot'))
+    dataset = Dataset.load(str(rr), str(lei), str(tmp_path / 'gleif.snapshot'), version=4)
+    assert type(dataset.network).__name__ == 'CompactGraph'
+    assert dataset.version == 4
+    assert dataset.network.lookup_table.get_label('LEI_1') == 'company1'
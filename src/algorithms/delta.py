@@ -0,0 +1,90 @@
+from typing import Iterable, Tuple
+
+import pandas as pd
+
+from algorithms.graph import RR_COLUMNS, RR_STATUS_COLUMN
+
+REGISTRATION_STATUS_COLUMN = 'Registration.RegistrationStatus'
+LEI_COLUMNS = ('LEI', 'Entity.LegalName')
+
+# registrations with these statuses are no longer valid, so their relationships
+# and names are removed
+RETIRED_STATUSES = ('RETIRED', 'ANNULLED', 'DUPLICATE')
+
+
+class Delta:
+    """
+    Changes of a GLEIF delta file pair. `relationships` maps (start, end, type)
+    to whether the relationship is active afterwards, `names` maps LEIs to their
+    new legal name, or to None if their registration was retired. Relationships
+    and names that appear several times take the state of their last row.
+    """
+
+    def __init__(self, relationships: dict = None, names: dict = None):
+        self.relationships = relationships or {}
+        self.names = names or {}
+
+    def __len__(self):
+        return len(self.relationships) + len(self.names)
+
+    @property
+    def added(self) -> list:
+        return [rr for rr, active in self.relationships.items() if active]
+
+    @property
+    def removed(self) -> list:
+        return [rr for rr, active in self.relationships.items() if not active]
+
+    def nodes(self) -> set:
+        """
+        Returns all LEIs whose relationships are changed.
+        """
+        return {lei for start, end, _ in self.relationships for lei in (start, end)}
+
+    def leis(self) -> set:
+        """
+        Returns all LEIs whose relationships or names are changed.
+        """
+        return self.nodes() | set(self.names)
+
+    @staticmethod
+    def from_records(added: Iterable[Tuple[str, str, str]] = (), removed: Iterable[Tuple[str, str, str]] = (),
+                     names: Iterable[Tuple[str, str]] = (), retired: Iterable[str] = ()) -> 'Delta':
+        relationships = {rr: False for rr in removed}
+        relationships.update({rr: True for rr in added})
+        names = dict(names)
+        names.update({lei: None for lei in retired})
+        return Delta(relationships, names)
+
+    @staticmethod
+    def from_csv(rr: str = None, lei: str = None, chunksize: int = 100000) -> 'Delta':
+        """
+        Reads a RR and/or a LEI delta file, which have the columns of the full
+        files. A relationship is removed if its status is not ACTIVE or its
+        registration was retired, otherwise it is added (or kept). A name is
+        removed if the registration of the LEI was retired. The status columns
+        are optional.
+        """
+        delta = Delta()
+        status_columns = (RR_STATUS_COLUMN, REGISTRATION_STATUS_COLUMN)
+        if rr is not None:
+            reader = pd.read_csv(rr, usecols=lambda c: c in RR_COLUMNS + status_columns, dtype=str,
+                                 keep_default_na=False, index_col=False, chunksize=chunksize)
+            for chunk in reader:
+                active = pd.Series(True, index=chunk.index)
+                if RR_STATUS_COLUMN in chunk:
+                    active &= chunk[RR_STATUS_COLUMN] == 'ACTIVE'
+                if REGISTRATION_STATUS_COLUMN in chunk:
+                    active &= ~chunk[REGISTRATION_STATUS_COLUMN].isin(RETIRED_STATUSES)
+                delta.relationships.update(zip(zip(*(chunk[column] for column in RR_COLUMNS)), active.tolist()))
+        if lei is not None:
+            reader = pd.read_csv(lei, usecols=lambda c: c in LEI_COLUMNS + (REGISTRATION_STATUS_COLUMN,), dtype=str,
+                                 keep_default_na=False, index_col=False, chunksize=chunksize)
+            for chunk in reader:
+                retired = chunk[REGISTRATION_STATUS_COLUMN].isin(RETIRED_STATUSES).tolist() \
+                    if REGISTRATION_STATUS_COLUMN in chunk else [False] * len(chunk)
+                delta.names.update(
+                    (entity, name if name and not is_retired else None)
+                    for entity, name, is_retired in zip(chunk['LEI'], chunk['Entity.LegalName'], retired)
+                )
+        return delta
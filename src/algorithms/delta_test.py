@@ -0,0 +1,125 @@
+import os
+
+import numpy as np
+import pytest
+from compact import CompactGraph
+from delta import Delta
+from graph import RR
+from graph_builder import DirectNodeGraphWithParentNetworkBuilder
+from snapshot import Snapshot
+from conftest import TYPES, mk_case, mk_compact, mk_graph, normalized
+
+
+def test_delta_from_csv(tmp_path):
+    rr = tmp_path / 'rr.csv'
+    rr.write_text(
+        'Relationship.StartNode.NodeID,Relationship.EndNode.NodeID,Relationship.RelationshipType,'
+        'Relationship.RelationshipStatus,Registration.RegistrationStatus\n'
+        'A,B,IS_DIRECTLY_CONSOLIDATED_BY,ACTIVE,PUBLISHED\n'
+        'C,B,IS_DIRECTLY_CONSOLIDATED_BY,INACTIVE,PUBLISHED\n'
+        'D,B,IS_DIRECTLY_CONSOLIDATED_BY,ACTIVE,RETIRED\n'
+        'E,B,IS_DIRECTLY_CONSOLIDATED_BY,ACTIVE,PUBLISHED\n'
+        'E,B,IS_DIRECTLY_CONSOLIDATED_BY,INACTIVE,PUBLISHED\n'
+    )
+    lei = tmp_path / 'lei.csv'
+    lei.write_text('LEI,Entity.LegalName,Registration.RegistrationStatus\nA,a,ISSUED\nB,b,ANNULLED\nC,,ISSUED\n')
+
+    delta = Delta.from_csv(str(rr), str(lei))
+
+    assert delta.added == [('A', 'B', RR.DIRECT)]
+    assert delta.removed == [('C', 'B', RR.DIRECT), ('D', 'B', RR.DIRECT), ('E', 'B', RR.DIRECT)]
+    assert delta.names == {'A': 'a', 'B': None, 'C': None}
+    assert delta.nodes() == {'A', 'B', 'C', 'D', 'E'}
+    assert len(delta) == 7
+
+
+@pytest.mark.parametrize('seed', range(30))
+def test_graph_apply_delta(seed):
+    rr, names, delta, expected_rr, expected_names = mk_case(seed)
+    g = mk_graph(rr, names)
+    before = g.to_array()
+    expected = mk_graph(expected_rr, expected_names)
+
+    updated = g.apply_delta(delta)
+
+    # the original graph is not changed
+    assert g.to_array() == before
+    assert sorted(g.g.edges(data='type')) == sorted(mk_graph(rr, names).g.edges(data='type'))
+
+    assert sorted(updated.nodes) == sorted(expected.nodes)
+    assert sorted(updated.g.edges(data='type')) == sorted(expected.g.edges(data='type'))
+    for node in expected.nodes:
+        for rel_type in set(TYPES):
+            assert sorted(updated.adjacency.parents(node, rel_type)) == sorted(expected.adjacency.parents(node, rel_type))
+            assert sorted(updated.adjacency.children(node, rel_type)) == \
+                sorted(expected.adjacency.children(node, rel_type))
+        component = expected.direct_component(node)
+        assert sorted(updated.direct_component(node)) == sorted(component)
+        assert updated.level_index.distances(node, component) == expected.level_index.distances(node, component)
+    assert len(updated.component_index) == len(expected.component_index)
+
+    builder = DirectNodeGraphWithParentNetworkBuilder()
+    for node in list(expected.nodes) + ['UNKNOWN']:
+        assert normalized(builder.structure(updated, node)) == normalized(builder.structure(expected, node))
+
+
+@pytest.mark.parametrize('seed', range(30))
+def test_compact_graph_apply_delta(seed):
+    rr, names, delta, expected_rr, expected_names = mk_case(seed)
+    g = mk_compact(rr, names)
+    before = g.to_array()
+    expected = mk_compact(expected_rr, expected_names)
+
+    updated = g.apply_delta(delta)
+
+    assert g.to_array() == before
+    assert list(updated.snapshot.iter_rr()) == list(expected.snapshot.iter_rr())
+    assert sorted(updated.snapshot.iter_names()) == sorted(expected.snapshot.iter_names())
+    builder = DirectNodeGraphWithParentNetworkBuilder()
+    for node in expected.nodes:
+        assert builder.structure(updated, node) == builder.structure(expected, node)
+
+
+@pytest.mark.parametrize('seed', range(30))
+def test_compact_graph_apply_delta_updates_indexes_as_built(seed):
+    rr, names, delta, _, _ = mk_case(seed)
+
+    updated = mk_compact(rr, names).apply_delta(delta)
+    expected = CompactGraph(updated.snapshot).build_indexes()
+
+    for name in ('component', 'members', 'offsets'):
+        assert np.array_equal(getattr(updated.component_index, name), getattr(expected.component_index, name))
+    for name in ('depth', 'root', 'ambiguous'):
+        assert np.array_equal(getattr(updated.level_index, name), getattr(expected.level_index, name))
+    assert np.array_equal(updated.anomaly_index.flags, expected.anomaly_index.flags)
+    assert np.array_equal(updated.hierarchy_index.parent, expected.hierarchy_index.parent)
+
+
+def test_compact_graph_apply_delta_maps_snapshot_file(tmp_path):
+    path = str(tmp_path / 'gleif.snapshot')
+    Snapshot.from_records([('B', 'A', RR.DIRECT), ('C', 'B', RR.DIRECT)], []).write(path)
+    g = CompactGraph.from_snapshot(Snapshot.open(path)).build_indexes()
+
+    updated = g.apply_delta(Delta.from_records(added=[('D', 'A', RR.DIRECT)]))
+    assert updated.snapshot.path == '{}.{}.delta'.format(path, os.getpid())
+    assert updated.snapshot._buffer is not None
+    assert sorted(updated.direct_component('D')) == ['A', 'B', 'C', 'D']
+
+    # the next delta replaces the file, the mapped one stays readable
+    again = updated.apply_delta(Delta.from_records(removed=[('C', 'B', RR.DIRECT)]))
+    assert again.snapshot.path == updated.snapshot.path
+    assert sorted(updated.direct_component('C')) == ['A', 'B', 'C', 'D']
+    assert again.direct_component('C') == ['C']
+    assert list(Snapshot.open(path).iter_rr()) == [('B', 'A', RR.DIRECT), ('C', 'B', RR.DIRECT)]
+
+
+def test_apply_delta_repeatedly():
+    g = mk_graph([('B', 'A', RR.DIRECT), ('C', 'B', RR.DIRECT)], [])
+
+    g = g.apply_delta(Delta.from_records(removed=[('B', 'A', RR.DIRECT)]))
+    assert g.direct_component('A') == ['A']
+    assert g.level_index.distances('B', ['B', 'C']) == {'B': 0, 'C': 1}
+
+    g = g.apply_delta(Delta.from_records(added=[('B', 'D', RR.DIRECT), ('A', 'D', RR.DIRECT)]))
+    assert sorted(g.direct_component('A')) == ['A', 'B', 'C', 'D']
+    assert g.level_index.distances('D', ['A', 'B', 'C', 'D']) == {'A': 1, 'B': 1, 'C': 2, 'D': 0}
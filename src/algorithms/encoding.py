@@ -0,0 +1,135 @@
+import gzip
+import io
+import json
+
+# the fastest json encoder that is installed is used, they all produce the same
+# compact utf-8 output for the plain dicts, lists, strings and numbers of payloads
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import ujson
+except ImportError:
+    ujson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+if orjson is not None:
+    ENCODER = 'orjson'
+elif ujson is not None:
+    ENCODER = 'ujson'
+else:
+    ENCODER = 'json'
+
+# wire formats of structures and their media types
+FORMATS = {
+    'full': 'application/json',
+    'compact': 'application/vnd.gleif.structure.compact+json',
+}
+# content encodings in order of preference
+COMPRESSIONS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def dumps(value) -> bytes:
+    """
+    This function encodes a payload as compact json in utf-8.
+    """
+    if orjson is not None:
+        return orjson.dumps(value)
+    if ujson is not None:
+        return ujson.dumps(value, ensure_ascii=False, escape_forward_slashes=False).encode('utf-8')
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def compact_structure(structure: dict) -> dict:
+    """
+    This function converts a structure into the compact wire format. Nodes are
+    sent once, as a table with one list per column, and edges as
+    [from, to, type] triples of indexes into the node table and into the list
+    of relationship types:
+
+        {"format": "compact", "types": ["IS_DIRECTLY_CONSOLIDATED_BY"],
+         "nodes": {"id": [...], "label": [...], "level": [...], "no_parent": [...]},
+         "edges": [[1, 0, 0], ...]}
+
+    Parts of structures have a truncated column and flag as well. The anomalies
+    of the nodes are sent as they are.
+    """
+    nodes = structure['nodes']
+    ids = [node['id'] for node in nodes]
+    index = {lei: i for i, lei in enumerate(ids)}
+    types = {}
+    edges = [
+        [index[edge['from']], index[edge['to']], types.setdefault(edge['label'], len(types))]
+        for edge in structure['edges']
+    ]
+    compact = {
+        'format': 'compact',
+        'types': list(types),
+        'nodes': {
+            'id': ids,
+            'label': [node['label'] for node in nodes],
+            'level': [node['level'] for node in nodes],
+            'no_parent': [node['no_parent'] for node in nodes],
+        },
+        'edges': edges,
+    }
+    if 'truncated' in structure:
+        compact['nodes']['truncated'] = [node['truncated'] for node in nodes]
+        compact['truncated'] = structure['truncated']
+    if 'anomalies' in structure:
+        compact['anomalies'] = structure['anomalies']
+    return compact
+
+
+def encode_structure(structure: dict, wire_format: str = 'full') -> bytes:
+    """
+    Convenience function that encodes a structure in the given wire format.
+    """
+    if wire_format == 'compact':
+        structure = compact_structure(structure)
+    return dumps(structure)
+
+
+def accepted_compression(accept_encoding: str) -> str:
+    """
+    This function picks the preferred content encoding the client accepts
+    according to its Accept-Encoding header, or returns None. Encodings the
+    client refuses explicitly with q=0 are not picked, even if it accepts `*`.
+    """
+    accepted, refused = set(), set()
+    for token in (accept_encoding or '').split(','):
+        name, _, params = token.partition(';')
+        name, params = name.strip().lower(), params.strip()
+        try:
+            if params.startswith('q=') and float(params[2:]) <= 0:
+                refused.add(name)
+                continue
+        except ValueError:
+            continue
+        accepted.add(name)
+    for compression in COMPRESSIONS:
+        if compression in refused:
+            continue
+        if compression in accepted or '*' in accepted:
+            return compression
+    return None
+
+
+def compress(data: bytes, compression: str) -> bytes:
+    """
+    This function compresses a payload with the given content encoding, with
+    settings that favour speed over the last few percent of size.
+    """
+    if compression == 'br':
+        return brotli.compress(data, quality=5)
+    if compression == 'gzip':
+        # a fixed mtime keeps the output the same for the same payload, gzip.compress only takes it from Python 3.8 on
+        buffer = io.BytesIO()
+        with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=5, mtime=0) as f:
+            f.write(data)
+        return buffer.getvalue()
+    raise ValueError('unknown content encoding {}'.format(compression))
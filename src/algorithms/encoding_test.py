@@ -0,0 +1,71 @@
+import gzip
+import json
+import pytest
+from encoding import COMPRESSIONS, accepted_compression, compact_structure, compress, dumps, encode_structure
+from graph import RR, Graph
+from graph_builder import DirectNodeGraphWithParentNetworkBuilder
+
+
+@pytest.fixture
+def structure():
+    g = Graph([
+        RR('B', 'A', RR.DIRECT),
+        RR('C', 'B', RR.DIRECT),
+        RR('D', 'B', RR.DIRECT),
+        RR('C', 'A', RR.ULTIMATE),
+        RR('E', 'C', RR.BRANCH),
+    ]).build_indexes()
+    return DirectNodeGraphWithParentNetworkBuilder().structure(g, 'C')
+
+
+def expand(compact: dict) -> dict:
+    nodes = compact['nodes']
+    return {
+        'nodes': [
+            {'id': lei, 'title': lei, 'label': label, 'level': level, 'no_parent': no_parent}
+            for lei, label, level, no_parent in zip(nodes['id'], nodes['label'], nodes['level'], nodes['no_parent'])
+        ],
+        'edges': [
+            {'from': nodes['id'][start], 'to': nodes['id'][end], 'label': compact['types'][rel_type]}
+            for start, end, rel_type in compact['edges']
+        ],
+        'anomalies': compact['anomalies'],
+    }
+
+
+def test_dumps_is_compact_json():
+    value = {'nodes': [{'id': 'A', 'label': 'Société Générale', 'level': None, 'no_parent': False}]}
+    assert json.loads(dumps(value)) == value
+    assert b' ' not in dumps({'a': [1, 2]})
+
+
+def test_compact_structure_round_trip(structure):
+    compact = compact_structure(structure)
+
+    assert expand(compact) == structure
+    assert compact['types'] == [RR.DIRECT, RR.BRANCH]
+    assert len(dumps(compact)) < len(dumps(structure))
+    assert json.loads(encode_structure(structure, 'compact')) == compact
+    assert json.loads(encode_structure(structure)) == structure
+
+
+def test_accepted_compression():
+    assert accepted_compression(None) is None
+    assert accepted_compression('identity') is None
+    assert accepted_compression('gzip, deflate') == 'gzip'
+    assert accepted_compression('gzip;q=0, deflate') is None
+    assert accepted_compression('*') == COMPRESSIONS[0]
+    assert accepted_compression('br, gzip') == COMPRESSIONS[0]
+    assert accepted_compression('gzip;q=0, *') == ('br' if 'br' in COMPRESSIONS else None)
+    assert accepted_compression('br;q=0, *') == 'gzip'
+    assert accepted_compression('*;q=0, gzip') == 'gzip'
+
+
+def test_compress():
+    data = dumps({'nodes': [{'id': 'LEI_{}'.format(i)} for i in range(1000)]})
+    assert gzip.decompress(compress(data, 'gzip')) == data
+    # no timestamp in the header, so the same payload compresses to the same bytes
+    assert compress(data, 'gzip')[4:8] == b'\0\0\0\0'
+    assert len(compress(data, 'gzip')) < len(data) / 4
+    with pytest.raises(ValueError):
+        compress(data, 'deflate')
@@ -0,0 +1,261 @@
+import asyncio
+import itertools
+import multiprocessing
+import sys
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from algorithms.encoding import encode_structure
+from algorithms.graph_builder import DirectNodeGraphWithParentNetworkBuilder as Builder
+from algorithms.timing import Timings, activate, stage
+
+# the graphs of the worker pools by generation. Workers are forked and inherit
+# them, and since Python 3.9 a pool forks workers on demand, also after the
+# graph was replaced, so a graph stays here until its pools are shut down
+_graphs = {}
+_generations = itertools.count()
+
+
+def fork_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Creates a pool of worker processes that are forked from this one, so that
+    they inherit its module globals, e.g. a loaded graph, without pickling.
+    """
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        raise ValueError('worker processes need the fork start method, which this platform does not have')
+    if sys.version_info < (3, 7):
+        # there is no mp_context before Python 3.7, and processes are forked by default
+        return ProcessPoolExecutor(max_workers=workers)
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'))
+
+
+def _encode_structure(g, node: str, timings: Timings, wire_format: str, limits: dict) -> bytes:
+    """
+    Helper function that builds the structure of a node and encodes it as json
+    in the given wire format, so that the payload is encoded once and only
+    bytes are passed around. Limits restrict the part of the structure that
+    is built, see Builder.structure.
+    """
+    structure = Builder().structure(g, node, timings, **(limits or {}))
+    with activate(timings), stage('encode'):
+        return encode_structure(structure, wire_format)
+
+
+def _build_structure(generation: int, node: str, submitted: float, wire_format: str, limits: dict) -> tuple:
+    """
+    Helper function that runs in a worker process and builds the structure of a
+    node from the graph of its pool, inherited from the parent process. Returns
+    the encoded structure and the timings of the build, including the time it
+    was queued for. The monotonic clock is system-wide, so it can be compared
+    across processes.
+    """
+    timings = Timings()
+    timings.add('queue', time.monotonic() - submitted)
+    return _encode_structure(_graphs[generation], node, timings, wire_format, limits), timings
+
+
+def _build_structure_in_thread(g, node: str, timings: Timings, submitted: float, wire_format: str,
+                               limits: dict) -> bytes:
+    """
+    Helper function that builds and encodes the structure of a node in a worker
+    thread and records its timings, including the time it was queued for.
+    """
+    if timings is not None:
+        timings.add('queue', time.monotonic() - submitted)
+    return _encode_structure(g, node, timings, wire_format, limits)
+
+
+class Overloaded(Exception):
+    """
+    Raised when too many structure builds are pending already.
+    """
+
+
+class StructureExecutor:
+    """
+    Runs structure builds off the event loop, so that a slow build does not
+    stall other requests. Structures are returned encoded as json, so they are
+    encoded in the workers as well and can be cached and sent as they are.
+
+    In 'thread' mode builds run in a thread pool of this process. Graph
+    traversals hold the GIL though, so in 'process' mode they run in a pool of
+    worker processes instead. The workers are forked after the graph was loaded
+    and share its memory (and the pages of a memory-mapped snapshot) with the
+    parent process, so nothing is pickled except the LEI and the payload.
+
+    Structures with more than `large_nodes` nodes get a separate pool with
+    `large_workers` workers, so that many big conglomerates at once can not
+    occupy every worker while small queries are waiting. Builds are bounded by
+    `timeout` seconds, and at most `max_pending` builds are accepted at a time,
+    any further ones raise Overloaded.
+
+    Builds can be given the graph they are for, so that a request uses one
+    dataset version from start to end even if the graph is replaced meanwhile.
+    The worker processes only have the current graph, so in process mode builds
+    for a replaced graph run in a thread of this process instead.
+    """
+
+    MODES = ('thread', 'process')
+
+    def __init__(self, g, mode: str = 'thread', workers: int = 4, large_workers: int = 1,
+                 large_nodes: int = 10000, timeout: float = 30.0, max_pending: int = 64):
+        if mode not in self.MODES:
+            raise ValueError('unknown execution mode {}, expected one of {}'.format(mode, self.MODES))
+        self.g = g
+        self.mode = mode
+        self.workers = workers
+        self.large_workers = large_workers
+        self.large_nodes = large_nodes
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.pending = 0
+        self._lock = threading.Lock()
+        self._futures = set()
+        self._generation = self._register(g)
+        self._small = self._pool(workers)
+        self._large = self._pool(large_workers)
+        self._stale = ThreadPoolExecutor(max_workers=1)
+
+    def _register(self, g) -> int:
+        generation = next(_generations)
+        if self.mode == 'process':
+            _graphs[generation] = g
+        return generation
+
+    def _pool(self, workers: int) -> Executor:
+        if self.mode == 'thread':
+            return ThreadPoolExecutor(max_workers=workers)
+        return fork_pool(workers)
+
+    @staticmethod
+    def _retire(pools, generation: int):
+        """
+        Helper function that waits until the given pools finished their builds
+        and then drops the graph their workers were forked with.
+        """
+        for pool in pools:
+            pool.shutdown(wait=True)
+        _graphs.pop(generation, None)
+
+    def _acquire(self):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                raise Overloaded('{} structure builds are pending already'.format(self.pending))
+            self.pending += 1
+
+    def _release(self, future=None):
+        with self._lock:
+            self.pending -= 1
+            self._futures.discard(future)
+
+    def submit(self, node: str, timings: Timings = None, wire_format: str = 'full', limits: dict = None, g=None):
+        """
+        Schedules the structure build of a node in the given graph, by default
+        the current one, and returns its future. The pending slot is released
+        once the build is finished or cancelled while still queued, a running
+        build keeps it even if the caller timed out.
+        In thread mode the build records its timings to the given ones, in
+        process mode the future results in the structure and its timings.
+        """
+        self._acquire()
+        try:
+            with self._lock:
+                current, generation, small, large = self.g, self._generation, self._small, self._large
+            g = current if g is None else g
+            size = Builder().structure_size(g, node)
+            if limits and limits.get('max_nodes') is not None:
+                size = min(size, limits['max_nodes'])
+            pool = large if size > self.large_nodes else small
+            if self.mode == 'process' and g is not current:
+                future = self._stale.submit(_build_structure_in_thread, g, node, timings, time.monotonic(),
+                                            wire_format, limits)
+            elif self.mode == 'thread':
+                future = pool.submit(_build_structure_in_thread, g, node, timings, time.monotonic(), wire_format,
+                                     limits)
+            else:
+                future = pool.submit(_build_structure, generation, node, time.monotonic(), wire_format, limits)
+        except BaseException:
+            self._release()
+            raise
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._release)
+        return future
+
+    async def structure(self, node: str, timings: Timings = None, wire_format: str = 'full',
+                        limits: dict = None, g=None) -> bytes:
+        """
+        Builds the structure of a node in the given graph, by default the current
+        one, encoded as json in the given wire format, and waits for it without
+        blocking the event loop. Raises asyncio.TimeoutError if it takes longer
+        than the timeout. If timings are given, the stages of the build are recorded.
+        """
+        future = asyncio.wrap_future(self.submit(node, timings, wire_format, limits, g))
+        value = await asyncio.wait_for(future, timeout=self.timeout)
+        if isinstance(value, tuple):
+            value, build_timings = value
+            if timings is not None:
+                timings.update(build_timings)
+        return value
+
+    async def get_or_build(self, cache, key, node: str, timings: Timings = None, wire_format: str = 'full',
+                           limits: dict = None, g=None) -> bytes:
+        """
+        Convenience function that returns the structure of a node from the cache,
+        building and caching it on a miss. Whether the cache was hit is noted on
+        the timings. The key has to belong to the version of the given graph.
+        """
+        with activate(timings), stage('cache'):
+            value = cache.get(key)
+        if timings is not None:
+            timings.notes['cache'] = 'miss' if value is None else 'hit'
+        if value is None:
+            value = await self.structure(node, timings, wire_format, limits, g)
+            cache.put(key, value)
+        return value
+
+    def replace(self, g):
+        """
+        Switches to a new graph, e.g. after a dataset update. In process mode new
+        workers are forked with the new graph, builds that are running already
+        finish on the old ones.
+        """
+        with self._lock:
+            old, generation = (self._small, self._large), self._generation
+            self.g = g
+            if self.mode == 'process':
+                self._generation = self._register(g)
+                self._small = self._pool(self.workers)
+                self._large = self._pool(self.large_workers)
+        if self.mode == 'process':
+            threading.Thread(target=self._retire, args=(old, generation), daemon=True).start()
+
+    def shutdown(self, wait: bool = True):
+        """
+        Cancels the builds that are still queued and shuts the pools down.
+        """
+        with self._lock:
+            futures = list(self._futures)
+        for future in futures:
+            future.cancel()
+        pools = self._small, self._large, self._stale
+        if wait:
+            self._retire(pools, self._generation)
+        else:
+            threading.Thread(target=self._retire, args=(pools, self._generation), daemon=True).start()
+
+    @staticmethod
+    def from_env(g, environ: dict) -> 'StructureExecutor':
+        """
+        Creates the executor configured by STRUCTURE_* environment variables.
+        """
+        return StructureExecutor(
+            g,
+            mode=environ.get('STRUCTURE_EXECUTOR', 'thread'),
+            workers=int(environ.get('STRUCTURE_WORKERS', 4)),
+            large_workers=int(environ.get('STRUCTURE_LARGE_WORKERS', 1)),
+            large_nodes=int(environ.get('STRUCTURE_LARGE_NODES', 10000)),
+            timeout=float(environ.get('STRUCTURE_TIMEOUT', 30)),
+            max_pending=int(environ.get('STRUCTURE_MAX_PENDING', 64)),
+        )
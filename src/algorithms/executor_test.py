@@ -0,0 +1,117 @@
+import asyncio
+import json
+import threading
+import pytest
+from cache import StructureCache
+from executor import Overloaded, StructureExecutor
+from graph import RR, Graph
+from graph_builder import DirectNodeGraphWithParentNetworkBuilder
+from timing import Timings
+
+
+def run(coroutine):
+    # asyncio.run is only there from Python 3.7 on
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+@pytest.fixture
+def g():
+    return Graph([
+        RR('B', 'A', RR.DIRECT),
+        RR('C', 'B', RR.DIRECT),
+        RR('C', 'A', RR.ULTIMATE),
+        RR('E', 'D', RR.DIRECT),
+    ]).build_indexes()
+
+
+@pytest.mark.parametrize('mode', StructureExecutor.MODES)
+def test_structure_executor_builds_structures(g, mode):
+    executor = StructureExecutor(g, mode=mode, workers=2, large_nodes=2)
+    try:
+        for node in ['A', 'C', 'E', 'UNKNOWN']:
+            expected = DirectNodeGraphWithParentNetworkBuilder().structure(g, node)
+            assert json.loads(run(executor.structure(node))) == expected
+        assert executor.pending == 0
+    finally:
+        executor.shutdown()
+
+
+def test_structure_executor_uses_cache(g):
+    executor = StructureExecutor(g)
+    cache = StructureCache(max_bytes=10 ** 6)
+    try:
+        first = run(executor.get_or_build(cache, 'C', 'C'))
+        second = run(executor.get_or_build(cache, 'C', 'C'))
+        assert first == second
+        assert cache.stats()['hits'] == 1
+    finally:
+        executor.shutdown()
+
+
+@pytest.mark.parametrize('mode', StructureExecutor.MODES)
+def test_structure_executor_builds_from_given_graph(g, mode):
+    # a request that started before the graph was replaced still builds from its own version
+    executor = StructureExecutor(g, mode=mode, workers=1)
+    try:
+        executor.replace(Graph([RR('C', 'D', RR.DIRECT)]).build_indexes())
+        expected = DirectNodeGraphWithParentNetworkBuilder().structure(g, 'C')
+        assert json.loads(run(executor.structure('C', g=g))) == expected
+        assert json.loads(run(executor.structure('C'))) != expected
+    finally:
+        executor.shutdown()
+
+
+def test_structure_executor_rejects_and_times_out(g):
+    executor = StructureExecutor(g, workers=1, max_pending=1, timeout=0.05)
+    blocked = threading.Event()
+    executor._small.submit(blocked.wait)
+    try:
+        with pytest.raises(asyncio.TimeoutError):
+            run(executor.structure('C'))
+        # the timed out build was still queued, so it was dropped with its slot
+        assert executor.pending == 0
+        executor.submit('A')
+        with pytest.raises(Overloaded):
+            executor.submit('B')
+    finally:
+        blocked.set()
+        executor.shutdown()
+    assert executor.pending == 0
+
+
+def test_structure_executor_shutdown_cancels_queued_builds(g):
+    executor = StructureExecutor(g, workers=1)
+    blocked = threading.Event()
+    executor._small.submit(blocked.wait)
+    future = executor.submit('A')
+    executor.shutdown(wait=False)
+    blocked.set()
+    assert future.cancelled()
+    assert executor.pending == 0
+
+
+def test_structure_executor_rejects_unknown_mode(g):
+    with pytest.raises(ValueError):
+        StructureExecutor(g, mode='fiber')
+
+
+@pytest.mark.parametrize('mode', StructureExecutor.MODES)
+def test_structure_executor_records_timings(g, mode):
+    executor = StructureExecutor(g, mode=mode)
+    cache = StructureCache(max_bytes=10 ** 6)
+    try:
+        built, hit = Timings(), Timings()
+        run(executor.get_or_build(cache, 'C', 'C', built))
+        run(executor.get_or_build(cache, 'C', 'C', hit))
+    finally:
+        executor.shutdown()
+
+    assert {'cache', 'queue', 'parent', 'components', 'induced', 'levels', 'labels', 'assemble', 'encode'} <= \
+        set(built.stages)
+    assert built.notes == {'cache': 'miss'}
+    assert built.counts == {'nodes': 3, 'edges': 2}
+    assert set(hit.stages) == {'cache'} and hit.notes == {'cache': 'hit'}
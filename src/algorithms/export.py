@@ -0,0 +1,75 @@
+import itertools
+import multiprocessing
+from typing import Iterable, Iterator
+
+from algorithms.encoding import dumps
+from algorithms.executor import fork_pool
+from algorithms.graph_builder import DirectNodeGraphWithParentNetworkBuilder as Builder
+
+# the graphs of the running exports. Workers are forked and inherit them, so a
+# graph stays here until the workers of its export are shut down
+_graphs = {}
+_exports = itertools.count()
+
+
+def iter_structures(g, component_ids: Iterable[int] = None) -> Iterator[dict]:
+    """
+    This function yields every distinct holding structure of the graph once,
+    going over one direct component at a time, so that only the structures of
+    a single component are held in memory. Every structure lists the LEIs whose
+    structure it is, next to its root and the nodes and edges as returned by
+    the API.
+    """
+    builder = Builder()
+    index = g.component_index
+    if component_ids is None:
+        component_ids = index.component_ids()
+    for component_id in component_ids:
+        for (_, root), leis in builder.structure_groups(g, index.members_of(component_id)).items():
+            yield dict(root=root, leis=leis, **builder.structure(g, leis[0]))
+
+
+def iter_ndjson(records: Iterable[dict]) -> Iterator[str]:
+    """
+    Convenience function that encodes records as lines of newline delimited json.
+    """
+    for record in records:
+        yield dumps(record).decode('utf-8') + '\n'
+
+
+def _export_components(export: int, component_ids: list) -> str:
+    """
+    Helper function that runs in a worker process and encodes the structures of
+    a chunk of components of the graph of an export.
+    """
+    return ''.join(iter_ndjson(iter_structures(_graphs[export], component_ids)))
+
+
+def iter_structures_ndjson(g, processes: int = 1, chunksize: int = 256) -> Iterator[str]:
+    """
+    This function yields all structures of the graph as newline delimited json.
+    With more than one process, chunks of `chunksize` components are encoded by
+    worker processes that are forked with the graph. At most two chunks per
+    worker are in flight, so memory stays bounded while the output is consumed,
+    and the output is in the same order as with one process. Without the fork
+    start method, the structures are encoded in this process.
+    """
+    if processes <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        yield from iter_ndjson(iter_structures(g))
+        return
+
+    export = next(_exports)
+    component_ids = list(g.component_index.component_ids())
+    chunks = iter([component_ids[start:start + chunksize] for start in range(0, len(component_ids), chunksize)])
+    _graphs[export] = g
+    try:
+        with fork_pool(processes) as pool:
+            pending = [pool.submit(_export_components, export, chunk) for _, chunk in zip(range(2 * processes), chunks)]
+            while pending:
+                lines = pending.pop(0).result()
+                chunk = next(chunks, None)
+                if chunk is not None:
+                    pending.append(pool.submit(_export_components, export, chunk))
+                yield lines
+    finally:
+        _graphs.pop(export, None)
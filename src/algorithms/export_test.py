@@ -0,0 +1,39 @@
+import json
+import random
+import pytest
+from export import iter_structures, iter_structures_ndjson
+from graph import RR, Graph
+from graph_builder import DirectNodeGraphWithParentNetworkBuilder
+
+
+@pytest.fixture
+def g():
+    r = random.Random(3)
+    return Graph([
+        RR('N%d' % r.randrange(40), 'N%d' % r.randrange(40), r.choice([RR.DIRECT, RR.DIRECT, RR.ULTIMATE, RR.BRANCH]))
+        for _ in range(50)
+    ])
+
+
+def test_iter_structures_covers_every_node_once(g):
+    builder = DirectNodeGraphWithParentNetworkBuilder()
+    structures = list(iter_structures(g))
+
+    leis = [lei for structure in structures for lei in structure['leis']]
+    assert sorted(leis) == sorted(g.nodes)
+
+    for structure in structures:
+        for lei in structure['leis']:
+            expected = builder.structure(g, lei)
+            assert structure['nodes'] == expected['nodes']
+            assert structure['edges'] == expected['edges']
+            assert builder.structure_key(g, lei)[1] == structure['root']
+
+
+@pytest.mark.parametrize('processes, chunksize', [(2, 1), (3, 4), (2, 1000)])
+def test_iter_structures_ndjson_with_processes(g, processes, chunksize):
+    expected = list(iter_structures_ndjson(g))
+    actual = ''.join(iter_structures_ndjson(g, processes=processes, chunksize=chunksize))
+
+    assert actual == ''.join(expected)
+    assert [json.loads(line) for line in actual.splitlines()] == list(iter_structures(g))
@@ -1,11 +1,20 @@
-import json
 import csv
 import copy
-from typing import Iterator, KeysView, Union
+from typing import Iterator, Union
 
 import networkx as nx
 import pandas as pd
 
+from algorithms.adjacency import TypedAdjacency
+from algorithms.anomalies import AnomalyIndex
+from algorithms.components import ComponentIndex
+from algorithms.encoding import dumps
+from algorithms.hierarchy import HierarchyIndex
+from algorithms.levels import LevelIndex
+from algorithms.names import NameStore
+from algorithms.snapshot import Snapshot
+from algorithms.timing import stage
+
 
 def iter_csv(f: str, limit: int = None):
     """
@@ -19,6 +28,40 @@ def iter_csv(f: str, limit: int = None):
             yield row
 
 
+RR_COLUMNS = (
+    'Relationship.StartNode.NodeID',
+    'Relationship.EndNode.NodeID',
+    'Relationship.RelationshipType',
+)
+RR_STATUS_COLUMN = 'Relationship.RelationshipStatus'
+
+
+def iter_rr_chunks(f: str, limit: int = None, status: str = None, chunksize: int = 100000) -> Iterator[list]:
+    """
+    Streams the relationships of a RR csv file as lists of (start, end, type)
+    tuples with at most `chunksize` entries. Only the needed columns are parsed,
+    in bulk by the pandas csv reader. If `status` is given, only relationships
+    with that status (e.g. ACTIVE) are kept. `limit` caps the number of rows
+    read, as in iter_csv.
+    """
+    columns = RR_COLUMNS + ((RR_STATUS_COLUMN,) if status is not None else ())
+    reader = pd.read_csv(f, usecols=columns, dtype=str, keep_default_na=False, index_col=False,
+                         nrows=limit, chunksize=chunksize)
+    for chunk in reader:
+        if status is not None:
+            chunk = chunk[chunk[RR_STATUS_COLUMN] == status]
+        yield list(zip(*(chunk[column] for column in RR_COLUMNS)))
+
+
+def iter_rr(f: str, limit: int = None, status: str = None) -> Iterator['RR']:
+    """
+    Convenience function to stream RR objects from a RR csv file, see iter_rr_chunks.
+    """
+    for chunk in iter_rr_chunks(f, limit=limit, status=status):
+        for start, end, rel_type in chunk:
+            yield RR(start, end, rel_type)
+
+
 class RR:
     DIRECT = 'IS_DIRECTLY_CONSOLIDATED_BY'
     #  DIRECT_CHILD = 'direct_child'
@@ -44,11 +87,68 @@ class RR:
         )
 
 
+def _copy_on_write(g: nx.MultiDiGraph, nodes: set) -> nx.MultiDiGraph:
+    """
+    Helper function that returns a graph sharing all adjacency and attribute
+    dicts with the given one, except the adjacency of the given nodes, which is
+    copied so that their edges can be changed without affecting the original.
+    Only the edges between two of the given nodes may be changed.
+    """
+    copy_g = nx.MultiDiGraph()
+    copy_g._node = dict(g._node)
+    copy_g._succ = copy_g._adj = dict(g._succ)
+    copy_g._pred = dict(g._pred)
+    for node in nodes:
+        if node in g._succ:
+            copy_g._succ[node] = dict(g._succ[node])
+            copy_g._pred[node] = dict(g._pred[node])
+    return copy_g
+
+
+def _remove_relationship(g: nx.MultiDiGraph, start: str, end: str, rel_type: str) -> bool:
+    """
+    Helper function to remove all edges of a relationship from a graph returned
+    by _copy_on_write, without changing the edge dicts shared with the original.
+    Returns whether there was anything to remove.
+    """
+    keys = g._succ.get(start, {}).get(end)
+    if keys is None or all(data['type'] != rel_type for data in keys.values()):
+        return False
+    keys = {key: data for key, data in keys.items() if data['type'] != rel_type}
+    if keys:
+        g._succ[start][end] = g._pred[end][start] = keys
+    else:
+        del g._succ[start][end]
+        del g._pred[end][start]
+    return True
+
+
+def _add_relationship(g: nx.MultiDiGraph, start: str, end: str, rel_type: str) -> bool:
+    """
+    Helper function to add an edge for a relationship to a graph returned by
+    _copy_on_write, unless the relationship exists already. Returns whether the
+    edge was added.
+    """
+    keys = g._succ.get(start, {}).get(end, {})
+    if any(data['type'] == rel_type for data in keys.values()):
+        return False
+    g.add_nodes_from((start, end))
+    keys = dict(keys)
+    keys[g.new_edge_key(start, end)] = {'type': rel_type}
+    g._succ[start][end] = g._pred[end][start] = keys
+    return True
+
+
 class Graph:
-    lookup_table = pd.DataFrame()
+    lookup_table = NameStore.empty()
 
     def __init__(self, rr: Iterator[RR]):
         self.g = nx.MultiDiGraph()
+        self._adjacency = TypedAdjacency()
+        self._component_index = None
+        self._level_index = None
+        self._hierarchy_index = None
+        self._anomaly_index = None
         self.__load_rr(rr)
 
     def __str__(self):
@@ -74,7 +174,7 @@ class Graph:
         """
         This helper function is used to build the graph from csv files.
         It reads the individual rows from a tuple generator representing lines
-        in the csv file.
+        in the csv file. The typed adjacency is filled in the same pass.
         """
 
         def mk_edge(rr: RR):
@@ -82,12 +182,14 @@ class Graph:
             Edge transformation function to bring the edge format from custom
             class RR to networkx tuple form (start, end, data).
             """
+            self._adjacency.add(rr.start, rr.end, rr.rel_type)
             return rr.start, rr.end, {'type': rr.rel_type}
 
-        self.g.add_edges_from(map(mk_edge, list(rr)))
+        self.g.add_edges_from(map(mk_edge, rr))
 
     def deepcopy(self) -> 'Graph':
-        return copy.deepcopy(self)
+        # the lookup table is read-only and shared instead of copied
+        return copy.deepcopy(self, {id(self.lookup_table): self.lookup_table})
 
     def merge(self, other_graph: 'Graph') -> 'Graph':
         """
@@ -109,31 +211,119 @@ class Graph:
         """
         return [e['type'] for e in self.get_edge_data(u, v).values()]
 
+    @property
+    def adjacency(self) -> TypedAdjacency:
+        """
+        Parent and child lookup per relationship type. It is filled while loading
+        the relationships and rebuilt from the edges if the graph was replaced.
+        """
+        if self._adjacency is None:
+            self._adjacency = TypedAdjacency(self.g.edges(data='type'))
+        return self._adjacency
+
     def get_direct_parent(self, node: str) -> str:
         """
         This function retrieves the direct parent of a given edge
         based on the edge relation type.
         """
-        for e in self.out_edges(node):
-            if 'IS_DIRECTLY_CONSOLIDATED_BY' in self.get_edge_types(e[0], e[1]):
-                return e[1]
+        return self._first_parent(node, RR.DIRECT)
 
     def get_ultimate_parent(self, node: str) -> str:
         """
         This function retrieves the ultimate parent of a given edge
         based on the edge relation type.
         """
-        for e in self.out_edges(node):
-            if 'IS_ULTIMATELY_CONSOLIDATED_BY' in self.get_edge_types(e[0], e[1]):
-                return e[1]
+        return self._first_parent(node, RR.ULTIMATE)
+
+    def _first_parent(self, node: str, rel_type: str) -> str:
+        """
+        Helper function to look up the parent of a node via the given relationship
+        type. If there are several, the first one in edge order is returned.
+        """
+        parents = self.adjacency.parents(node, rel_type)
+        if len(parents) > 1:
+            return next(v for v in self.g.succ[node] if v in parents)
+        return parents[0] if parents else None
+
+    def get_direct_children(self, node: str) -> list:
+        """
+        This function retrieves all direct children of a given node.
+        """
+        return self.adjacency.children(node, RR.DIRECT)
+
+    def get_ultimate_children(self, node: str) -> list:
+        """
+        This function retrieves all nodes that are ultimately consolidated by a given node.
+        """
+        return self.adjacency.children(node, RR.ULTIMATE)
+
+    def get_branches(self, node: str) -> list:
+        """
+        This function retrieves all international branches of a given node.
+        """
+        return self.adjacency.children(node, RR.BRANCH)
+
+    def get_parents(self, node: str, exclude: set = None) -> list:
+        """
+        This function retrieves all parents of a given node via relationships
+        of any type that is not in `exclude`.
+        """
+        if node not in self.g:
+            return []
+        exclude = exclude or set()
+        return [
+            parent for parent, keys in self.g.succ[node].items()
+            if any(data['type'] not in exclude for data in keys.values())
+        ]
+
+    def get_children(self, node: str, exclude: set = None) -> list:
+        """
+        This function retrieves all children of a given node via relationships
+        of any type that is not in `exclude`.
+        """
+        if node not in self.g:
+            return []
+        exclude = exclude or set()
+        return [
+            child for child, keys in self.g.pred[node].items()
+            if any(data['type'] not in exclude for data in keys.values())
+        ]
+
+    def view(self, exclude: set) -> 'Graph':
+        """
+        This function returns a read-only view of the graph that hides all edges
+        of the given types. Nothing is copied: edges are filtered lazily while the
+        view is traversed, and the graph itself is not modified. Use this instead
+        of remove_edge_type on shared graphs.
+        """
+        base = self.g
+        view = Graph([])
+        view.g = nx.graphviews.subgraph_view(
+            base, filter_edge=lambda u, v, key: base.succ[u][v][key]['type'] not in exclude
+        )
+        view._adjacency = self.adjacency.without(exclude)
+        view.lookup_table = self.lookup_table
+        if set(exclude) <= {RR.ULTIMATE}:
+            # the component index does not follow ultimate parent edges anyway
+            view._component_index = self._component_index
+            view._level_index = self._level_index
+        if RR.DIRECT not in exclude:
+            view._hierarchy_index = self._hierarchy_index
+        return view
 
     def remove_edge_type(self, rel_type: str):
         """
         This function removes all edges of a given type from the graph.
-        It updates the graph object inplace.
+        It updates the graph object inplace. See view for a copy-free alternative
+        that leaves the graph untouched.
         """
         remove = [(u, v, key) for (u, v, key) in self.edges if self.get_edge_data(u, v, key=key)['type'] == rel_type]
         self.g.remove_edges_from(remove)
+        self.adjacency.remove_type(rel_type)
+        self._component_index = None
+        self._level_index = None
+        self._hierarchy_index = None
+        self._anomaly_index = None
         return self
 
     def has_direct_parent(self, node: str) -> bool:
@@ -148,15 +338,109 @@ class Graph:
         """
         return self.get_ultimate_parent(node) is not None
 
-    def connected_nodes(self, lei: str) -> KeysView:
+    def connected_nodes(self, lei: str, exclude: set = None) -> list:
+        """
+        This function finds all connected nodes for a given LEI identifier,
+        following edges regardless of their direction. Edges whose type is in
+        `exclude` are not followed. The graph is walked in place, so neither the
+        graph nor an undirected copy of it is materialized. A LEI that is not part
+        of the graph is connected only to itself. Nodes are returned in the order
+        they were reached.
+        """
+        exclude = exclude or set()
+        seen = {lei: None}
+        queue = [lei]
+        while queue:
+            node = queue.pop()
+            if node not in self.g:
+                continue
+            for adjacency in (self.g.succ[node], self.g.pred[node]):
+                for neighbour, keys in adjacency.items():
+                    if neighbour in seen:
+                        continue
+                    if any(data['type'] not in exclude for data in keys.values()):
+                        seen[neighbour] = None
+                        queue.append(neighbour)
+        return list(seen)
+
+    @property
+    def component_index(self) -> ComponentIndex:
         """
-        This function transforms the graph to a undirected version of itself
-        and finds all connected nodes for a given LEI identifier, based on all
-        computable paths from the LEI node.
+        Index of the components connected via direct relationships (i.e. all
+        edges except the ultimate parent ones). It is built on first access and
+        reused until the edges of the graph are changed.
         """
-        # NOTE: Convertinv graph to undirected, in order to easily get all connected nodes regardless of edge direction
-        #       (i.e. including inbound connections)
-        return nx.single_source_shortest_path(self.g.to_undirected(), lei).keys()
+        if self._component_index is None:
+            self._component_index = ComponentIndex(
+                self.g.nodes,
+                ((u, v) for u, v, rel_type in self.g.edges(data='type') if rel_type != RR.ULTIMATE)
+            )
+        return self._component_index
+
+    @property
+    def level_index(self) -> LevelIndex:
+        """
+        Precomputed levels of all nodes with respect to the root of their direct
+        parent hierarchy. It is built on first access and reused until the edges
+        of the graph are changed.
+        """
+        if self._level_index is None:
+            self._level_index = LevelIndex.from_edges(
+                list(self.g.nodes),
+                ((u, v) for u, v, rel_type in self.g.edges(data='type') if rel_type != RR.ULTIMATE)
+            )
+        return self._level_index
+
+    @property
+    def hierarchy_index(self) -> HierarchyIndex:
+        """
+        Parent pointers and child lists of the direct parent hierarchy, used by
+        the ancestor and descendant queries. It is built on first access and
+        reused until the edges of the graph are changed.
+        """
+        if self._hierarchy_index is None:
+            self._hierarchy_index = HierarchyIndex.from_edges(
+                list(self.g.nodes),
+                ((u, v) for u, v, rel_type in self.g.edges(data='type') if rel_type == RR.DIRECT)
+            )
+        return self._hierarchy_index
+
+    @property
+    def anomaly_index(self) -> AnomalyIndex:
+        """
+        Cycles, nodes with several direct parents and ultimate parents outside
+        the direct component of a node, found in one pass over the graph. It is
+        built on first access and reused until the edges of the graph are changed.
+        """
+        if self._anomaly_index is None:
+            self._anomaly_index = AnomalyIndex.from_edges(
+                list(self.g.nodes),
+                ((u, v, rel_type == RR.DIRECT) for u, v, rel_type in self.g.edges(data='type')
+                 if rel_type != RR.ULTIMATE),
+                ((u, v) for u, v, rel_type in self.g.edges(data='type') if rel_type == RR.ULTIMATE),
+                self.component_index.component_of
+            )
+        return self._anomaly_index
+
+    def build_indexes(self) -> 'Graph':
+        """
+        This function builds all lookup indexes of the graph up front, so that
+        the first request does not have to pay for it.
+        """
+        self.adjacency
+        self.component_index
+        self.level_index
+        self.hierarchy_index
+        self.anomaly_index
+        return self
+
+    def direct_component(self, lei: str) -> list:
+        """
+        This function returns all nodes connected with the given LEI via direct
+        relationships, regardless of the edge direction. It is a lookup in the
+        component index and does not traverse the graph.
+        """
+        return self.component_index.nodes(lei)
 
     def get_shortest_direct_parent_path_lengths(self, reference_node: str) -> dict:
         """
@@ -164,7 +448,7 @@ class Graph:
         other via direct parent edges reachable nodes. It does NOT convert the graph to a undirected
         version before and respects directions. Dict form is {node_id: distance}.
         """
-        g = self.deepcopy().remove_edge_type(RR.ULTIMATE)  # TODO: What about BRANCH?
+        g = self.view(exclude={RR.ULTIMATE})  # TODO: What about BRANCH?
         return dict(nx.single_target_shortest_path_length(g.g, reference_node))
 
     def sub(self, lei: str) -> 'Graph':
@@ -172,28 +456,103 @@ class Graph:
         This function subsets the graph based on the nodes connected with the
         given LEI node.
         """
-        self.g.add_node(lei)  # Add dummy node
-        nodes = self.connected_nodes(lei)
-        return Graph.from_graph(self.g.subgraph(nodes))
+        return self.induced(self.connected_nodes(lei))
+
+    def induced(self, nodes: list, exclude: set = None) -> 'Graph':
+        """
+        This function builds a new graph from the given nodes and all edges
+        between them whose type is not in `exclude`. Only the requested nodes and
+        edges are allocated; the graph itself is left untouched. Nodes that are
+        not part of the graph are added as isolated nodes.
+        """
+        exclude = exclude or set()
+        nodes = dict.fromkeys(nodes)
+        sub = Graph([])
+        sub.lookup_table = self.lookup_table
+        for node in nodes:
+            sub.g.add_node(node, **(self.g.nodes[node] if node in self.g else {}))
+        for u in nodes:
+            if u not in self.g:
+                continue
+            for v, keys in self.g.succ[u].items():
+                if v not in nodes:
+                    continue
+                for key, data in keys.items():
+                    if data['type'] not in exclude:
+                        sub.g.add_edge(u, v, key=key, **data)
+                        sub.adjacency.add(u, v, data['type'])
+        return sub
+
+    def apply_delta(self, delta: 'Delta') -> 'Graph':
+        """
+        This function returns a new graph with the changes of a delta applied,
+        while this graph stays untouched and can serve requests in the meantime.
+        Only the nodes whose relationships change are copied, everything else is
+        shared with this graph. The adjacency, component and level indexes are
+        updated for the affected components only, and the lookup table for the
+        changed names. The hierarchy index gets the new direct parents of the
+        touched nodes, and the anomalies of the affected components are found
+        again.
+        """
+        touched = delta.nodes()
+        removed, added = delta.removed, delta.added
+        affected = self.component_index.affected(touched)
+
+        graph = Graph([])
+        graph.g = _copy_on_write(self.g, touched)
+        removed = [rr for rr in removed if _remove_relationship(graph.g, *rr)]
+        added = [rr for rr in added if _add_relationship(graph.g, *rr)]
+        for node in touched:
+            if node in graph.g and not graph.g.succ[node] and not graph.g.pred[node]:
+                graph.g.remove_node(node)
+
+        nodes = [node for node in affected if node in graph.g]
+        typed_edges = [
+            (u, v, rel_type) for u in nodes for v, keys in graph.g.succ[u].items()
+            for rel_type in dict.fromkeys(data['type'] for data in keys.values()) if rel_type != RR.ULTIMATE
+        ]
+        edges = [(u, v) for u, v, _ in typed_edges]
+        graph._adjacency = self.adjacency.updated(added, removed)
+        graph._component_index = self.component_index.updated(touched, nodes, edges)
+        graph._level_index = self.level_index.updated(nodes, edges, [node for node in affected if node not in graph.g])
+        graph._hierarchy_index = self.hierarchy_index.updated({
+            node: [
+                v for v, keys in graph.g.succ[node].items() if any(data['type'] == RR.DIRECT for data in keys.values())
+            ] if node in graph.g else []
+            for node in touched
+        })
+        graph._anomaly_index = self.anomaly_index.updated(
+            nodes, [(u, v, rel_type == RR.DIRECT) for u, v, rel_type in typed_edges],
+            [(u, v) for u in nodes for v, keys in graph.g.succ[u].items()
+             if any(data['type'] == RR.ULTIMATE for data in keys.values())],
+            graph._component_index.component_of, [node for node in affected if node not in graph.g]
+        )
+        graph.lookup_table = self.lookup_table.updated(delta.names)
+        return graph
 
     def get_node_label(self, lei: str) -> str:
         """
         Wrapper function to retrieve the legal name of an entity based
         on its LEI from the lookup table attached to the graph.
         """
-        try:
-            return self.lookup_table.loc[lei]['Entity.LegalName']
-        except KeyError:
-            return 'id not found'
+        label = self.lookup_table.get_label(lei)
+        return label if label is not None else 'id not found'
+
+    def get_node_labels(self, leis: list) -> list:
+        """
+        Batch version of get_node_label, looking up all labels at once.
+        """
+        return [label if label is not None else 'id not found' for label in self.lookup_table.get_labels(leis)]
 
-    def transform_node(self, node: dict) -> dict:
+    def transform_node(self, node: dict, label: str = None) -> dict:
         """
         Convenience function to rename node dictionary keys for final return array.
+        The label is looked up unless it is given.
         """
         return {
             'id': node['id'],
             'title': node['id'],
-            'label': self.get_node_label(node['id']),
+            'label': label if label is not None else self.get_node_label(node['id']),
             'level': node.get('level'),
             'no_parent': node.get('no_parent'),
         }
@@ -210,48 +569,84 @@ class Graph:
 
     def to_array(self) -> dict:
         """
-        Convenience function for preparing the graph data to json dump.
-        """
-        data = nx.node_link_data(self.g)
-        return {
-            'nodes': list(map(self.transform_node, data['nodes'])),
-            'edges': list(map(self.transform_link, data['links'])),
-        }
+        Convenience function for preparing the graph data to json dump. All labels
+        are looked up in one batch, and nodes and edges are read straight from the
+        graph, in the same form as transform_node and transform_link produce.
+        """
+        nodes = list(self.g.nodes)
+        with stage('labels'):
+            labels = self.get_node_labels(nodes)
+        with stage('assemble'):
+            attributes = self.g.nodes
+            return {
+                'nodes': [
+                    {
+                        'id': node,
+                        'title': node,
+                        'label': label,
+                        'level': attributes[node].get('level'),
+                        'no_parent': attributes[node].get('no_parent'),
+                    } for node, label in zip(nodes, labels)
+                ],
+                'edges': [
+                    {
+                        'from': start,
+                        'to': end,
+                        'label': rel_type,
+                    } for start, end, rel_type in self.g.edges(data='type')
+                ],
+            }
 
-    def to_json(self):
-        return json.dumps(self.to_array(), indent=2)
+    def to_json(self) -> str:
+        return dumps(self.to_array()).decode('utf-8')
 
-    def set_levels(self, parent: str = None) -> 'Graph':
+    def set_levels(self, parent: str = None, levels: LevelIndex = None) -> 'Graph':
         """
         This function sets the levels on a graph as a node attribute.
+        If the precomputed levels of the full graph are given, they are read from
+        there whenever they are exact, instead of computing them again. This is
+        only valid if the graph contains complete direct components of the full
+        graph, as the structures of DirectNodeGraphWithParentNetworkBuilder do.
         """
         subgraph = self
         if parent:
-            distances = self._level_computation(subgraph=subgraph, root_node=parent)
-            distances = {
-                node: {
-                    'level': distances[node] if distances[node] is not 'no_parent' else 1,
-                    'no_parent': False if distances[node] is not 'no_parent' else True
-                } for node in distances
-            }
-            nx.set_node_attributes(subgraph.g, distances)
+            with stage('levels'):
+                distances = levels.distances(parent, subgraph.nodes) if levels is not None else None
+            if distances is None:
+                with stage('levels_bfs'):
+                    distances = self._level_computation(subgraph=subgraph, root_node=parent)
+            with stage('levels'):
+                subgraph.set_distances(distances)
         else:
             print('No parent found. TODO')
             raise ValueError
         return subgraph
 
+    def set_distances(self, distances: dict) -> 'Graph':
+        """
+        This function sets the levels on a graph as a node attribute from the
+        distances of the nodes to the root, None for nodes that do not reach it.
+        """
+        distances = {
+            node: {
+                'level': distances[node] if distances[node] is not None else 1,
+                'no_parent': distances[node] is None
+            } for node in distances
+        }
+        nx.set_node_attributes(self.g, distances)
+        return self
+
     @staticmethod
     def _level_computation(subgraph, root_node: str) -> dict:
         """
         This function computes the levels with respect to the given root node by using
         single target shortest path algorithm from networkx. It returns a dictionary
-        of node ids with the computed depth in the graph.
+        of node ids with the computed depth in the graph, None for nodes that do
+        not reach the root node.
         """
-        compute_graph = subgraph.remove_edge_type(rel_type=RR.ULTIMATE)
-        distances = nx.single_target_shortest_path_length(compute_graph.g, target=root_node)
-        distances = dict(distances)
-        distances.update({node: 'no_parent' for node in subgraph.nodes if not distances.get(node) and
-                          node is not root_node})
+        compute_graph = subgraph.view(exclude={RR.ULTIMATE})
+        distances = dict(nx.single_target_shortest_path_length(compute_graph.g, target=root_node))
+        distances = {node: distances.get(node) for node in subgraph.nodes}
         distances.update({root_node: 0})
         return distances
 
@@ -259,12 +654,35 @@ class Graph:
     def from_graph(_g: nx.MultiDiGraph) -> 'Graph':
         g = Graph([])
         g.g = copy.deepcopy(_g)
+        g._adjacency = None
         return g
 
     @staticmethod
     def set_lookup_table(f):
-        Graph.lookup_table = pd.read_csv(f, index_col=["LEI"], usecols=["LEI", "Entity.LegalName"])
+        Graph.lookup_table = NameStore.from_csv(f)
+
+    @staticmethod
+    def set_lookup_table_from_snapshot(snapshot: Snapshot):
+        Graph.lookup_table = NameStore.from_snapshot(snapshot)
+
+    @staticmethod
+    def from_csv(f: str, limit: int = None, status: str = None) -> 'Graph':
+        return Graph(iter_rr(f, limit, status))
 
     @staticmethod
-    def from_csv(f: str, limit: int = None) -> 'Graph':
-        return Graph(RR.from_csv_row(row) for row in iter_csv(f, limit))
+    def from_snapshot(snapshot: Snapshot) -> 'Graph':
+        return Graph(RR(start, end, rel_type) for start, end, rel_type in snapshot.iter_rr())
+
+    @staticmethod
+    def compile_snapshot(rr_csv: str, lei_csv: str, path: str) -> Snapshot:
+        """
+        This function compiles the relationship and LEI csv files into a binary
+        snapshot file, which can be loaded much faster than the csv files.
+        """
+        names = pd.read_csv(lei_csv, usecols=["LEI", "Entity.LegalName"])
+        snapshot = Snapshot.from_records(
+            (rr for chunk in iter_rr_chunks(rr_csv) for rr in chunk),
+            zip(names["LEI"], names["Entity.LegalName"]),
+        )
+        snapshot.write(path)
+        return snapshot
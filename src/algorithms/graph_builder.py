@@ -1,6 +1,9 @@
-from typing import Tuple, Union
+import collections
+from typing import Dict, Iterable, List, Tuple, Union
 
+from algorithms.anomalies import CYCLE
 from algorithms.graph import RR, Graph
+from algorithms.timing import Timings, activate, count, stage
 
 
 class DirectNodeGraphWithParentNetworkBuilder:
@@ -17,40 +20,307 @@ class DirectNodeGraphWithParentNetworkBuilder:
 
 
         "Direct" graph is the graph that connects nodes only via direct parent relationships (in all directions)
-        """
-        g = g.deepcopy()
 
-        parent_graph, parent_node = self.ultimate_parent_direct_graph(g, node)
-        node_graph = self.node_direct_graph(g, node)
+        The given graph is only read, never copied or modified. Only the nodes and
+        edges of the returned network are allocated.
+        """
+        with stage('parent'):
+            parent = g.get_ultimate_parent(node)
+        with stage('components'):
+            parent_nodes = self.direct_nodes(g, parent) if parent is not None else []
+            nodes = parent_nodes + self.direct_nodes(g, node)
+        with stage('induced'):
+            return g.induced(nodes, exclude={RR.ULTIMATE}), parent
 
-        return parent_graph.merge(node_graph), parent_node
+    def direct_nodes(self, g: Graph, node: str) -> list:
+        """
+        Returns the nodes connected with the given node via direct relationships
+        (in all directions), looked up in the component index of the graph.
+        """
+        return g.direct_component(node)
 
     def node_direct_graph(self, g: Graph, node: str) -> Graph:
-        g = g.deepcopy()
-        return g.remove_edge_type(RR.ULTIMATE).sub(node)
+        return g.induced(self.direct_nodes(g, node), exclude={RR.ULTIMATE})
 
     def ultimate_parent_direct_graph(self, g: Graph, node: str) -> Tuple[Graph, Union[str, None]]:
         """for given node and its full graph, get the sub graph of the ultimate parent
-        
+
         Arguments:
             g {Graph} -- graph of node
-            node {str} -- lei of node 
-        
+            node {str} -- lei of node
+
         Returns:
             [tuple] -- sub graph of ultimate parent and its lei
         """
-        g = g.deepcopy()
         parent = g.get_ultimate_parent(node)
 
         # if there is no ultimate parent, we return an empty graph
         if parent is None:
             return Graph([]), parent
 
-        # first remove ultimate edge
-        g_without_ultimate_edge = g.remove_edge_type(RR.ULTIMATE)
+        # subgraph for parent, following direct edges only
+        return self.node_direct_graph(g, parent), parent
+
+    def structure(self, g: Graph, node: str, timings: Timings = None, **limits) -> dict:
+        """
+        Builds the holding structure of a node with levels relative to its
+        ultimate parent (or to the node itself, if it has none) as returned by
+        the API. If timings are given, the durations of the stages of the build
+        and the numbers of nodes and edges are recorded to them. If limits are
+        given (max_depth, max_nodes, expand), only that part of the structure is
+        built, see limited_structure. The anomalies of the nodes of the structure,
+        if any, are listed by node, see AnomalyIndex.
+        """
+        with activate(timings):
+            if any(limit is not None for limit in limits.values()):
+                structure = self.limited_structure(g, node, **limits)
+            else:
+                parent_graph, parent_node = self.build(g, node)
+                root = parent_node if parent_node is not None else node
+                structure = parent_graph.set_levels(root, levels=g.level_index).to_array()
+            structure['anomalies'] = g.anomaly_index.of(child['id'] for child in structure['nodes'])
+            count('nodes', len(structure['nodes']))
+            count('edges', len(structure['edges']))
+        return structure
+
+    def path_to_root(self, g: Graph, node: str, root: str) -> list:
+        """
+        Returns a shortest path from a node up to the root, following direct and
+        branch relationships towards the parents, or an empty list if the node
+        does not reach the root. Only the ancestors of the node are visited.
+        As long as the nodes on the way up have a single parent and are on no
+        cycle, which the anomaly index tells, there is only one path and it is
+        followed directly.
+        """
+        anomalies = g.anomaly_index
+        path, current = [node], node
+        while current != root:
+            parents = g.get_parents(current, exclude={RR.ULTIMATE})
+            if len(parents) > 1 or anomalies.flags_of(current) & CYCLE:
+                break
+            if not parents:
+                return []
+            current = parents[0]
+            path.append(current)
+        else:
+            return path
+
+        previous = {node: None}
+        queue = collections.deque([node])
+        while queue:
+            current = queue.popleft()
+            if current == root:
+                path = []
+                while current is not None:
+                    path.append(current)
+                    current = previous[current]
+                return path[::-1]
+            for parent in g.get_parents(current, exclude={RR.ULTIMATE}):
+                if parent not in previous:
+                    previous[parent] = current
+                    queue.append(parent)
+        return []
+
+    def in_structure(self, g: Graph, node: str, lei: str) -> bool:
+        """
+        Convenience function to check if a LEI is part of the structure of a node.
+        """
+        parent = g.get_ultimate_parent(node)
+        index = g.component_index
+        components = {index.component_of(node), index.component_of(parent if parent is not None else node)}
+        return lei in (node, parent) or (index.component_of(lei) in components - {None})
+
+    def limited_nodes(self, g: Graph, start: str, max_depth: int = None, max_nodes: int = None) -> Tuple[dict, set]:
+        """
+        Walks down from the start node to its children (via direct and branch
+        relationships) breadth first, and stops at `max_depth` levels below the
+        start or once `max_nodes` nodes were reached. Children are taken in
+        order of their LEI, so the same nodes are returned by every graph
+        engine. Only the nodes that are returned and the children of the last
+        ones are visited. Returns the
+        distances of the reached nodes to the start, and the reached nodes that
+        have children which were left out.
+        """
+        depths = {start: 0}
+        truncated = set()
+        frontier = [start]
+        while frontier:
+            deeper = []
+            for node in frontier:
+                children = sorted(child for child in g.get_children(node, exclude={RR.ULTIMATE}) if child not in depths)
+                if not children:
+                    continue
+                if max_depth is not None and depths[node] >= max_depth:
+                    truncated.add(node)
+                    continue
+                for child in children:
+                    if max_nodes is not None and len(depths) >= max_nodes:
+                        truncated.add(node)
+                        break
+                    depths[child] = depths[node] + 1
+                    deeper.append(child)
+            frontier = deeper
+        return depths, truncated
+
+    def build_limited(self, g: Graph, node: str, max_depth: int = None, max_nodes: int = None,
+                      expand: str = None) -> Tuple[Graph, set]:
+        """
+        Builds the top of the structure of a node: the nodes at most `max_depth`
+        levels below its ultimate parent (or the node itself, if it has none),
+        up to `max_nodes` nodes, plus the path from the node up to that root (or
+        the node, if it does not reach the root). The path is exempt from
+        `max_nodes`, so that the node is always part of its structure. With
+        `expand`, the part below that node of the structure is built instead, so
+        that deeper levels can be loaded lazily. Only the returned part of the
+        structure is traversed, see limited_nodes.
+
+        Returns the graph with levels relative to the root, and the nodes whose
+        children were left out.
+        """
+        with stage('parent'):
+            parent = g.get_ultimate_parent(node)
+            root = parent if parent is not None else node
+        if expand is not None and not self.in_structure(g, node, expand):
+            raise ValueError('{} is not part of the structure of {}'.format(expand, node))
 
-        # get graph for parent
-        parent_sub = g_without_ultimate_edge.sub(parent)
+        with stage('traverse'):
+            start = expand if expand is not None else root
+            depths, truncated = self.limited_nodes(g, start, max_depth, max_nodes)
+            path = self.path_to_root(g, node if expand is None else start, root)
+            nodes = dict.fromkeys(depths)
+            if expand is None:
+                # the node itself is always part of its structure, even if it does not reach the root
+                nodes.update(dict.fromkeys(path or [node]))
+                truncated = {
+                    child for child in truncated.union(set(nodes) - set(depths))
+                    if any(c not in nodes for c in g.get_children(child, exclude={RR.ULTIMATE}))
+                }
+            nodes = list(nodes)
 
-        # then subgraph for parent
-        return parent_sub, parent
+        with stage('induced'):
+            sub = g.induced(nodes, exclude={RR.ULTIMATE})
+        with stage('levels'):
+            distances = g.level_index.distances(root, nodes)
+            if distances is None:
+                # the walk down from the start gives the levels, if the start reaches the root
+                distances = dict.fromkeys(nodes)
+                if expand is None:
+                    distances.update((child, len(path) - 1 - i) for i, child in enumerate(path))
+                    distances.update(depths)
+                elif path:
+                    distances.update((child, len(path) - 1 + depth) for child, depth in depths.items())
+            sub.set_distances(distances)
+        return sub, truncated
+
+    def limited_structure(self, g: Graph, node: str, max_depth: int = None, max_nodes: int = None,
+                          expand: str = None) -> dict:
+        """
+        Builds a part of the holding structure of a node as returned by the API,
+        see build_limited. Every node tells whether some of its children were
+        left out, and so does the structure.
+        """
+        sub, truncated = self.build_limited(g, node, max_depth, max_nodes, expand)
+        structure = sub.to_array()
+        for child in structure['nodes']:
+            child['truncated'] = child['id'] in truncated
+        structure['truncated'] = bool(truncated)
+        return structure
+
+    def ancestors(self, g: Graph, node: str) -> dict:
+        """
+        Returns the chain of direct parents of a node up to the root of its
+        hierarchy as returned by the API, nearest first. The chain is read from
+        the parent pointers of the hierarchy index, a chain that runs into a
+        cycle stops before it repeats and is flagged.
+        """
+        with stage('traverse'):
+            chain, cycle = g.hierarchy_index.ancestors(node)
+        with stage('labels'):
+            labels = g.get_node_labels(chain)
+        return {
+            'id': node,
+            'ancestors': [{'id': lei, 'label': label, 'depth': depth}
+                          for depth, (lei, label) in enumerate(zip(chain, labels), start=1)],
+            'cycle': cycle,
+        }
+
+    def descendants(self, g: Graph, node: str, max_depth: int = None, max_nodes: int = None) -> dict:
+        """
+        Returns the direct descendants of a node breadth first as returned by the
+        API, each with the direct parent it was reached from and its depth below
+        the node. The child lists of the hierarchy index are followed, so only
+        the returned nodes are visited. Whether max_depth or max_nodes left some
+        descendants out is told by the truncated flag.
+        """
+        with stage('traverse'):
+            found, truncated = g.hierarchy_index.descendants(node, max_depth, max_nodes)
+        with stage('labels'):
+            labels = g.get_node_labels([lei for lei, _, _ in found])
+        return {
+            'id': node,
+            'descendants': [{'id': lei, 'label': label, 'parent': parent, 'depth': depth}
+                            for (lei, parent, depth), label in zip(found, labels)],
+            'truncated': truncated,
+        }
+
+    def common_parents(self, g: Graph, groups: List[List[str]]) -> List[dict]:
+        """
+        Tells for every group of LEIs whether they belong to the same corporate
+        group, i.e. the same direct component, and returns their lowest common
+        direct parent as returned by the API. All groups are looked up in the
+        component index and the hierarchy index at once, without building any
+        structure. The LEIs of a group can have no common direct parent although
+        they are in the same corporate group, e.g. if they are only connected via
+        a branch or a second direct parent.
+        """
+        with stage('traverse'):
+            parents = g.hierarchy_index.common_parents(groups)
+            index = g.component_index
+            components = [{index.component_of(lei) for lei in group} for group in groups]
+            same_group = [
+                len(set(group)) == 1 or (len(component) == 1 and None not in component)
+                for group, component in zip(groups, components)
+            ]
+        with stage('labels'):
+            found = list(dict.fromkeys(parent for parent in parents if parent is not None))
+            labels = dict(zip(found, g.get_node_labels(found)))
+        return [
+            {
+                'leis': group,
+                'same_group': same,
+                'common_parent': {'id': parent, 'label': labels[parent]} if parent is not None else None,
+            }
+            for group, same, parent in zip(groups, same_group, parents)
+        ]
+
+    def structure_key(self, g: Graph, node: str) -> tuple:
+        """
+        Identifies the structure of a node without building it. All nodes of a
+        direct component that share the same ultimate parent get the same
+        structure, so (component id, root node) is a valid cache key.
+        """
+        parent = g.get_ultimate_parent(node)
+        root = parent if parent is not None else node
+        return g.component_index.component_of(node), root
+
+    def structure_size(self, g: Graph, node: str) -> int:
+        """
+        Estimates the number of nodes in the structure of a node without
+        building it, from the sizes of the direct components involved.
+        """
+        index = g.component_index
+        parent = g.get_ultimate_parent(node)
+        if parent is None or index.component_of(parent) == index.component_of(node):
+            return index.size(node)
+        return index.size(node) + index.size(parent)
+
+    def structure_groups(self, g: Graph, nodes: Iterable[str]) -> Dict[tuple, list]:
+        """
+        Groups nodes by their structure key, so that every distinct structure of
+        a batch only needs to be built once. Groups and the nodes within them are
+        in order of first appearance, duplicate nodes are dropped.
+        """
+        groups = {}
+        for node in dict.fromkeys(nodes):
+            groups.setdefault(self.structure_key(g, node), []).append(node)
+        return groups
@@ -1,5 +1,7 @@
+import networkx as nx
 import pytest
 from graph import RR, Graph
+from conftest import mk_case, mk_compact, mk_graph, normalized
 from graph_builder import DirectNodeGraphWithParentNetworkBuilder
 
 @pytest.fixture
@@ -180,4 +182,221 @@ def test_ROI_without_ultimate_parent(builder):
     #  RR('I', 'J', RR.DIRECT),
 
     #  print('hey')
-    assert True
\ No newline at end of file
+    assert True
+
+def test_structure_key_identifies_structure(builder):
+    g = Graph([
+        RR('ROI', 'UP', RR.ULTIMATE),
+        RR('ROI', 'P1', RR.DIRECT),
+        RR('C1', 'ROI', RR.DIRECT),
+        RR('C1', 'UP', RR.ULTIMATE),
+        RR('P1', 'X', RR.ULTIMATE),
+        RR('UP:C1', 'UP', RR.DIRECT),
+    ])
+
+    assert builder.structure_key(g, 'ROI') == builder.structure_key(g, 'C1')
+    assert builder.structure(g, 'ROI') == builder.structure(g, 'C1')
+
+    # same component, but a different ultimate parent
+    assert builder.structure_key(g, 'P1') != builder.structure_key(g, 'ROI')
+
+    # same ultimate parent, but a different component
+    assert builder.structure_key(g, 'UP:C1') != builder.structure_key(g, 'ROI')
+    assert builder.structure_key(g, 'UNKNOWN') == (None, 'UNKNOWN')
+
+    # ROI, C1 and P1 plus UP and UP:C1, X is only reached via an ultimate relationship
+    assert builder.structure_size(g, 'ROI') == len(builder.build(g, 'ROI')[0].nodes) == 5
+    assert builder.structure_size(g, 'UP') == 2
+    assert builder.structure_size(g, 'UNKNOWN') == 1
+
+
+def test_structure_groups(builder):
+    g = Graph([
+        RR('ROI', 'UP', RR.ULTIMATE),
+        RR('ROI', 'P1', RR.DIRECT),
+        RR('C1', 'ROI', RR.DIRECT),
+        RR('C1', 'UP', RR.ULTIMATE),
+        RR('P1', 'X', RR.ULTIMATE),
+    ])
+
+    groups = builder.structure_groups(g, ['ROI', 'P1', 'C1', 'ROI', 'UNKNOWN'])
+
+    assert list(groups.values()) == [['ROI', 'C1'], ['P1'], ['UNKNOWN']]
+    assert list(groups) == [builder.structure_key(g, node) for node in ['ROI', 'P1', 'UNKNOWN']]
+
+
+@pytest.fixture
+def tree():
+
+    #              UP
+    #           /  |   \
+    #          A   B    C
+    #         / \   \
+    #       A1  A2  B1
+    #       |
+    #      A11
+
+    rr = [('A', 'UP'), ('B', 'UP'), ('C', 'UP'), ('A1', 'A'), ('A2', 'A'), ('B1', 'B'), ('A11', 'A1')]
+    return Graph(
+        [RR(start, end, RR.DIRECT) for start, end in rr] + [RR(start, 'UP', RR.ULTIMATE) for start, _ in rr]
+    ).build_indexes()
+
+
+def levels_of(structure: dict) -> dict:
+    return {node['id']: (node['level'], node['truncated']) for node in structure['nodes']}
+
+
+def test_limited_structure_by_depth(builder, tree):
+    structure = builder.limited_structure(tree, 'B', max_depth=1)
+
+    assert levels_of(structure) == {
+        'UP': (0, False), 'A': (1, True), 'B': (1, True), 'C': (1, False),
+    }
+    assert structure['truncated']
+    assert sorted((edge['from'], edge['to']) for edge in structure['edges']) == [('A', 'UP'), ('B', 'UP'), ('C', 'UP')]
+
+
+def test_limited_structure_includes_path_of_node(builder, tree):
+    structure = builder.limited_structure(tree, 'A11', max_depth=1)
+
+    assert levels_of(structure) == {
+        'UP': (0, False), 'A': (1, True), 'B': (1, True), 'C': (1, False), 'A1': (2, False), 'A11': (3, False),
+    }
+
+
+def test_limited_structure_by_nodes(builder, tree):
+    structure = builder.limited_structure(tree, 'UP', max_nodes=5)
+
+    assert levels_of(structure) == {
+        'UP': (0, False), 'A': (1, True), 'B': (1, True), 'C': (1, False), 'A1': (2, True),
+    }
+
+
+def test_limited_structure_expand(builder, tree):
+    structure = builder.limited_structure(tree, 'B', max_depth=1, expand='A')
+
+    assert levels_of(structure) == {'A': (1, False), 'A1': (2, True), 'A2': (2, False)}
+    with pytest.raises(ValueError):
+        builder.limited_structure(tree, 'B', expand='UNKNOWN')
+
+
+def test_limited_structure_without_limits_is_complete(builder, tree):
+    for node in tree.nodes:
+        structure = builder.limited_structure(tree, node)
+        assert not structure['truncated']
+        for child in structure['nodes']:
+            del child['truncated']
+        expected = builder.structure(tree, node)
+        assert sorted(structure['nodes'], key=lambda child: child['id']) == \
+            sorted(expected['nodes'], key=lambda child: child['id'])
+        assert sorted(structure['edges'], key=str) == sorted(expected['edges'], key=str)
+
+
+@pytest.mark.parametrize('engine', [mk_graph, mk_compact])
+@pytest.mark.parametrize('seed', range(15))
+def test_limited_structure_is_part_of_structure(builder, engine, seed):
+    rr, names, _, _, _ = mk_case(seed)
+    g = engine(rr, names)
+    for node in g.nodes:
+        full = {child['id']: child for child in builder.structure(g, node)['nodes']}
+        for limits in [dict(max_depth=0), dict(max_depth=1), dict(max_nodes=1), dict(max_depth=2, max_nodes=4)]:
+            structure = builder.limited_structure(g, node, **limits)
+            nodes = {child['id']: child for child in structure['nodes']}
+            assert node in nodes
+            for lei, child in nodes.items():
+                assert lei in full
+                assert (child['level'], child['no_parent']) == (full[lei]['level'], full[lei]['no_parent'])
+                children = set(g.get_children(lei, exclude={RR.ULTIMATE})) & set(full)
+                assert child['truncated'] == (not children <= set(nodes))
+            path = builder.path_to_root(g, node, structure['nodes'][0]['id'])
+            assert len(set(nodes) - set(path or [node])) <= limits.get('max_nodes', len(nodes))
+        for lei in list(full)[:3]:
+            nodes = {child['id'] for child in builder.limited_structure(g, node, max_depth=1, expand=lei)['nodes']}
+            assert lei in nodes and nodes <= set(full)
+
+
+def test_limited_structure_by_nodes_takes_children_by_lei(builder):
+    g = Graph([RR('Z', 'UP', RR.DIRECT), RR('B', 'UP', RR.DIRECT), RR('M', 'UP', RR.DIRECT)]).build_indexes()
+    assert levels_of(builder.limited_structure(g, 'UP', max_nodes=3)) == {
+        'UP': (0, True), 'B': (1, False), 'M': (1, False),
+    }
+
+
+def test_ancestors(builder, tree):
+    ancestors = builder.ancestors(tree, 'A11')
+    assert [(a['id'], a['depth']) for a in ancestors['ancestors']] == [('A1', 1), ('A', 2), ('UP', 3)]
+    assert not ancestors['cycle']
+    assert builder.ancestors(tree, 'UP')['ancestors'] == []
+
+
+def test_descendants(builder, tree):
+    descendants = builder.descendants(tree, 'A')
+    assert sorted((d['id'], d['parent'], d['depth']) for d in descendants['descendants']) == \
+        [('A1', 'A', 1), ('A11', 'A1', 2), ('A2', 'A', 1)]
+    assert not descendants['truncated']
+    descendants = builder.descendants(tree, 'UP', max_depth=1)
+    assert sorted(d['id'] for d in descendants['descendants']) == ['A', 'B', 'C']
+    assert descendants['truncated']
+
+
+def test_common_parents(builder, tree):
+    results = builder.common_parents(tree, [['A11', 'A2'], ['A11', 'B1', 'C'], ['A1', 'A11'], ['A', 'UNKNOWN']])
+    assert [(r['same_group'], r['common_parent'] and r['common_parent']['id']) for r in results] == \
+        [(True, 'A'), (True, 'UP'), (True, 'A1'), (False, None)]
+    assert results[0]['leis'] == ['A11', 'A2']
+
+
+def legacy_structure(g: Graph, node: str) -> dict:
+    # the structure as the first version built it: the direct components of the
+    # node and its ultimate parent, with levels from a shortest path search
+    # towards the root, written against networkx alone
+    direct = nx.MultiDiGraph(g.g)
+    direct.remove_edges_from([(u, v, key) for u, v, key, rel_type in g.g.edges(keys=True, data='type')
+                              if rel_type == RR.ULTIMATE])
+    out_edges = g.g.out_edges(node, data='type') if node in g.g else []
+    parent = next((v for _, v, rel_type in out_edges if rel_type == RR.ULTIMATE), None)
+    root = parent if parent is not None else node
+    direct.add_nodes_from([node, root])
+    undirected = direct.to_undirected()
+    sub = direct.subgraph(nx.node_connected_component(undirected, node) | nx.node_connected_component(undirected, root))
+    distances = dict(nx.single_target_shortest_path_length(sub, root))
+    return {
+        'nodes': [{
+            'id': lei,
+            'title': lei,
+            'label': g.get_node_label(lei),
+            'level': distances.get(lei, 1),
+            'no_parent': lei not in distances,
+        } for lei in sub.nodes],
+        'edges': [{'from': u, 'to': v, 'label': rel_type} for u, v, rel_type in sub.edges(data='type')],
+    }
+
+
+@pytest.fixture
+def irregular():
+    # X <-> Y is a cycle below UP, C has two direct parents and a branch, and
+    # the ultimate parent Z of O is not connected with it via direct relationships
+    return [
+        ('A', 'UP', RR.DIRECT), ('X', 'A', RR.DIRECT), ('Y', 'X', RR.DIRECT), ('X', 'Y', RR.DIRECT),
+        ('C', 'A', RR.DIRECT), ('C', 'B', RR.DIRECT), ('B', 'UP', RR.DIRECT), ('C', 'F', RR.BRANCH),
+        ('C', 'UP', RR.ULTIMATE), ('X', 'UP', RR.ULTIMATE), ('S', 'S', RR.DIRECT),
+        ('O', 'P', RR.DIRECT), ('O', 'Z', RR.ULTIMATE), ('Z', 'Q', RR.BRANCH),
+    ]
+
+
+@pytest.mark.parametrize('engine', [mk_graph, mk_compact])
+def test_structure_matches_legacy_structure(builder, irregular, engine):
+    expected = mk_graph(irregular)
+    g = engine(irregular)
+    for node in list(expected.nodes) + ['UNKNOWN']:
+        assert normalized(builder.structure(g, node)) == normalized(legacy_structure(expected, node))
+
+
+@pytest.mark.parametrize('engine', [mk_graph, mk_compact])
+@pytest.mark.parametrize('seed', range(20))
+def test_random_structure_matches_legacy_structure(builder, engine, seed):
+    rr, names, _, _, _ = mk_case(seed)
+    expected = mk_graph(rr, names)
+    g = engine(rr, names)
+    for node in expected.nodes:
+        assert normalized(builder.structure(g, node)) == normalized(legacy_structure(expected, node))
@@ -1,7 +1,7 @@
 import pytest
 from os import path
-from graph import RR, Graph
-import pandas as pd 
+from graph import RR, Graph, iter_rr_chunks
+from snapshot import Snapshot
 
 @pytest.fixture
 def rr_test_csv(request):
@@ -111,12 +111,13 @@ def test_lookup_read_in(lookup_test_csv):
     g = Graph([])
     Graph.set_lookup_table(lookup_test_csv)
 
-    assert isinstance(g.lookup_table, pd.DataFrame)
+    assert len(g.lookup_table) == 3
+    assert g.lookup_table.get_label('LEI_3') == 'company3'
 
 def test_lookup(rr_test_csv, lookup_test_csv):
     g = Graph.from_csv(rr_test_csv)
     Graph.set_lookup_table(lookup_test_csv)
-    assert g.lookup_table.shape[0] == 3
+    assert len(g.lookup_table) == 3
     assert g.get_node_label("LEI_1") == "company1"
 
 def test_node_not_found_in_G(rr_test_csv, lookup_test_csv):
@@ -127,7 +128,7 @@ def test_node_not_found_in_G(rr_test_csv, lookup_test_csv):
     nodes = a['nodes']
     edges = a['edges']
 
-    assert g.lookup_table.shape[0] == 3    
+    assert len(g.lookup_table) == 3
     assert edges == []
     assert nodes == [{
         'label': 'company2',
@@ -335,3 +336,106 @@ def test_Graph_subgraphs():
 @pytest.mark.skip("Direction not implemented")
 def test_Graph_direction():
     assert False, "TODO: Implement MultiDiGraph"
+
+def test_direct_component():
+    g = Graph([
+        RR('ROI', 'P1', RR.DIRECT),
+        RR('ROI', 'UP', RR.ULTIMATE),
+        RR('C1', 'ROI', RR.DIRECT),
+        RR('B1', 'C1', RR.BRANCH),
+        RR('UP:C1', 'UP', RR.DIRECT),
+    ])
+
+    assert sorted(g.direct_component('P1')) == ['B1', 'C1', 'P1', 'ROI']
+    assert sorted(g.direct_component('UP')) == ['UP', 'UP:C1']
+    assert g.direct_component('UNKNOWN') == ['UNKNOWN']
+
+    g.remove_edge_type(RR.DIRECT)
+    assert sorted(g.direct_component('P1')) == ['P1']
+
+def test_node_get_children():
+    g = Graph([
+        RR('C1', 'P1', RR.DIRECT),
+        RR('C2', 'P1', RR.DIRECT),
+        RR('C1', 'UP', RR.ULTIMATE),
+        RR('B1', 'P1', RR.BRANCH),
+    ])
+
+    assert g.get_direct_children('P1') == ['C1', 'C2']
+    assert g.get_ultimate_children('UP') == ['C1']
+    assert g.get_branches('P1') == ['B1']
+    assert g.get_direct_children('C1') == []
+
+    g.remove_edge_type(RR.DIRECT)
+    assert g.get_direct_children('P1') == []
+    assert g.get_direct_parent('C1') is None
+
+    merged = g.merge(Graph([RR('C3', 'P1', RR.DIRECT)]))
+    assert merged.get_direct_parent('C3') == 'P1'
+    assert merged.get_ultimate_parent('C1') == 'UP'
+
+def test_view():
+    g = Graph([
+        RR('ROI', 'P1', RR.DIRECT),
+        RR('ROI', 'UP1', RR.ULTIMATE),
+        RR('C', 'A', RR.ULTIMATE),
+        RR('C', 'A', RR.DIRECT),
+    ])
+
+    view = g.view(exclude={RR.ULTIMATE})
+    assert sorted(list(view.edges)) == [
+        ('C', 'A', 1),
+        ('ROI', 'P1', 0),
+    ]
+    assert sorted(list(view.nodes)) == ['A', 'C', 'P1', 'ROI', 'UP1']
+    assert view.get_direct_parent('ROI') == 'P1'
+    assert view.get_ultimate_parent('ROI') is None
+
+    # the graph itself is left untouched
+    assert len(g.edges) == 4
+    assert g.get_ultimate_parent('ROI') == 'UP1'
+
+    assert g.get_shortest_direct_parent_path_lengths('P1') == {'P1': 0, 'ROI': 1}
+    assert len(g.edges) == 4
+
+
+def test_set_levels_keeps_ultimate_edges():
+    g = Graph([
+        RR('C1', 'P1', RR.DIRECT),
+        RR('C1', 'P1', RR.ULTIMATE),
+    ])
+
+    levels = {n['id']: n['level'] for n in g.set_levels('P1').to_array()['nodes']}
+    assert levels == {'C1': 1, 'P1': 0}
+    assert len(g.edges) == 2
+
+def test_Graph_from_snapshot(rr_test_csv, lookup_test_csv, tmp_path):
+    path = str(tmp_path / 'gleif.snapshot')
+    Graph.compile_snapshot(rr_test_csv, lookup_test_csv, path)
+    snapshot = Snapshot.open(path)
+
+    g = Graph.from_snapshot(snapshot)
+    assert list(g.nodes) == list(Graph.from_csv(rr_test_csv).nodes)
+    assert list(g.edges(data='type')) == list(Graph.from_csv(rr_test_csv).edges(data='type'))
+    assert g.get_direct_parent('LEI_1') == 'DIRECT_PARENT_LEI'
+
+    Graph.set_lookup_table_from_snapshot(snapshot)
+    assert g.get_node_label('LEI_1') == 'company1'
+    assert g.get_node_label('LEI_2') == 'company2'
+    assert g.get_node_label('DIRECT_PARENT_LEI') == 'id not found'
+
+def test_iter_rr_chunks(rr_test_csv):
+    chunks = list(iter_rr_chunks(rr_test_csv, chunksize=1))
+    assert chunks == [
+        [('LEI_1', 'DIRECT_PARENT_LEI', 'IS_DIRECTLY_CONSOLIDATED_BY')],
+        [('LEI_1', 'ULTIMATE_PARENT_LEI', 'IS_ULTIMATELY_CONSOLIDATED_BY')],
+    ]
+
+    assert list(iter_rr_chunks(rr_test_csv, limit=1)) == [
+        [('LEI_1', 'DIRECT_PARENT_LEI', 'IS_DIRECTLY_CONSOLIDATED_BY')],
+    ]
+    assert sum(map(len, iter_rr_chunks(rr_test_csv, status='ACTIVE'))) == 2
+    assert sum(map(len, iter_rr_chunks(rr_test_csv, status='INACTIVE'))) == 0
+
+    g = Graph.from_csv(rr_test_csv, status='INACTIVE')
+    assert list(g.nodes) == []
@@ -0,0 +1,241 @@
+from typing import Callable, Dict, Iterable, List, Tuple
+
+import numpy as np
+
+
+def _ancestor_table(parent: np.ndarray) -> Tuple[List[np.ndarray], np.ndarray]:
+    """
+    Helper function to build the binary lifting table of a parent pointer array:
+    entry k holds the ancestor 2^k levels up of every node (or its root, if that
+    is closer), and the depth of every node below its root. Roots point to
+    themselves. Direct parents can form cycles, which have no root, so every
+    cycle is cut at its smallest node id, which becomes a root. The table only
+    has as many entries as the deepest hierarchy needs.
+    """
+    n = len(parent)
+    up = np.where(parent == -1, np.arange(n, dtype=np.int32), parent).astype(np.int32)
+
+    # pointer jumping until every node points at its root, except those whose
+    # parent chain ends in a cycle
+    jump = up.copy()
+    active = np.flatnonzero(jump[jump] != jump)
+    for _ in range(max(n, 1).bit_length() + 1):
+        if len(active) == 0:
+            break
+        jump[active] = jump[jump[active]]
+        active = active[jump[jump[active]] != jump[active]]
+    for start in np.unique(jump[active]).tolist():
+        cycle, i = [start], int(up[start])
+        while i != start and up[i] != i:
+            cycle.append(i)
+            i = int(up[i])
+        if i == start:
+            cut = min(cycle)
+            up[cut] = cut
+
+    table = [up]
+    depth = (up != np.arange(n)).astype(np.int32)
+    while True:
+        top = table[-1]
+        above = top[top]
+        if np.array_equal(above, top):
+            break
+        depth = depth + depth[top]
+        table.append(above)
+    return table, depth
+
+
+class HierarchyIndex:
+    """
+    The direct parent hierarchy as arrays over node ids: a pointer to the direct
+    parent of every node (the one get_direct_parent returns, -1 for none) and
+    the direct children of every node in CSR form, i.e. the children of node i
+    are children[child_offsets[i]:child_offsets[i + 1]]. Ancestor and descendant
+    queries follow these arrays, so they take time proportional to their output
+    and do not look at the rest of the graph.
+
+    For common parent queries, the index also keeps a binary lifting table over
+    the direct parent forest, see _ancestor_table, which answers them in time
+    logarithmic in the depth of the hierarchy.
+    """
+
+    def __init__(self, id_of: Callable, lei_of: Callable, starts: np.ndarray, ends: np.ndarray,
+                 parent: np.ndarray, child_offsets: np.ndarray, children: np.ndarray, ids: dict = None):
+        self.id_of = id_of
+        self.lei_of = lei_of
+        self.starts = starts
+        self.ends = ends
+        self.parent = parent
+        self.child_offsets = child_offsets
+        self.children = children
+        self.ids = ids
+        self.table, self.depth = _ancestor_table(parent)
+
+    def ancestors(self, lei: str) -> Tuple[List[str], bool]:
+        """
+        Returns the chain of direct parents of a node up to its root, nearest
+        first, and whether the chain runs into a cycle. A cyclic chain stops
+        before its first repeated node.
+        """
+        i = self.id_of(lei)
+        if i is None:
+            return [], False
+        seen = {i}
+        chain = []
+        i = int(self.parent[i])
+        while i != -1:
+            if i in seen:
+                return [self.lei_of(j) for j in chain], True
+            seen.add(i)
+            chain.append(i)
+            i = int(self.parent[i])
+        return [self.lei_of(j) for j in chain], False
+
+    def descendants(self, lei: str, max_depth: int = None,
+                    max_nodes: int = None) -> Tuple[List[Tuple[str, str, int]], bool]:
+        """
+        Returns the direct descendants of a node breadth first, as (LEI, direct
+        parent, depth) tuples, and whether some were left out because of
+        `max_depth` or `max_nodes`. Every descendant is returned once, below the
+        first of its parents that was reached.
+        """
+        i = self.id_of(lei)
+        if i is None:
+            return [], False
+        offsets, children = self.child_offsets, self.children
+        seen = {i}
+        found = []
+        frontier = [i]
+        depth = 0
+        while frontier:
+            if max_depth is not None and depth >= max_depth:
+                truncated = any(
+                    child not in seen for j in frontier for child in children[offsets[j]:offsets[j + 1]].tolist()
+                )
+                return self._leis(found), truncated
+            depth += 1
+            deeper = []
+            for j in frontier:
+                for child in children[offsets[j]:offsets[j + 1]].tolist():
+                    if child in seen:
+                        continue
+                    if max_nodes is not None and len(found) >= max_nodes:
+                        return self._leis(found), True
+                    seen.add(child)
+                    found.append((child, j, depth))
+                    deeper.append(child)
+            frontier = deeper
+        return self._leis(found), False
+
+    def lowest_common_parents(self, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        """
+        Returns the lowest common direct parent of every pair of node ids a[i],
+        b[i], or -1 if they have none. A node counts as its own parent, so if one
+        node of a pair is above the other, it is the answer. Ids of -1 have no
+        common parent with anything.
+        """
+        a, b = np.asarray(a, dtype=np.int64), np.asarray(b, dtype=np.int64)
+        if len(self.depth) == 0:
+            return np.full(len(a), -1, dtype=np.int64)
+        known = (a >= 0) & (b >= 0)
+        a, b = np.where(known, a, 0), np.where(known, b, 0)
+        depth, table = self.depth, self.table
+
+        # lift the deeper node of every pair to the depth of the other one
+        deeper = depth[a] < depth[b]
+        a, b = np.where(deeper, b, a), np.where(deeper, a, b)
+        diff = depth[a] - depth[b]
+        for k, up in enumerate(table):
+            a = np.where((diff >> k) & 1 == 1, up[a], a)
+
+        # then lift both as long as they stay apart
+        for up in reversed(table):
+            apart = up[a] != up[b]
+            a, b = np.where(apart, up[a], a), np.where(apart, up[b], b)
+        common = np.where(a == b, a, table[0][a])
+        return np.where(known & (table[-1][a] == table[-1][b]), common, -1)
+
+    def common_parents(self, groups: List[List[str]]) -> List[str]:
+        """
+        Returns the lowest common direct parent of every group of LEIs, or None
+        for groups without one. All groups are answered together, one pass per
+        position within the groups.
+        """
+        width = max((len(group) for group in groups), default=0)
+        if width == 0:
+            return [None] * len(groups)
+        ids = np.full((len(groups), width), -2, dtype=np.int64)
+        for row, group in enumerate(groups):
+            for column, lei in enumerate(group):
+                i = self.id_of(lei)
+                ids[row, column] = -1 if i is None else i
+        common = ids[:, 0]
+        for column in range(1, width):
+            present = ids[:, column] != -2
+            common = np.where(present, self.lowest_common_parents(common, np.where(present, ids[:, column], 0)), common)
+        return [None if i < 0 else self.lei_of(i) for i in common.tolist()]
+
+    def _leis(self, found: list) -> List[Tuple[str, str, int]]:
+        return [(self.lei_of(child), self.lei_of(parent), depth) for child, parent, depth in found]
+
+    def updated(self, parents: Dict[str, list]) -> 'HierarchyIndex':
+        """
+        Returns a new index in which the direct parents of the given nodes are
+        replaced by the given ones, first parent first. Only indexes built with
+        from_edges can be updated. This index is not modified.
+        """
+        ids = dict(self.ids)
+        for child, child_parents in parents.items():
+            ids.setdefault(child, len(ids))
+            for parent in child_parents:
+                ids.setdefault(parent, len(ids))
+        changed = np.array([ids[child] for child in parents], dtype=np.int32)
+        keep = ~np.isin(self.starts, changed)
+        pairs = [(ids[child], ids[parent]) for child, child_parents in parents.items() for parent in child_parents]
+        added = np.array(pairs, dtype=np.int32).reshape(-1, 2)
+        index = HierarchyIndex.from_arrays(
+            len(ids), ids.get, None,
+            np.concatenate([self.starts[keep], added[:, 0]]), np.concatenate([self.ends[keep], added[:, 1]]),
+        )
+        leis = list(ids)
+        index.lei_of = leis.__getitem__
+        index.ids = ids
+        return index
+
+    @staticmethod
+    def from_arrays(n: int, id_of: Callable, lei_of: Callable, starts: np.ndarray,
+                    ends: np.ndarray) -> 'HierarchyIndex':
+        """
+        Builds the index from direct (child, parent) relationships given as
+        arrays of node ids. The first parent of every child is its direct parent,
+        duplicate relationships are dropped.
+        """
+        starts, ends = starts.astype(np.int32), ends.astype(np.int32)
+        _, first = np.unique(starts.astype(np.int64) * n + ends, return_index=True)
+        first.sort()
+        starts, ends = starts[first], ends[first]
+
+        parent = np.full(n, -1, dtype=np.int32)
+        _, first_parent = np.unique(starts, return_index=True)
+        parent[starts[first_parent]] = ends[first_parent]
+
+        order = np.argsort(ends, kind='stable')
+        child_offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(ends, minlength=n), out=child_offsets[1:])
+        return HierarchyIndex(id_of, lei_of, starts, ends, parent, child_offsets, starts[order])
+
+    @staticmethod
+    def from_edges(nodes: list, edges: Iterable[Tuple[str, str]]) -> 'HierarchyIndex':
+        """
+        Builds the index from a node list and direct (child, parent) edges.
+        """
+        ids = {node: i for i, node in enumerate(nodes)}
+        starts, ends = [], []
+        for start, end in edges:
+            starts.append(ids[start])
+            ends.append(ids[end])
+        index = HierarchyIndex.from_arrays(
+            len(ids), ids.get, list(ids).__getitem__, np.array(starts, dtype=np.int32), np.array(ends, dtype=np.int32)
+        )
+        index.ids = ids
+        return index
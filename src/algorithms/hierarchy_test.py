@@ -0,0 +1,143 @@
+import pytest
+from conftest import mk_case, mk_compact, mk_graph
+from graph import RR, Graph
+from hierarchy import HierarchyIndex
+
+
+def expected_ancestors(g, node: str) -> tuple:
+    chain, seen = [], {node}
+    parent = g.get_direct_parent(node)
+    while parent is not None:
+        if parent in seen:
+            return chain, True
+        seen.add(parent)
+        chain.append(parent)
+        parent = g.get_direct_parent(parent)
+    return chain, False
+
+
+def expected_descendants(g, node: str) -> dict:
+    depths, frontier = {node: 0}, [node]
+    while frontier:
+        deeper = []
+        for parent in frontier:
+            for child in g.get_direct_children(parent):
+                if child not in depths:
+                    depths[child] = depths[parent] + 1
+                    deeper.append(child)
+        frontier = deeper
+    del depths[node]
+    return depths
+
+
+@pytest.fixture
+def index():
+    # A <- B <- D, A <- C, B <- E, D also reports to C, and X <-> Y is a cycle
+    return HierarchyIndex.from_edges(
+        ['A', 'B', 'C', 'D', 'E', 'X', 'Y'],
+        [('B', 'A'), ('C', 'A'), ('D', 'B'), ('D', 'C'), ('E', 'B'), ('X', 'Y'), ('Y', 'X'), ('B', 'A')]
+    )
+
+
+def test_ancestors(index):
+    assert index.ancestors('D') == (['B', 'A'], False)
+    assert index.ancestors('A') == ([], False)
+    assert index.ancestors('X') == (['Y'], True)
+    assert index.ancestors('UNKNOWN') == ([], False)
+
+
+def test_descendants(index):
+    found, truncated = index.descendants('A')
+    assert not truncated
+    assert sorted(found) == [('B', 'A', 1), ('C', 'A', 1), ('D', 'B', 2), ('E', 'B', 2)]
+    assert index.descendants('X') == ([('Y', 'X', 1)], False)
+    assert index.descendants('E') == ([], False)
+
+
+def test_descendants_limits(index):
+    found, truncated = index.descendants('A', max_depth=1)
+    assert truncated
+    assert sorted(found) == [('B', 'A', 1), ('C', 'A', 1)]
+    assert index.descendants('A', max_depth=0) == ([], True)
+    assert index.descendants('A', max_depth=2)[1] is False
+
+    found, truncated = index.descendants('A', max_nodes=3)
+    assert truncated
+    assert len(found) == 3
+    assert index.descendants('A', max_nodes=4)[1] is False
+
+
+def test_updated(index):
+    updated = index.updated({'E': ['C', 'A'], 'NEW': ['E'], 'C': []})
+    assert updated.ancestors('NEW') == (['E', 'C'], False)
+    assert sorted(updated.descendants('A')[0]) == [('B', 'A', 1), ('D', 'B', 2), ('E', 'A', 1), ('NEW', 'E', 2)]
+    assert updated.ancestors('C') == ([], False)
+    # the index itself is left untouched
+    assert index.ancestors('E') == (['B', 'A'], False)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_hierarchy_index_matches_graph(seed):
+    rr, names, delta, expected_rr, expected_names = mk_case(seed)
+    graph = mk_graph(rr, names)
+    updated = graph.apply_delta(delta)
+    for g in (graph, mk_compact(rr, names), updated, mk_compact(expected_rr, expected_names)):
+        index = g.hierarchy_index
+        for node in g.nodes:
+            assert index.ancestors(node) == expected_ancestors(g, node)
+            found, truncated = index.descendants(node)
+            assert not truncated
+            assert {child: depth for child, _, depth in found} == expected_descendants(g, node)
+            assert all(child in g.get_direct_children(parent) for child, parent, _ in found)
+
+
+def test_hierarchy_index_ignores_other_types():
+    g = Graph([RR('B', 'C', RR.BRANCH), RR('B', 'D', RR.DIRECT), RR('E', 'B', RR.ULTIMATE)])
+    assert g.hierarchy_index.ancestors('B') == (['D'], False)
+    assert g.hierarchy_index.descendants('B') == ([], False)
+    assert g.view(exclude={RR.ULTIMATE}).hierarchy_index.ancestors('B') == (['D'], False)
+
+
+def test_hierarchy_index_follows_get_direct_parent():
+    # A comes first in edge order, even though its direct relationship does not
+    g = Graph([RR('B', 'A', RR.ULTIMATE), RR('B', 'D', RR.DIRECT), RR('B', 'A', RR.DIRECT)])
+    assert g.get_direct_parent('B') == 'A'
+    assert g.hierarchy_index.ancestors('B') == (['A'], False)
+
+
+def expected_common_parent(g, a: str, b: str) -> str:
+    above_a = [a] + expected_ancestors(g, a)[0]
+    above_b = set([b] + expected_ancestors(g, b)[0])
+    return next((node for node in above_a if node in above_b), None)
+
+
+def test_common_parents(index):
+    assert index.common_parents([['D', 'E'], ['D', 'C'], ['E', 'A'], ['D', 'X'], ['E', 'UNKNOWN'], ['B', 'D', 'E']]) == \
+        ['B', 'A', 'A', None, None, 'B']
+    assert index.common_parents([['D'], ['UNKNOWN'], []]) == ['D', None, None]
+
+
+def test_common_parents_of_cycles():
+    # X -> Y -> Z -> X is cut at X, W hangs below Z
+    index = HierarchyIndex.from_edges(['X', 'Y', 'Z', 'W'], [('X', 'Y'), ('Y', 'Z'), ('Z', 'X'), ('W', 'Z')])
+    assert list(index.depth) == [0, 2, 1, 2]
+    assert index.common_parents([['W', 'Y'], ['W', 'X'], ['Y', 'Z']]) == ['Z', 'X', 'Z']
+
+
+def test_common_parents_of_deep_chain():
+    nodes = ['N%d' % i for i in range(100)]
+    index = HierarchyIndex.from_edges(nodes + ['M'], [(nodes[i + 1], nodes[i]) for i in range(99)] + [('M', 'N37')])
+    assert len(index.table) == 8
+    assert index.common_parents([['N99', 'M'], ['N20', 'M'], ['N38', 'M'], ['N99', 'N0']]) == ['N37', 'N20', 'N37', 'N0']
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_common_parents_match_graph(seed):
+    rr, names, delta, expected_rr, expected_names = mk_case(seed)
+    graph = mk_graph(rr, names)
+    for g in (graph, mk_compact(rr, names), graph.apply_delta(delta)):
+        nodes = sorted(g.nodes)
+        # cycles are cut in the index, so only nodes with acyclic chains are compared
+        nodes = [node for node in nodes if not expected_ancestors(g, node)[1]]
+        pairs = [[a, b] for a in nodes for b in nodes]
+        assert g.hierarchy_index.common_parents(pairs) == [expected_common_parent(g, a, b) for a, b in pairs]
@@ -0,0 +1,156 @@
+from typing import Callable, Iterable, Tuple
+
+import numpy as np
+
+
+def gather(offsets: np.ndarray, values: np.ndarray, nodes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Collects the CSR entries of many nodes at once. Returns the owning node and
+    the position in `values` of every entry.
+    """
+    starts = offsets[nodes]
+    counts = offsets[nodes + 1] - starts
+    owners = np.repeat(nodes, counts)
+    positions = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(starts, counts)
+    return owners, positions
+
+
+def compute_levels(n: int, edge_start: np.ndarray, edge_end: np.ndarray,
+                   in_offsets: np.ndarray, in_sources: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Computes the levels of all nodes of a hierarchy given as edges from child to
+    parent, with a breadth first search that starts at all roots (nodes without
+    parents) at the same time and walks down to the children.
+
+    Returns three arrays over the node ids:
+        - depth: distance to the root, -1 if the node reaches no root (i.e. it
+          only leads into a cycle)
+        - root: the root the node was reached from, -1 if there is none
+        - ambiguous: whether the node reaches more than one root, in which case
+          its depth is only the distance to the closest one
+    """
+    depth = np.full(n, -1, dtype=np.int32)
+    root = np.full(n, -1, dtype=np.int32)
+    has_parent = np.zeros(n, dtype=bool)
+    has_parent[edge_start] = True
+
+    frontier = np.flatnonzero(~has_parent).astype(np.int32)
+    depth[frontier] = 0
+    root[frontier] = frontier
+    level = 0
+    while len(frontier):
+        level += 1
+        owners, positions = gather(in_offsets, in_sources, frontier)
+        children = in_sources[positions]
+        fresh = depth[children] == -1
+        children, owners = children[fresh], owners[fresh]
+        children, first = np.unique(children, return_index=True)
+        depth[children] = level
+        root[children] = root[owners[first]]
+        frontier = children
+
+    # a node whose parents lead to different roots reaches all of them, and so
+    # do all of its descendants
+    reached = (root[edge_start] != -1) & (root[edge_end] != -1)
+    conflicts = edge_start[reached & (root[edge_start] != root[edge_end])]
+    ambiguous = np.zeros(n, dtype=bool)
+    frontier = np.unique(conflicts)
+    ambiguous[frontier] = True
+    while len(frontier):
+        _, positions = gather(in_offsets, in_sources, frontier)
+        children = np.unique(in_sources[positions])
+        frontier = children[~ambiguous[children]]
+        ambiguous[frontier] = True
+
+    return depth, root, ambiguous
+
+
+class LevelIndex:
+    """
+    Precomputed levels of all nodes in the direct parent hierarchy, i.e. over
+    all relationships except the ultimate parent ones. For every node it holds
+    the distance to its root and the root itself, see compute_levels.
+    """
+
+    def __init__(self, id_of: Callable, depth: np.ndarray, root: np.ndarray, ambiguous: np.ndarray, ids: dict = None):
+        self.id_of = id_of
+        self.depth = depth
+        self.root = root
+        self.ambiguous = ambiguous
+        self.ids = ids
+
+    def is_root(self, lei: str) -> bool:
+        i = self.id_of(lei)
+        return i is not None and self.root[i] == i
+
+    def distances(self, root: str, nodes: Iterable[str]) -> dict:
+        """
+        Returns the distance of every given node to `root`, None for nodes that do
+        not reach it. This is only exact for roots of the hierarchy and nodes that
+        reach at most one root, so None is returned instead of the dict if any of
+        the nodes can not be answered from the index.
+        """
+        if not self.is_root(root):
+            return None
+        root_id = self.id_of(root)
+        distances = {}
+        for node in nodes:
+            i = self.id_of(node)
+            if i is None or self.ambiguous[i]:
+                return None
+            distances[node] = int(self.depth[i]) if self.root[i] == root_id else None
+        return distances
+
+    def updated(self, nodes: list, edges: Iterable[Tuple[str, str]], removed: Iterable[str] = ()) -> 'LevelIndex':
+        """
+        Returns a new index in which the levels of the given nodes are computed
+        again from the given (child, parent) edges, which have to form complete
+        components of the changed hierarchy. Removed nodes lose their levels. Only
+        indexes built with from_edges can be updated. This index is not modified.
+        """
+        ids = dict(self.ids)
+        for node in nodes:
+            ids.setdefault(node, len(ids))
+        depth = np.full(len(ids), -1, dtype=np.int32)
+        root = np.full(len(ids), -1, dtype=np.int32)
+        ambiguous = np.zeros(len(ids), dtype=bool)
+        depth[:len(self.depth)] = self.depth
+        root[:len(self.root)] = self.root
+        ambiguous[:len(self.ambiguous)] = self.ambiguous
+
+        gone = np.array([ids[node] for node in removed if node in ids], dtype=np.int64)
+        depth[gone], root[gone], ambiguous[gone] = -1, -1, False
+
+        patch = LevelIndex.from_edges(nodes, edges)
+        positions = np.array([ids[node] for node in nodes], dtype=np.int64)
+        depth[positions] = patch.depth
+        root[positions] = np.where(patch.root >= 0, positions[patch.root], -1)
+        ambiguous[positions] = patch.ambiguous
+        return LevelIndex(ids.get, depth, root, ambiguous, ids)
+
+    @staticmethod
+    def from_arrays(n: int, id_of: Callable, edge_start: np.ndarray, edge_end: np.ndarray) -> 'LevelIndex':
+        """
+        Builds the index from (child, parent) edges given as arrays of node ids.
+        """
+        order = np.argsort(edge_end, kind='stable')
+        in_offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(edge_end, minlength=n), out=in_offsets[1:])
+        depth, root, ambiguous = compute_levels(n, edge_start, edge_end, in_offsets, edge_start[order])
+        return LevelIndex(id_of, depth, root, ambiguous)
+
+    @staticmethod
+    def from_edges(nodes: list, edges: Iterable[Tuple[str, str]]) -> 'LevelIndex':
+        """
+        Builds the index from a node list and (child, parent) edges.
+        """
+        ids = {node: i for i, node in enumerate(nodes)}
+        starts, ends = [], []
+        for start, end in edges:
+            starts.append(ids[start])
+            ends.append(ids[end])
+        index = LevelIndex.from_arrays(
+            len(ids), ids.get, np.array(starts, dtype=np.int32), np.array(ends, dtype=np.int32)
+        )
+        index.ids = ids
+        return index
@@ -0,0 +1,53 @@
+import pytest
+from graph import Graph
+from levels import LevelIndex
+from conftest import mk_compact, mk_graph, mk_rr
+
+
+def test_level_index_chain():
+    index = LevelIndex.from_edges(['A', 'B', 'C', 'D'], [('B', 'A'), ('C', 'B'), ('D', 'B')])
+
+    assert index.is_root('A')
+    assert not index.is_root('B')
+    assert not index.is_root('UNKNOWN')
+    assert index.distances('A', ['A', 'B', 'C', 'D']) == {'A': 0, 'B': 1, 'C': 2, 'D': 2}
+    assert index.distances('B', ['B', 'C']) is None
+    assert index.distances('A', ['A', 'UNKNOWN']) is None
+
+
+def test_level_index_other_root():
+    index = LevelIndex.from_edges(['A', 'B', 'X', 'Y'], [('B', 'A'), ('Y', 'X')])
+
+    assert index.distances('A', ['A', 'B', 'X', 'Y']) == {'A': 0, 'B': 1, 'X': None, 'Y': None}
+
+
+def test_level_index_several_roots():
+    # C reaches the roots A and X, so it and its child D can not be answered
+    index = LevelIndex.from_edges(
+        ['A', 'B', 'C', 'D', 'X'],
+        [('B', 'A'), ('C', 'B'), ('C', 'X'), ('D', 'C')]
+    )
+
+    assert index.distances('A', ['A', 'B']) == {'A': 0, 'B': 1}
+    assert index.distances('A', ['A', 'B', 'C']) is None
+    assert index.distances('X', ['X', 'D']) is None
+
+
+def test_level_index_cycle():
+    index = LevelIndex.from_edges(['A', 'B', 'C', 'D'], [('B', 'A'), ('C', 'D'), ('D', 'C')])
+
+    assert index.distances('A', ['A', 'B', 'C', 'D']) == {'A': 0, 'B': 1, 'C': None, 'D': None}
+    assert not index.is_root('C')
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_precomputed_levels_match_computed_levels(seed):
+    rr = mk_rr(seed, 30)
+    g, compact = mk_graph(rr), mk_compact(rr)
+
+    for root in g.nodes:
+        component = g.induced(g.direct_component(root))
+        expected = Graph._level_computation(component, root)
+        actual = g.level_index.distances(root, component.nodes)
+        assert actual is None or actual == expected
+        assert compact.level_index.distances(root, component.nodes) == actual
@@ -0,0 +1,130 @@
+import bisect
+import threading
+from typing import Callable, Iterable, Tuple
+
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000)
+
+
+def _labels(labels: tuple, extra: tuple = ()) -> str:
+    labels = labels + extra
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, str(value).replace('\\', r'\\').replace('"', r'\"'))
+                          for name, value in labels) + '}'
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    Monotonically increasing value per set of labels.
+    """
+
+    kind = 'counter'
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self.values = {}
+
+    def inc(self, value: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        self.values[key] = self.values.get(key, 0) + value
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        for key, value in self.values.items():
+            yield self.name, _labels(key), value
+
+
+class Gauge:
+    """
+    Value that is read from a function whenever the metrics are rendered.
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, description: str, read: Callable[[], float]):
+        self.name = name
+        self.description = description
+        self.read = read
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        yield self.name, '', self.read()
+
+
+class Histogram:
+    """
+    Distribution of observed values per set of labels, counted in cumulative
+    buckets with the given upper bounds.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, description: str, buckets: tuple = SECONDS_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self.values = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        counts, total = self.values.get(key, (None, 0.0))
+        if counts is None:
+            counts = [0] * len(self.buckets)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.values[key] = counts, total + value
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        for key, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield self.name + '_bucket', _labels(key, (('le', _number(bound)),)), cumulative
+            yield self.name + '_sum', _labels(key), total
+            yield self.name + '_count', _labels(key), cumulative
+
+
+class Metrics:
+    """
+    Thread-safe registry of metrics that renders them in the Prometheus text
+    exposition format.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, description: str) -> Counter:
+        return self._register(Counter(name, description))
+
+    def gauge(self, name: str, description: str, read: Callable[[], float]) -> Gauge:
+        return self._register(Gauge(name, description, read))
+
+    def histogram(self, name: str, description: str, buckets: tuple = SECONDS_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, description, buckets))
+
+    def inc(self, counter: Counter, value: float = 1, **labels):
+        with self._lock:
+            counter.inc(value, **labels)
+
+    def observe(self, histogram: Histogram, value: float, **labels):
+        with self._lock:
+            histogram.observe(value, **labels)
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for metric in self._metrics:
+                lines.append('# HELP {} {}'.format(metric.name, metric.description))
+                lines.append('# TYPE {} {}'.format(metric.name, metric.kind))
+                lines.extend('{}{} {}'.format(name, labels, _number(value)) for name, labels, value in metric.samples())
+        return '\n'.join(lines) + '\n'
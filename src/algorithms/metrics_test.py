@@ -0,0 +1,39 @@
+from metrics import Metrics
+
+
+def test_render_prometheus_text_format():
+    metrics = Metrics()
+    requests = metrics.counter('requests_total', 'Requests by result')
+    seconds = metrics.histogram('request_seconds', 'Request duration', buckets=(0.1, 1.0))
+    metrics.gauge('version', 'Dataset version', lambda: 3)
+
+    metrics.inc(requests, result='hit')
+    metrics.inc(requests, result='hit')
+    metrics.inc(requests, result='miss')
+    for value in (0.05, 0.1, 0.5, 2.0):
+        metrics.observe(seconds, value, stage='build')
+
+    assert metrics.render().splitlines() == [
+        '# HELP requests_total Requests by result',
+        '# TYPE requests_total counter',
+        'requests_total{result="hit"} 2',
+        'requests_total{result="miss"} 1',
+        '# HELP request_seconds Request duration',
+        '# TYPE request_seconds histogram',
+        'request_seconds_bucket{stage="build",le="0.1"} 2',
+        'request_seconds_bucket{stage="build",le="1.0"} 3',
+        'request_seconds_bucket{stage="build",le="+Inf"} 4',
+        'request_seconds_sum{stage="build"} 2.65',
+        'request_seconds_count{stage="build"} 4',
+        '# HELP version Dataset version',
+        '# TYPE version gauge',
+        'version 3',
+    ]
+
+
+def test_label_values_are_escaped():
+    metrics = Metrics()
+    requests = metrics.counter('requests_total', 'Requests')
+    metrics.inc(requests, path='a"b\\c')
+
+    assert 'requests_total{path="a\\"b\\\\c"} 1' in metrics.render()
@@ -0,0 +1,96 @@
+from typing import Iterable, Iterator, Tuple
+
+import numpy as np
+import pandas as pd
+
+from algorithms.snapshot import Snapshot, find_lei, merge_names
+
+
+class NameStore:
+    """
+    Read-only LEI to legal name lookup. LEIs are kept as a sorted fixed-width
+    array which is searched binary, the names as one concatenated UTF-8 buffer
+    with offsets. When it is backed by a memory-mapped snapshot, all processes
+    that open the same file share its pages.
+    """
+
+    def __init__(self, leis: np.ndarray, offsets: np.ndarray, names: np.ndarray):
+        self.leis = leis
+        self.offsets = offsets
+        self.names = names
+
+    def __len__(self):
+        return int(np.count_nonzero(np.diff(self.offsets)))
+
+    def get_label(self, lei: str) -> str:
+        """
+        Returns the legal name of an entity, or None if it is not known.
+        """
+        i = find_lei(self.leis, lei)
+        if i is None:
+            return None
+        start, end = self.offsets[i], self.offsets[i + 1]
+        if start == end:
+            return None
+        return bytes(self.names[start:end]).decode()
+
+    def get_labels(self, leis: Iterable[str]) -> list:
+        """
+        Returns the legal names of many entities at once, None for unknown ones.
+        All LEIs are searched in one vectorized pass.
+        """
+        keys = np.array([lei.encode() for lei in leis], dtype='S')
+        if len(keys) == 0 or len(self.leis) == 0:
+            return [None] * len(keys)
+        positions = np.minimum(np.searchsorted(self.leis, keys), len(self.leis) - 1)
+        found = self.leis[positions] == keys
+        starts = np.where(found, self.offsets[positions], 0).tolist()
+        ends = np.where(found, self.offsets[positions + 1], 0).tolist()
+        names = self.names
+        return [bytes(names[start:end]).decode() if start != end else None for start, end in zip(starts, ends)]
+
+    def updated(self, names: dict) -> 'NameStore':
+        """
+        Returns a new name store with the given names (LEI to legal name, or None
+        to remove the name) changed. This store is not modified.
+        """
+        if not names:
+            return self
+        leis = np.union1d(self.leis, np.array([lei.encode() for lei in names], dtype='S'))
+        offsets, buffer = merge_names(self.leis, self.offsets, self.names, leis, names)
+        return NameStore(leis, offsets, buffer)
+
+    @staticmethod
+    def empty() -> 'NameStore':
+        return NameStore(np.array([], dtype='S1'), np.zeros(1, dtype=np.int64), np.array([], dtype=np.uint8))
+
+    @staticmethod
+    def from_records(records: Iterable[Tuple[str, str]]) -> 'NameStore':
+        """
+        Builds a name store from (LEI, legal name) pairs. The first name of a LEI wins.
+        """
+        records = [(lei, name) for lei, name in records if isinstance(name, str) and name]
+        leis = np.array([lei for lei, _ in records], dtype='S')
+        leis, first = np.unique(leis, return_index=True)
+        if len(leis) == 0:
+            return NameStore.empty()
+        encoded = [records[i][1].encode() for i in first.tolist()]
+        offsets = np.zeros(len(leis) + 1, dtype=np.int64)
+        np.cumsum([len(name) for name in encoded], out=offsets[1:])
+        return NameStore(leis, offsets, np.frombuffer(b''.join(encoded), dtype=np.uint8))
+
+    @staticmethod
+    def from_csv(f: str, chunksize: int = 100000) -> 'NameStore':
+        """
+        Builds a name store from the LEI csv file, reading it in chunks.
+        """
+        def iter_names() -> Iterator[Tuple[str, str]]:
+            reader = pd.read_csv(f, usecols=["LEI", "Entity.LegalName"], dtype=str, chunksize=chunksize)
+            for chunk in reader:
+                yield from zip(chunk["LEI"], chunk["Entity.LegalName"])
+
+        return NameStore.from_records(iter_names())
+
+    @staticmethod
+    def from_snapshot(snapshot: Snapshot) -> 'NameStore':
+        return NameStore(snapshot.leis, snapshot.name_offsets, snapshot.names)
@@ -0,0 +1,39 @@
+from os import path
+from names import NameStore
+from snapshot import Snapshot
+
+
+def test_name_store_from_snapshot():
+    snapshot = Snapshot.from_records(
+        [('LEI_1', 'LEI_2', 'IS_DIRECTLY_CONSOLIDATED_BY')],
+        [('LEI_1', 'company1'), ('LEI_3', 'Société 3')],
+    )
+    names = NameStore.from_snapshot(snapshot)
+
+    assert len(names) == 2
+    assert names.get_label('LEI_1') == 'company1'
+    assert names.get_label('LEI_3') == 'Société 3'
+    assert names.get_label('LEI_2') is None
+    assert names.get_label('LEI_NOT_FOUND') is None
+
+
+def test_name_store_from_csv(request):
+    names = NameStore.from_csv(path.join(request.config.rootdir, 'src/test_data', 'lei-test.csv'))
+
+    assert len(names) == 3
+    assert names.get_label('LEI_2') == 'company2'
+    assert names.get_labels(['LEI_3', 'LEI_NOT_FOUND', 'LEI_1', 'LEI_']) == ['company3', None, 'company1', None]
+    assert names.get_labels([]) == []
+
+
+def test_name_store_from_records():
+    names = NameStore.from_records([
+        ('LEI_B', 'first'),
+        ('LEI_A', 'Société A'),
+        ('LEI_B', 'second'),
+        ('LEI_C', float('nan')),
+    ])
+
+    assert len(names) == 2
+    assert names.get_labels(['LEI_A', 'LEI_B', 'LEI_C']) == ['Société A', 'first', None]
+    assert NameStore.empty().get_labels(['LEI_A']) == [None]
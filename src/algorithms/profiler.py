@@ -0,0 +1,79 @@
+import collections
+import os
+import sys
+import threading
+import time
+
+# innermost frames of threads that are waiting for work rather than running,
+# thread.py is the worker of concurrent.futures waiting for its queue
+IDLE_FILES = ('threading.py', 'selectors.py', 'thread.py')
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return '{}:{}:{}'.format(os.path.basename(code.co_filename), code.co_name, code.co_firstlineno)
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler that records the stacks of all threads of this process
+    every `interval` seconds from a background thread. Code that is profiled is
+    not instrumented, so the overhead is independent of how much Python code
+    runs, and it is safe to use on a live server. Threads that are waiting in
+    threading or selectors, i.e. idle workers and the event loop, are skipped,
+    as well as the thread that waits for the profile. Builds that run in worker
+    processes are not seen.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples = collections.Counter()
+        self.sampled = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._ignore = set()
+
+    def _sample(self):
+        ignore = self._ignore | {threading.get_ident()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id in ignore or os.path.basename(frame.f_code.co_filename) in IDLE_FILES:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            self.samples[';'.join(reversed(stack))] += 1
+        self.sampled += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def profile(self, seconds: float) -> 'SamplingProfiler':
+        """
+        Samples for the given number of seconds, blocking the calling thread.
+        """
+        self._ignore.add(threading.get_ident())
+        self.start()
+        time.sleep(seconds)
+        self.stop()
+        return self
+
+    def folded(self) -> str:
+        """
+        Returns the sampled stacks in the folded format of flamegraph.pl and
+        speedscope: one line per distinct stack, outermost frame first, followed
+        by the number of samples it was seen in.
+        """
+        return ''.join('{} {}\n'.format(stack, n) for stack, n in self.samples.most_common())
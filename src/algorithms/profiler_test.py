@@ -0,0 +1,30 @@
+import threading
+from profiler import SamplingProfiler
+
+
+def busy_loop(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def idle_wait(stop: threading.Event):
+    stop.wait()
+
+
+def test_profiler_samples_busy_threads():
+    stop = threading.Event()
+    threads = [threading.Thread(target=busy_loop, args=(stop,)), threading.Thread(target=idle_wait, args=(stop,))]
+    for thread in threads:
+        thread.start()
+    try:
+        profiler = SamplingProfiler(interval=0.001).profile(0.2)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    assert profiler.sampled > 0
+    lines = profiler.folded().splitlines()
+    stack, n = next(line for line in lines if 'busy_loop' in line).rsplit(' ', 1)
+    assert int(n) > 0 and stack.startswith('threading.py:_bootstrap')
+    assert not any('idle_wait' in line for line in lines)
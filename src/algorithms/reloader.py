@@ -0,0 +1,109 @@
+import gc
+import os
+import threading
+from typing import Callable, Iterable
+
+
+def file_signature(paths: Iterable[str]) -> tuple:
+    """
+    Identifies the state of a set of files by their modification times and sizes.
+    Missing files are part of the signature as well.
+    """
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            signature.append((path, None, None))
+    return tuple(signature)
+
+
+class DatasetReloader:
+    """
+    Loads a new version of the dataset in a background thread, while the current
+    one keeps serving, and hands it to `swap` once it is complete. `load` builds
+    a dataset from the data files and `swap` replaces the served dataset by
+    reference. Only one reload runs at a time.
+
+    With watch, the data files are polled and a reload is started whenever they
+    changed and were not modified any more for one interval, so files that are
+    still being written are not loaded.
+    """
+
+    def __init__(self, load: Callable, swap: Callable, paths: Iterable[str]):
+        self.load = load
+        self.swap = swap
+        self.paths = list(paths)
+        self.reloads = 0
+        self.last_error = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher = None
+
+    @property
+    def reloading(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def reload(self) -> bool:
+        """
+        Starts a reload in the background. Returns False if one is running already.
+        """
+        with self._lock:
+            if self.reloading:
+                return False
+            self._thread = threading.Thread(target=self._reload, name='dataset-reload', daemon=True)
+            self._thread.start()
+            return True
+
+    def _reload(self):
+        try:
+            self.swap(self.load())
+            self.reloads += 1
+            self.last_error = None
+        except Exception as e:
+            # the current dataset keeps serving if the new one can not be loaded
+            self.last_error = '{}: {}'.format(type(e).__name__, e)
+        # the old dataset is only referenced by requests that are still running,
+        # collect it once they are done instead of waiting for the next gc run
+        gc.collect()
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Waits for a running reload. Returns False if it did not finish in time.
+        """
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        return not self.reloading
+
+    def watch(self, interval: float):
+        """
+        Starts polling the data files every `interval` seconds.
+        """
+        def poll():
+            loaded = changed = file_signature(self.paths)
+            while not self._stop.wait(interval):
+                signature = file_signature(self.paths)
+                if signature != loaded and signature == changed and self.reload():
+                    loaded = signature
+                changed = signature
+
+        self._stop.clear()
+        self._watcher = threading.Thread(target=poll, name='dataset-watch', daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
+    def status(self) -> dict:
+        return {
+            'reloading': self.reloading,
+            'reloads': self.reloads,
+            'last_error': self.last_error,
+            'watching': self._watcher is not None,
+        }
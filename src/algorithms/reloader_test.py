@@ -0,0 +1,70 @@
+import threading
+import time
+from reloader import DatasetReloader, file_signature
+
+
+def test_reload_swaps_loaded_dataset():
+    swapped = []
+    reloader = DatasetReloader(lambda: 'dataset', swapped.append, [])
+
+    assert reloader.reload()
+    assert reloader.wait(5)
+    assert swapped == ['dataset']
+    assert reloader.status() == {'reloading': False, 'reloads': 1, 'last_error': None, 'watching': False}
+
+
+def test_reload_runs_once_at_a_time():
+    release = threading.Event()
+    swapped = []
+    reloader = DatasetReloader(lambda: release.wait(5) and 'dataset', swapped.append, [])
+
+    assert reloader.reload()
+    assert not reloader.reload()
+    assert reloader.status()['reloading']
+    release.set()
+    assert reloader.wait(5)
+    assert swapped == ['dataset']
+
+
+def test_failed_reload_keeps_current_dataset():
+    def load():
+        raise ValueError('broken file')
+
+    swapped = []
+    reloader = DatasetReloader(load, swapped.append, [])
+    reloader.reload()
+    reloader.wait(5)
+
+    assert swapped == []
+    assert reloader.status()['last_error'] == 'ValueError: broken file'
+
+
+def test_watch_reloads_changed_files(tmp_path):
+    path = tmp_path / 'gleif.snapshot'
+    path.write_text('v1')
+    swapped = []
+    reloader = DatasetReloader(lambda: path.read_text(), swapped.append, [str(path)])
+    reloader.watch(0.05)
+    try:
+        time.sleep(0.2)
+        assert swapped == []
+
+        path.write_text('v2 with more data')
+        for _ in range(100):
+            if swapped:
+                break
+            time.sleep(0.05)
+        reloader.wait(5)
+        assert swapped == ['v2 with more data']
+    finally:
+        reloader.stop()
+    assert not reloader.status()['watching']
+
+
+def test_file_signature(tmp_path):
+    path = tmp_path / 'data.csv'
+    missing = file_signature([str(path)])
+    path.write_text('data')
+
+    assert file_signature([str(path)]) != missing
+    assert file_signature([str(path)]) == file_signature([str(path)])
@@ -0,0 +1,352 @@
+import itertools
+import json
+import mmap
+import os
+import struct
+from typing import Iterable, Iterator, Tuple
+
+import numpy as np
+
+
+def _align(offset: int, alignment: int = 8) -> int:
+    return (offset + alignment - 1) // alignment * alignment
+
+
+def find_lei(leis: np.ndarray, lei: str) -> int:
+    """
+    Binary search for a LEI in a sorted fixed-width LEI array. Returns its
+    position, or None if it is not in the array.
+    """
+    key = lei.encode()
+    if len(key) > leis.dtype.itemsize:
+        return None
+    i = int(np.searchsorted(leis, key))
+    if i < len(leis) and leis[i] == key:
+        return i
+    return None
+
+
+def _chunks(records: Iterator[tuple], chunksize: int = 100000) -> Iterator[list]:
+    records = iter(records)
+    while True:
+        chunk = list(itertools.islice(records, chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _csr(n: int, keys: np.ndarray, values: np.ndarray, types: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Helper function to group edges by their key node. The original order of the
+    edges is kept within each group.
+    """
+    order = np.argsort(keys, kind='stable')
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=n), out=offsets[1:])
+    return offsets, values[order], types[order]
+
+
+def _spans(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    Helper function that returns the positions of all elements of the spans
+    [start, start + length), one span after the other.
+    """
+    ends = np.cumsum(lengths)
+    total = int(ends[-1]) if len(ends) else 0
+    return np.arange(total) - np.repeat(ends - lengths, lengths) + np.repeat(starts, lengths)
+
+
+def _encode(leis: Iterable[str]) -> np.ndarray:
+    return np.array([lei.encode() for lei in leis], dtype='S')
+
+
+def delta_path(path: str) -> str:
+    """
+    Returns the file next to a snapshot file that this process writes the
+    snapshot with its deltas applied to. Further deltas reuse the same file.
+    """
+    suffix = '.{}.delta'.format(os.getpid())
+    return path if path.endswith(suffix) else path + suffix
+
+
+def merge_names(leis: np.ndarray, offsets: np.ndarray, names: np.ndarray, new_leis: np.ndarray,
+                updates: dict) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Moves a name table (see Snapshot) onto a new sorted LEI table, which contains
+    all LEIs of the old one and of the updates, and applies the updates (LEI to
+    new name, or None to remove the name). Returns the new offsets and names.
+    Unchanged names are copied as one block of bytes, only the updated names
+    are encoded.
+    """
+    starts = np.zeros(len(new_leis), dtype=np.int64)
+    lengths = np.zeros(len(new_leis), dtype=np.int64)
+    positions = np.searchsorted(new_leis, leis)
+    starts[positions] = offsets[:-1]
+    lengths[positions] = np.diff(offsets)
+
+    # updated names are appended to the old buffer
+    encoded = [(name or '').encode() for name in updates.values()]
+    update_lengths = np.array([len(name) for name in encoded], dtype=np.int64)
+    positions = np.searchsorted(new_leis, _encode(updates))
+    starts[positions] = len(names) + np.cumsum(update_lengths) - update_lengths
+    lengths[positions] = update_lengths
+    buffer = np.concatenate([names, np.frombuffer(b''.join(encoded), dtype=np.uint8)])
+
+    new_offsets = np.zeros(len(new_leis) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=new_offsets[1:])
+    return new_offsets, buffer[_spans(starts, lengths)]
+
+
+class Snapshot:
+    """
+    Compact binary form of the GLEIF relationship and LEI files.
+
+    The file starts with a magic string and a JSON header describing the
+    sections, followed by the raw section arrays:
+
+        - leis: all LEIs of both files, sorted and fixed-width. The position of
+          a LEI in this table is its integer id.
+        - edge_start, edge_end, edge_type: one entry per relationship, in file
+          order. Nodes are LEI ids and the type is an index into the `types`
+          list of the header.
+        - name_offsets, names: the legal names as one concatenated UTF-8 buffer.
+          The name of LEI id i is names[name_offsets[i]:name_offsets[i + 1]],
+          an empty name means the LEI was not in the LEI file.
+        - out_offsets, out_targets, out_types: CSR adjacency of the outgoing
+          relationships. The relationships of LEI id i are at positions
+          out_offsets[i]:out_offsets[i + 1], in file order.
+        - in_offsets, in_sources, in_types: CSR adjacency of the incoming
+          relationships.
+
+    Opened snapshots are memory-mapped, so the arrays are read from the page
+    cache on demand instead of being parsed. Their path is kept, snapshots
+    built in memory have none.
+    """
+    MAGIC = b'GLEIFSNP'
+    VERSION = 2
+
+    def __init__(self, types: list, sections: dict, buffer=None, path: str = None):
+        self.types = types
+        self.sections = sections
+        self.path = path
+        self._buffer = buffer
+
+    def __getattr__(self, name: str):
+        try:
+            return self.__dict__['sections'][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __len__(self):
+        return len(self.leis)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.edge_start)
+
+    def lei(self, i: int) -> str:
+        return self.leis[i].decode()
+
+    def id_of(self, lei: str) -> int:
+        """
+        Returns the integer id of a LEI, or None if it is not part of the snapshot.
+        """
+        return find_lei(self.leis, lei)
+
+    def out_edges(self, i: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the targets and type codes of all relationships starting at LEI id i.
+        """
+        start, end = self.out_offsets[i], self.out_offsets[i + 1]
+        return self.out_targets[start:end], self.out_types[start:end]
+
+    def in_edges(self, i: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the sources and type codes of all relationships ending at LEI id i.
+        """
+        start, end = self.in_offsets[i], self.in_offsets[i + 1]
+        return self.in_sources[start:end], self.in_types[start:end]
+
+    def name(self, i: int) -> str:
+        """
+        Returns the legal name of a LEI id, or None if it has none.
+        """
+        start, end = self.name_offsets[i], self.name_offsets[i + 1]
+        if start == end:
+            return None
+        return bytes(self.names[start:end]).decode()
+
+    def iter_rr(self) -> Iterator[Tuple[str, str, str]]:
+        """
+        Yields all relationships as (start, end, type) tuples in file order.
+        """
+        leis = self.leis.astype(str).tolist()
+        for start, end, rel_type in zip(self.edge_start.tolist(), self.edge_end.tolist(), self.edge_type.tolist()):
+            yield leis[start], leis[end], self.types[rel_type]
+
+    def iter_names(self) -> Iterator[Tuple[str, str]]:
+        """
+        Yields all (LEI, legal name) pairs of LEIs that have a name.
+        """
+        offsets = self.name_offsets.tolist()
+        names = bytes(self.names)
+        for i, lei in enumerate(self.leis.astype(str).tolist()):
+            if offsets[i] != offsets[i + 1]:
+                yield lei, names[offsets[i]:offsets[i + 1]].decode()
+
+    def write(self, path: str):
+        """
+        Writes the snapshot to a file. It is written to a temporary file first
+        and then renamed, so processes that have the old file memory-mapped keep
+        reading the old data instead of a truncated file.
+        """
+        sections, offset = {}, 0
+        for name, array in self.sections.items():
+            sections[name] = {'offset': offset, 'dtype': array.dtype.str, 'count': len(array)}
+            offset = _align(offset + array.nbytes)
+        header = json.dumps({'version': self.VERSION, 'types': self.types, 'sections': sections}).encode()
+        data_start = _align(len(self.MAGIC) + 4 + len(header))
+
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            f.write(self.MAGIC)
+            f.write(struct.pack('<I', len(header)))
+            f.write(header)
+            for name, array in self.sections.items():
+                f.seek(data_start + sections[name]['offset'])
+                f.write(np.ascontiguousarray(array).tobytes())
+            f.truncate(data_start + offset)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def open(path: str) -> 'Snapshot':
+        """
+        Opens a snapshot file read-only via mmap. No section is copied into memory.
+        """
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if buffer[:len(Snapshot.MAGIC)] != Snapshot.MAGIC:
+            raise ValueError('{} is not a snapshot file'.format(path))
+        header_start = len(Snapshot.MAGIC) + 4
+        header_length, = struct.unpack('<I', buffer[len(Snapshot.MAGIC):header_start])
+        header = json.loads(buffer[header_start:header_start + header_length].decode())
+        if header['version'] != Snapshot.VERSION:
+            raise ValueError('Unsupported snapshot version {}'.format(header['version']))
+        data_start = _align(header_start + header_length)
+
+        sections = {
+            name: np.frombuffer(buffer, dtype=s['dtype'], count=s['count'], offset=data_start + s['offset'])
+            for name, s in header['sections'].items()
+        }
+        return Snapshot(header['types'], sections, buffer, path)
+
+    def updated(self, added: Iterable[Tuple[str, str, str]], removed: Iterable[Tuple[str, str, str]],
+                names: dict) -> 'Snapshot':
+        """
+        Returns a new in-memory snapshot with relationships added and removed,
+        and names updated as in merge_names. Removing a relationship removes all
+        its duplicates. Relationships that exist already are not added again.
+        The remaining relationships keep their order, added ones come last.
+        """
+        added, removed = list(added), list(removed)
+        added_starts, added_ends = _encode(r[0] for r in added), _encode(r[1] for r in added)
+        leis = np.unique(np.concatenate([self.leis, added_starts, added_ends, _encode(names)]))
+        types = list(self.types) + sorted({r[2] for r in added} - set(self.types))
+        codes = {rel_type: code for code, rel_type in enumerate(types)}
+
+        def keys(starts: np.ndarray, ends: np.ndarray, rel_types: np.ndarray) -> np.ndarray:
+            return (starts.astype(np.int64) * len(leis) + ends) * max(len(types), 1) + rel_types
+
+        remap = np.searchsorted(leis, self.leis).astype(np.int32)
+        edge_start, edge_end, edge_type = remap[self.edge_start], remap[self.edge_end], self.edge_type
+
+        # relationships with unknown LEIs or types can not be removed
+        removed = [r for r in removed if r[2] in codes]
+        removed_starts, removed_ends = _encode(r[0] for r in removed), _encode(r[1] for r in removed)
+        starts = np.minimum(np.searchsorted(leis, removed_starts), len(leis) - 1)
+        ends = np.minimum(np.searchsorted(leis, removed_ends), len(leis) - 1)
+        known = (leis[starts] == removed_starts) & (leis[ends] == removed_ends)
+        removed_keys = keys(starts, ends, np.array([codes[r[2]] for r in removed], dtype=np.int64))[known]
+        keep = ~np.isin(keys(edge_start, edge_end, edge_type), removed_keys)
+        edge_start, edge_end, edge_type = edge_start[keep], edge_end[keep], edge_type[keep]
+
+        starts = np.searchsorted(leis, added_starts).astype(np.int32)
+        ends = np.searchsorted(leis, added_ends).astype(np.int32)
+        rel_types = np.array([codes[r[2]] for r in added], dtype=np.uint8)
+        added_keys = keys(starts, ends, rel_types)
+        fresh = ~np.isin(added_keys, keys(edge_start, edge_end, edge_type))
+        _, first = np.unique(added_keys[fresh], return_index=True)
+        take = np.flatnonzero(fresh)[np.sort(first)]
+        edge_start = np.concatenate([edge_start, starts[take]])
+        edge_end = np.concatenate([edge_end, ends[take]])
+        edge_type = np.concatenate([edge_type, rel_types[take]])
+
+        name_offsets, name_buffer = merge_names(self.leis, self.name_offsets, self.names, leis, names)
+        out_offsets, out_targets, out_types = _csr(len(leis), edge_start, edge_end, edge_type)
+        in_offsets, in_sources, in_types = _csr(len(leis), edge_end, edge_start, edge_type)
+
+        return Snapshot(types, {
+            'leis': leis,
+            'edge_start': edge_start,
+            'edge_end': edge_end,
+            'edge_type': edge_type,
+            'name_offsets': name_offsets,
+            'names': name_buffer,
+            'out_offsets': out_offsets,
+            'out_targets': out_targets,
+            'out_types': out_types,
+            'in_offsets': in_offsets,
+            'in_sources': in_sources,
+            'in_types': in_types,
+        })
+
+    @staticmethod
+    def from_records(rr: Iterator[Tuple[str, str, str]], names: Iterator[Tuple[str, str]]) -> 'Snapshot':
+        """
+        Builds a snapshot from (start, end, type) relationships and (LEI, name) pairs.
+        """
+        starts, ends, rel_types = [], [], []
+        for chunk in _chunks(rr):
+            chunk_starts, chunk_ends, chunk_types = zip(*chunk)
+            starts.append(np.array(chunk_starts, dtype='S'))
+            ends.append(np.array(chunk_ends, dtype='S'))
+            rel_types.extend(chunk_types)
+        name_leis, legal_names = [], []
+        for lei, name in names:
+            name_leis.append(lei)
+            legal_names.append(name)
+
+        starts = np.concatenate(starts) if starts else np.array([], dtype='S')
+        ends = np.concatenate(ends) if ends else np.array([], dtype='S')
+        name_leis = np.array(name_leis, dtype='S')
+        leis = np.unique(np.concatenate([starts, ends, name_leis]))
+        types, type_codes = np.unique(np.array(rel_types, dtype=str), return_inverse=True)
+
+        # first name per LEI wins, LEIs without a name get an empty one
+        encoded = [b''] * len(leis)
+        for i, name in zip(np.searchsorted(leis, name_leis).tolist(), legal_names):
+            if not encoded[i] and isinstance(name, str):
+                encoded[i] = name.encode()
+        name_offsets = np.zeros(len(leis) + 1, dtype=np.int64)
+        np.cumsum([len(name) for name in encoded], out=name_offsets[1:])
+
+        edge_start = np.searchsorted(leis, starts).astype(np.int32)
+        edge_end = np.searchsorted(leis, ends).astype(np.int32)
+        edge_type = type_codes.astype(np.uint8)
+        out_offsets, out_targets, out_types = _csr(len(leis), edge_start, edge_end, edge_type)
+        in_offsets, in_sources, in_types = _csr(len(leis), edge_end, edge_start, edge_type)
+
+        return Snapshot(types.tolist(), {
+            'leis': leis,
+            'edge_start': edge_start,
+            'edge_end': edge_end,
+            'edge_type': edge_type,
+            'name_offsets': name_offsets,
+            'names': np.frombuffer(b''.join(encoded), dtype=np.uint8),
+            'out_offsets': out_offsets,
+            'out_targets': out_targets,
+            'out_types': out_types,
+            'in_offsets': in_offsets,
+            'in_sources': in_sources,
+            'in_types': in_types,
+        })
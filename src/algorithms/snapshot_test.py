@@ -0,0 +1,69 @@
+import pytest
+from snapshot import Snapshot
+
+
+@pytest.fixture
+def snapshot():
+    return Snapshot.from_records(
+        [
+            ('LEI_1', 'LEI_2', 'IS_DIRECTLY_CONSOLIDATED_BY'),
+            ('LEI_1', 'LEI_3', 'IS_ULTIMATELY_CONSOLIDATED_BY'),
+            ('LEI_2', 'LEI_3', 'IS_DIRECTLY_CONSOLIDATED_BY'),
+        ],
+        [
+            ('LEI_1', 'company1'),
+            ('LEI_3', 'Société 3'),
+            ('LEI_4', 'company4'),
+            ('LEI_4', 'duplicate'),
+        ],
+    )
+
+
+def test_snapshot_from_records(snapshot):
+    assert len(snapshot) == 4
+    assert snapshot.edge_count == 3
+    assert snapshot.lei(0) == 'LEI_1'
+    assert snapshot.id_of('LEI_3') == 2
+    assert snapshot.id_of('LEI_NOT_FOUND') is None
+
+    assert snapshot.name(snapshot.id_of('LEI_1')) == 'company1'
+    assert snapshot.name(snapshot.id_of('LEI_2')) is None
+    assert snapshot.name(snapshot.id_of('LEI_4')) == 'company4'
+
+
+def test_snapshot_roundtrip(snapshot, tmp_path):
+    path = str(tmp_path / 'gleif.snapshot')
+    snapshot.write(path)
+    loaded = Snapshot.open(path)
+
+    assert loaded.types == snapshot.types
+    assert list(loaded.iter_rr()) == [
+        ('LEI_1', 'LEI_2', 'IS_DIRECTLY_CONSOLIDATED_BY'),
+        ('LEI_1', 'LEI_3', 'IS_ULTIMATELY_CONSOLIDATED_BY'),
+        ('LEI_2', 'LEI_3', 'IS_DIRECTLY_CONSOLIDATED_BY'),
+    ]
+    assert list(loaded.iter_names()) == [
+        ('LEI_1', 'company1'),
+        ('LEI_3', 'Société 3'),
+        ('LEI_4', 'company4'),
+    ]
+
+
+def test_write_keeps_open_snapshots_readable(snapshot, tmp_path):
+    path = str(tmp_path / 'gleif.snapshot')
+    snapshot.write(path)
+    loaded = Snapshot.open(path)
+
+    Snapshot.from_records([('LEI_9', 'LEI_8', 'IS_DIRECTLY_CONSOLIDATED_BY')], []).write(path)
+
+    assert loaded.lei(0) == 'LEI_1'
+    assert list(Snapshot.open(path).iter_rr()) == [('LEI_9', 'LEI_8', 'IS_DIRECTLY_CONSOLIDATED_BY')]
+    assert len(list(tmp_path.iterdir())) == 1
+
+
+def test_open_rejects_other_files(tmp_path):
+    path = tmp_path / 'other.csv'
+    path.write_bytes(b'LEI,Entity.LegalName\n')
+
+    with pytest.raises(ValueError):
+        Snapshot.open(str(path))
@@ -0,0 +1,148 @@
+import csv
+import random
+from typing import List, Tuple
+
+from algorithms.graph import RR
+
+RR_HEADER = (
+    'Relationship.StartNode.NodeID', 'Relationship.StartNode.NodeIDType',
+    'Relationship.EndNode.NodeID', 'Relationship.EndNode.NodeIDType',
+    'Relationship.RelationshipType', 'Relationship.RelationshipStatus',
+    'Registration.InitialRegistrationDate', 'Registration.LastUpdateDate', 'Registration.RegistrationStatus',
+    'Registration.NextRenewalDate', 'Registration.ManagingLOU', 'Registration.ValidationSources',
+    'Registration.ValidationDocuments', 'Registration.ValidationReference',
+) + tuple(
+    'Relationship.Period.{}.{}'.format(i, field) for i in range(1, 6) for field in ('startDate', 'endDate', 'periodType')
+) + tuple(
+    'Relationship.Qualifiers.{}.{}'.format(i, field) for i in range(1, 6)
+    for field in ('QualifierDimension', 'QualifierCategory')
+) + tuple(
+    'Relationship.Qualifiers.{}.{}'.format(i, field) for i in range(1, 6)
+    for field in ('MeasurementMethod', 'QuantifierAmount', 'QuantifierUnits')
+)
+
+# values of the remaining columns, as in a typical row of the golden copy
+RR_TEMPLATE = {
+    'Relationship.StartNode.NodeIDType': 'LEI',
+    'Relationship.EndNode.NodeIDType': 'LEI',
+    'Registration.InitialRegistrationDate': '2012-11-29T16:33:00.000Z',
+    'Registration.LastUpdateDate': '2019-06-18T14:32:00.000Z',
+    'Registration.RegistrationStatus': 'PUBLISHED',
+    'Registration.NextRenewalDate': '2020-06-14T10:17:00.000Z',
+    'Registration.ManagingLOU': 'EVK05KS7XY1DEII3R011',
+    'Registration.ValidationSources': 'ENTITY_SUPPLIED_ONLY',
+    'Registration.ValidationDocuments': 'SUPPORTING_DOCUMENTS',
+    'Relationship.Period.1.startDate': '2017-01-01T00:00:00.000Z',
+    'Relationship.Period.1.endDate': '2017-12-31T00:00:00.000Z',
+    'Relationship.Period.1.periodType': 'ACCOUNTING_PERIOD',
+    'Relationship.Period.2.startDate': '2018-06-15T00:00:00.000Z',
+    'Relationship.Period.2.periodType': 'RELATIONSHIP_PERIOD',
+    'Relationship.Qualifiers.1.QualifierDimension': 'ACCOUNTING_STANDARD',
+}
+
+
+class SyntheticGleif:
+    """
+    Generator for GLEIF-shaped relationship and LEI data, so that benchmarks
+    run without the golden copy. Every group of companies is a hierarchy below
+    one ultimate parent, with direct relationships to the direct parent and
+    ultimate relationships to the root, as in the golden copy. Most groups are
+    small random trees. Some are deep chains or wide fan-outs, some contain
+    international branches or a cycle, and some relationships are inactive.
+    The output only depends on the parameters and the seed.
+    """
+
+    def __init__(self, groups: int = 1000, seed: int = 0, max_fanout: int = 8, deep_rate: float = 0.01,
+                 deep_depth: int = 50, wide_rate: float = 0.005, wide_fanout: int = 2000, branch_rate: float = 0.05,
+                 cycle_rate: float = 0.01, inactive_rate: float = 0.02, name_rate: float = 0.95):
+        self.groups = groups
+        self.seed = seed
+        self.max_fanout = max_fanout
+        self.deep_rate = deep_rate
+        self.deep_depth = deep_depth
+        self.wide_rate = wide_rate
+        self.wide_fanout = wide_fanout
+        self.branch_rate = branch_rate
+        self.cycle_rate = cycle_rate
+        self.inactive_rate = inactive_rate
+        self.name_rate = name_rate
+
+    def generate(self) -> Tuple[List[tuple], List[Tuple[str, str]]]:
+        """
+        Returns the relationships as (start, end, type, status) tuples and the
+        (LEI, legal name) pairs.
+        """
+        r = random.Random(self.seed)
+        rr, leis = [], []
+
+        def new_lei() -> str:
+            leis.append('SYN{:017d}'.format(len(leis)))
+            return leis[-1]
+
+        def relate(start: str, end: str, rel_type: str):
+            rr.append((start, end, rel_type, 'INACTIVE' if r.random() < self.inactive_rate else 'ACTIVE'))
+
+        for _ in range(self.groups):
+            root = new_lei()
+            members = [root]
+            kind = r.random()
+            if kind < self.deep_rate:
+                parent = root
+                for _ in range(self.deep_depth):
+                    child = new_lei()
+                    relate(child, parent, RR.DIRECT)
+                    relate(child, root, RR.ULTIMATE)
+                    members.append(child)
+                    parent = child
+            elif kind < self.deep_rate + self.wide_rate:
+                for _ in range(self.wide_fanout):
+                    child = new_lei()
+                    relate(child, root, RR.DIRECT)
+                    relate(child, root, RR.ULTIMATE)
+                    members.append(child)
+            else:
+                level = [root]
+                depth = 0
+                while level:
+                    children = []
+                    for parent in level:
+                        for _ in range(r.randint(0, self.max_fanout >> depth)):
+                            child = new_lei()
+                            relate(child, parent, RR.DIRECT)
+                            relate(child, root, RR.ULTIMATE)
+                            children.append(child)
+                    members.extend(children)
+                    level = children
+                    depth += 1
+
+            if r.random() < self.branch_rate:
+                for _ in range(r.randint(1, 3)):
+                    relate(new_lei(), r.choice(members), RR.BRANCH)
+            if len(members) > 1 and r.random() < self.cycle_rate:
+                relate(root, r.choice(members[1:]), RR.DIRECT)
+
+        names = [
+            (lei, 'Synthetic Holding {}, Ltd.'.format(i) if i % 7 == 0 else 'Synthetic Company {}'.format(i))
+            for i, lei in enumerate(leis) if r.random() < self.name_rate
+        ]
+        return rr, names
+
+    def write_csv(self, rr_path: str, lei_path: str) -> Tuple[int, int]:
+        """
+        Writes the data in the format of the csv files in the data directory.
+        Returns the number of relationships and names written.
+        """
+        rr, names = self.generate()
+        template = [RR_TEMPLATE.get(column, '') for column in RR_HEADER]
+        with open(rr_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(RR_HEADER)
+            for start, end, rel_type, status in rr:
+                row = list(template)
+                row[0], row[2], row[4], row[5] = start, end, rel_type, status
+                writer.writerow(row)
+        with open(lei_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(('LEI', 'Entity.LegalName'))
+            writer.writerows(names)
+        return len(rr), len(names)
@@ -0,0 +1,39 @@
+import csv
+import networkx as nx
+from graph import Graph, RR
+from synthetic import RR_HEADER, SyntheticGleif
+
+
+def test_generate_is_deterministic():
+    assert SyntheticGleif(groups=200, seed=3).generate() == SyntheticGleif(groups=200, seed=3).generate()
+    assert SyntheticGleif(groups=200, seed=3).generate() != SyntheticGleif(groups=200, seed=4).generate()
+
+
+def test_generate_shapes():
+    generator = SyntheticGleif(groups=300, seed=1, deep_rate=0.05, deep_depth=30, wide_rate=0.02, wide_fanout=500,
+                               cycle_rate=0.05)
+    rr, names = generator.generate()
+    direct = nx.DiGraph([(start, end) for start, end, rel_type, _ in rr if rel_type == RR.DIRECT])
+
+    assert {rel_type for _, _, rel_type, _ in rr} == {RR.DIRECT, RR.ULTIMATE, RR.BRANCH}
+    assert {status for _, _, _, status in rr} == {'ACTIVE', 'INACTIVE'}
+    assert max(d for _, d in direct.in_degree()) >= 500
+    assert any(True for _ in nx.simple_cycles(direct))
+    assert max(len(nx.descendants(direct, node)) for node in direct if direct.in_degree(node) == 0) >= 30
+    assert 0 < len(names) < len({lei for start, end, _, _ in rr for lei in (start, end)})
+
+
+def test_write_csv_loads_as_graph(tmp_path):
+    rr_path, lei_path = str(tmp_path / 'rr.csv'), str(tmp_path / 'lei.csv')
+    relationships, names = SyntheticGleif(groups=50, seed=2).write_csv(rr_path, lei_path)
+
+    with open(rr_path) as f:
+        rows = list(csv.reader(f))
+    assert tuple(rows[0]) == RR_HEADER
+    assert len(rows) == relationships + 1
+
+    g = Graph.from_csv(rr_path)
+    assert len(g.edges) > 0
+    Graph.set_lookup_table(lei_path)
+    assert Graph.lookup_table is not None
+    assert names > 0
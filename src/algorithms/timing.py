@@ -0,0 +1,109 @@
+import threading
+import time
+
+# the timings of the request that is processed in the current thread; activate
+# blocks never await, so coroutines on the event loop can not interleave within
+# them and a thread-local is enough
+_local = threading.local()
+
+
+def _current() -> 'Timings':
+    return getattr(_local, 'timings', None)
+
+
+class Timings:
+    """
+    Collects the durations of the stages of a request in seconds, counts of what
+    was processed (e.g. nodes and edges) and short notes (e.g. whether the cache
+    was hit). Code that runs while the timings are active records its stages
+    with `stage`, so the timings do not need to be passed down. Timings are
+    plain data and can be sent back from worker processes.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.counts = {}
+        self.notes = {}
+
+    def add(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def update(self, other: 'Timings'):
+        """
+        Adds the stages of other timings to these, and takes over their counts
+        and notes.
+        """
+        for name, seconds in other.stages.items():
+            self.add(name, seconds)
+        self.counts.update(other.counts)
+        self.notes.update(other.notes)
+
+    def server_timing(self) -> str:
+        """
+        Formats the timings as the value of a Server-Timing header, with
+        durations in milliseconds. Counts and notes are sent as descriptions.
+        """
+        entries = ['{};dur={:.3f}'.format(name, seconds * 1000) for name, seconds in self.stages.items()]
+        entries += ['{};desc="{}"'.format(name, value) for name, value in self.notes.items()]
+        entries += ['{};desc={}'.format(name, value) for name, value in self.counts.items()]
+        return ', '.join(entries)
+
+
+class _Activation:
+    __slots__ = ('timings', 'previous')
+
+    def __init__(self, timings: Timings):
+        self.timings = timings
+
+    def __enter__(self) -> Timings:
+        if self.timings is not None:
+            self.previous = _current()
+            _local.timings = self.timings
+        return self.timings
+
+    def __exit__(self, *exc):
+        if self.timings is not None:
+            _local.timings = self.previous
+
+
+class _Stage:
+    __slots__ = ('name', 'timings', 'start')
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.timings = _current()
+        if self.timings is not None:
+            self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        if self.timings is not None:
+            self.timings.add(self.name, time.perf_counter() - self.start)
+
+
+def activate(timings: Timings) -> _Activation:
+    """
+    Makes the given timings the active ones of the current thread within a with
+    block, so that stages are recorded to them. Nothing is recorded if timings
+    is None. The block must not await, as other tasks on the same thread would
+    record to these timings meanwhile.
+    """
+    return _Activation(timings)
+
+
+def stage(name: str) -> _Stage:
+    """
+    Records the duration of a with block as the given stage of the active
+    timings. Without active timings this only costs a thread-local lookup.
+    """
+    return _Stage(name)
+
+
+def count(name: str, value: int):
+    """
+    Records a count on the active timings, if there are any.
+    """
+    timings = _current()
+    if timings is not None:
+        timings.counts[name] = value
@@ -0,0 +1,63 @@
+import threading
+from timing import Timings, activate, count, stage
+
+
+def test_stages_are_recorded_to_active_timings():
+    timings = Timings()
+    with activate(timings):
+        with stage('build'):
+            pass
+        with stage('build'):
+            count('nodes', 3)
+        with stage('levels'):
+            pass
+
+    assert list(timings.stages) == ['build', 'levels']
+    assert timings.counts == {'nodes': 3}
+    with stage('outside'):
+        count('edges', 1)
+    assert 'outside' not in timings.stages and 'edges' not in timings.counts
+
+
+def test_activation_is_per_thread():
+    timings = Timings()
+
+    def other():
+        with stage('other'):
+            pass
+
+    with activate(timings):
+        thread = threading.Thread(target=other)
+        thread.start()
+        thread.join()
+    assert timings.stages == {}
+
+
+def test_nested_activation_restores_outer_timings():
+    outer, inner = Timings(), Timings()
+    with activate(outer):
+        with activate(inner):
+            with stage('inner'):
+                pass
+        with stage('outer'):
+            pass
+    assert list(inner.stages) == ['inner'] and list(outer.stages) == ['outer']
+
+
+def test_activate_without_timings():
+    with activate(None):
+        with stage('build'):
+            count('nodes', 1)
+
+
+def test_update_and_server_timing():
+    timings = Timings()
+    timings.add('cache', 0.001)
+    other = Timings()
+    other.add('cache', 0.0005)
+    other.add('build', 0.25)
+    other.counts['nodes'] = 12
+    other.notes['cache'] = 'miss'
+    timings.update(other)
+
+    assert timings.server_timing() == 'cache;dur=1.500, build;dur=250.000, cache;desc="miss", nodes;desc=12'
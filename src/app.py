@@ -1,9 +1,27 @@
+import asyncio
+import collections
 import os
-from fastapi import FastAPI
+import secrets
+import threading
+import time
+from typing import List
+
+from fastapi import Body, FastAPI, Header, HTTPException, Query
 from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
 
-from algorithms.graph import Graph
+from algorithms.anomalies import NAMES as ANOMALIES
+from algorithms.cache import StructureCache
+from algorithms.dataset import Dataset
+from algorithms.delta import Delta
+from algorithms.encoding import FORMATS, accepted_compression, compress, dumps
+from algorithms.executor import Overloaded, StructureExecutor
+from algorithms.export import iter_structures_ndjson
+from algorithms.metrics import SIZE_BUCKETS, Metrics
+from algorithms.profiler import SamplingProfiler
+from algorithms.reloader import DatasetReloader
 from algorithms.graph_builder import DirectNodeGraphWithParentNetworkBuilder as Builder
+from algorithms.timing import Timings, activate, stage
 
 origins = ["*"]
 
@@ -12,27 +30,454 @@ api.add_middleware(
     CORSMiddleware, allow_origins=origins, allow_methods=["*"], allow_headers=["*"]
 )
 ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
-DATA_PATH = os.path.join(ROOT_DIR, "data")
+DATA_PATH = os.environ.get("DATA_PATH", os.path.join(ROOT_DIR, "data"))
 
 relationship_data_path = os.path.join(DATA_PATH, "gleif_rr.csv")
 lei_lookup_data_path = os.path.join(DATA_PATH, "gleif_lei.csv")
+snapshot_data_path = os.path.join(DATA_PATH, "gleif.snapshot")
+
+
+def load_dataset() -> Dataset:
+    return Dataset.load(relationship_data_path, lei_lookup_data_path, snapshot_data_path)
+
+
+# the served dataset is only ever replaced as a whole, requests read it once and
+# keep using that version. Its version is part of every cache key.
+dataset = load_dataset()
+update_lock = threading.Lock()
+structure_cache = StructureCache(max_bytes=int(os.environ.get("STRUCTURE_CACHE_BYTES", 256 * 1024 * 1024)))
+# structure builds run off the event loop, see StructureExecutor for the STRUCTURE_* settings
+structure_executor = StructureExecutor.from_env(dataset.network, os.environ)
+batch_max_leis = int(os.environ.get("BATCH_MAX_LEIS", 100000))
+# structures of a batch that are built at the same time
+batch_concurrency = int(os.environ.get("BATCH_CONCURRENCY", 8))
+# smaller structures are sent uncompressed, as compression would not pay off
+compress_min_bytes = int(os.environ.get("COMPRESS_MIN_BYTES", 1024))
+admin_token = os.environ.get("ADMIN_TOKEN")
+
+metrics = Metrics()
+structure_requests = metrics.counter("gleif_structure_requests_total", "Structure requests by result")
+structure_seconds = metrics.histogram("gleif_structure_request_seconds", "Time to answer structure requests")
+structure_stage_seconds = metrics.histogram(
+    "gleif_structure_stage_seconds", "Time spent in the stages of structure requests"
+)
+hierarchy_seconds = metrics.histogram(
+    "gleif_hierarchy_request_seconds", "Time to answer ancestor, descendant and common parent requests"
+)
+structure_nodes = metrics.histogram("gleif_structure_nodes", "Nodes of built structures", SIZE_BUCKETS)
+structure_edges = metrics.histogram("gleif_structure_edges", "Edges of built structures", SIZE_BUCKETS)
+metrics.gauge("gleif_structure_cache_bytes", "Approximate size of the structure cache", lambda: structure_cache.bytes)
+metrics.gauge("gleif_structure_cache_entries", "Structures in the cache", lambda: len(structure_cache))
+for stat in ("hits", "misses", "evictions"):
+    metrics.gauge("gleif_structure_cache_{}".format(stat), "Structure cache {} since the start".format(stat),
+                  lambda stat=stat: structure_cache.stats()[stat])
+metrics.gauge("gleif_structure_builds_pending", "Queued and running structure builds",
+              lambda: structure_executor.pending)
+metrics.gauge("gleif_dataset_version", "Version of the served dataset", lambda: dataset.version)
+for anomaly in ANOMALIES.values():
+    metrics.gauge("gleif_dataset_{}_nodes".format(anomaly), "Nodes of the served dataset with {}".format(anomaly),
+                  lambda anomaly=anomaly: dataset.network.anomaly_index.counts()[anomaly])
+
+
+def apply_delta(delta: Delta) -> Dataset:
+    """
+    Applies a delta to the served dataset. The next version is built while the
+    current one keeps serving, then cached structures that are not affected by
+    the delta are moved over and the new version is swapped in at once.
+    """
+    global dataset
+    with update_lock:
+        current = dataset
+        updated = current.apply_delta(delta)
+        structure_executor.replace(updated.network)
+        structure_cache.rekey(current.migrate_key(updated, delta))
+        dataset = updated
+    return updated
+
+
+def swap_dataset(loaded: Dataset):
+    """
+    Swaps in a freshly loaded dataset as the next version. The old one is freed
+    once the requests that still use it are done.
+    """
+    global dataset
+    with update_lock:
+        updated = Dataset(loaded.network, dataset.version + 1)
+        structure_executor.replace(updated.network)
+        structure_cache.rekey(lambda key: None)
+        dataset = updated
+
+
+dataset_reloader = DatasetReloader(
+    load_dataset, swap_dataset, [snapshot_data_path, relationship_data_path, lei_lookup_data_path]
+)
+
+
+def check_admin_token(token: str):
+    if not admin_token:
+        raise HTTPException(status_code=403, detail="admin endpoints are disabled, set ADMIN_TOKEN")
+    if token is None or not secrets.compare_digest(token, admin_token):
+        raise HTTPException(status_code=403, detail="invalid admin token")
+
+
+def data_file(name: str) -> str:
+    """
+    Resolves the name of a file in the data directory.
+    """
+    path = os.path.realpath(os.path.join(DATA_PATH, name))
+    if os.path.dirname(path) != os.path.realpath(DATA_PATH) or not os.path.isfile(path):
+        raise HTTPException(status_code=400, detail="{} is not a file in the data directory".format(name))
+    return path
+
+
+@api.on_event("startup")
+def start_dataset_watcher():
+    interval = float(os.environ.get("DATA_WATCH_INTERVAL", 0))
+    if interval > 0:
+        dataset_reloader.watch(interval)
+
+
+@api.on_event("shutdown")
+def shutdown_structure_executor():
+    dataset_reloader.stop()
+    structure_executor.shutdown(wait=False)
+
+
+def record_timings(timings: Timings, result: str):
+    """
+    Adds the timings of a structure request to the metrics. Sizes are only
+    recorded for structures that were built, not for cache hits.
+    """
+    metrics.inc(structure_requests, result=result)
+    # a build that timed out in a worker thread may still be adding stages
+    for name, seconds in list(timings.stages.items()):
+        metrics.observe(structure_stage_seconds, seconds, stage=name)
+    if "nodes" in timings.counts and timings.notes.get("cache") == "miss":
+        metrics.observe(structure_nodes, timings.counts["nodes"])
+        metrics.observe(structure_edges, timings.counts["edges"])
+
+
+def structure_format(format: str, accept: str) -> str:
+    """
+    Picks the wire format of a structure response from the format query
+    parameter, or else from the Accept header.
+    """
+    if format is not None:
+        if format not in FORMATS:
+            raise HTTPException(status_code=400, detail="format must be one of {}".format(", ".join(FORMATS)))
+        return format
+    if accept and FORMATS["compact"] in accept:
+        return "compact"
+    return "full"
 
-glei_network = Graph.from_csv(f=relationship_data_path, limit=None)
-Graph.set_lookup_table(f=lei_lookup_data_path)
+
+async def get_or_compress(key: tuple, data: bytes, compression: str, timings: Timings) -> bytes:
+    """
+    Returns a payload compressed with the given content encoding. Compressed
+    payloads are cached next to the uncompressed ones, and compressed in a
+    worker thread on a miss.
+    """
+    key = key + (compression,)
+    value = structure_cache.get(key)
+    if value is None:
+        start = time.perf_counter()
+        value = await asyncio.get_event_loop().run_in_executor(None, compress, data, compression)
+        timings.add("compress", time.perf_counter() - start)
+        structure_cache.put(key, value)
+    return value
 
 
 @api.get("/company/{node_id}/structure")
-def get_company_structure(node_id: str):
+async def get_company_structure(node_id: str, format: str = Query(None), max_depth: int = Query(None, ge=0),
+                                max_nodes: int = Query(None, ge=1), expand: str = Query(None),
+                                accept: str = Header(None), accept_encoding: str = Header(None)):
     """
     This endpoint returns the complete holding structure based on a single node id.
+    Structures are encoded as json when they are built and cached encoded, so
+    they are sent as they are. The time spent in each stage is sent in the
+    Server-Timing header.
+
+    With format=compact, or the media type application/vnd.gleif.structure.compact+json
+    in the Accept header, the structure is sent in the compact format of
+    algorithms.encoding.compact_structure. Large structures are compressed
+    with brotli or gzip if the client accepts it.
+
+    With max_depth or max_nodes, only the top levels of the structure are built
+    and sent, together with the path from the node up to the root. Every node
+    has a "truncated" flag that tells whether some of its children were left
+    out, and they can be loaded with expand=<id of that node>.
+    :param node_id:
+    :param format: full (default) or compact
+    :param max_depth: number of levels below the root, or below expand
+    :param max_nodes: maximum number of nodes below the root, the path from the node up to the root is added on top
+    :param expand: id of a node of the structure to load the levels below
+    :return:
+    """
+    start = time.perf_counter()
+    timings = Timings()
+    wire_format = structure_format(format, accept)
+    current = dataset
+    key = Builder().structure_key(current.network, node_id) + (current.version, wire_format)
+    limits = None
+    if max_depth is not None or max_nodes is not None or expand is not None:
+        if expand is not None and not Builder().in_structure(current.network, node_id, expand):
+            raise HTTPException(status_code=400, detail="{} is not part of the structure".format(expand))
+        limits = {"max_depth": max_depth, "max_nodes": max_nodes, "expand": expand}
+        # parts of structures include the path of the node, so they are cached per node
+        key += (max_depth, max_nodes, expand, node_id)
+    try:
+        structure = await structure_executor.get_or_build(structure_cache, key, node_id, timings, wire_format,
+                                                          limits, current.network)
+    except Overloaded:
+        record_timings(timings, "overloaded")
+        raise HTTPException(status_code=503, detail="too many pending structure requests")
+    except asyncio.TimeoutError:
+        record_timings(timings, "timeout")
+        raise HTTPException(status_code=504, detail="building the structure timed out")
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    compression = accepted_compression(accept_encoding) if len(structure) >= compress_min_bytes else None
+    if compression is not None:
+        structure = await get_or_compress(key, structure, compression, timings)
+        headers["Content-Encoding"] = compression
+    record_timings(timings, timings.notes["cache"])
+    timings.add("total", time.perf_counter() - start)
+    metrics.observe(structure_seconds, timings.stages["total"])
+    headers["Server-Timing"] = timings.server_timing()
+    return Response(structure, media_type=FORMATS[wire_format], headers=headers)
+
+
+def hierarchy_response(query: str, build) -> Response:
+    """
+    Answers an ancestor, descendant or common parent query with the result of
+    build and records its timings.
+    """
+    start = time.perf_counter()
+    timings = Timings()
+    with activate(timings):
+        payload = build(Builder(), dataset.network)
+        with stage("encode"):
+            data = dumps(payload)
+    timings.add("total", time.perf_counter() - start)
+    metrics.observe(hierarchy_seconds, timings.stages["total"], query=query)
+    return Response(data, media_type="application/json", headers={"Server-Timing": timings.server_timing()})
+
+
+@api.get("/company/{node_id}/ancestors")
+def get_company_ancestors(node_id: str):
+    """
+    This endpoint returns the direct parents of a node up to the root of its
+    hierarchy, nearest first, without building the holding structure:
+
+        {"id": "...", "ancestors": [{"id": "...", "label": "...", "depth": 1}, ...], "cycle": false}
+
+    If the direct parents form a cycle, the chain stops before it repeats and
+    cycle is true.
+    :param node_id:
+    :return:
+    """
+    return hierarchy_response("ancestors", lambda builder, network: builder.ancestors(network, node_id))
+
+
+@api.get("/company/{node_id}/descendants")
+def get_company_descendants(node_id: str, max_depth: int = Query(None, ge=0), max_nodes: int = Query(None, ge=1)):
+    """
+    This endpoint returns the direct descendants of a node breadth first,
+    without building the holding structure:
+
+        {"id": "...", "descendants": [{"id": "...", "label": "...", "parent": "...", "depth": 1}, ...],
+         "truncated": false}
+
     :param node_id:
+    :param max_depth: number of levels below the node
+    :param max_nodes: maximum number of descendants
     :return:
     """
-    builder = Builder()
-    parent_graph, parent_node = builder.build(glei_network, node_id)
+    return hierarchy_response(
+        "descendants", lambda builder, network: builder.descendants(network, node_id, max_depth, max_nodes)
+    )
 
-    if parent_node is None:
-        # no ultimate parent 
-        return parent_graph.set_levels(node_id).to_array()
-    else: 
-        return parent_graph.set_levels(parent_node).to_array()
+
+def check_groups(groups: List[List[str]]):
+    """
+    Rejects common parent queries with groups of less than two LEIs or with
+    more LEIs than a batch may have.
+    """
+    if any(len(group) < 2 for group in groups):
+        raise HTTPException(status_code=400, detail="every group needs at least two LEIs")
+    if sum(len(group) for group in groups) > batch_max_leis:
+        raise HTTPException(status_code=413, detail="at most {} LEIs per request".format(batch_max_leis))
+
+
+@api.get("/group/common-parent")
+def get_common_parent(lei: List[str] = Query(...)):
+    """
+    This endpoint tells whether the given LEIs belong to the same corporate group
+    and returns their closest shared direct parent, without building any
+    structure, e.g. /group/common-parent?lei=A&lei=B:
+
+        {"leis": ["A", "B"], "same_group": true, "common_parent": {"id": "...", "label": "..."}}
+
+    If one of the LEIs is a direct parent of the others, it is the common
+    parent. LEIs of the same group can have no common direct parent, in which
+    case common_parent is null.
+    :param lei: two or more LEIs
+    :return:
+    """
+    check_groups([lei])
+    return hierarchy_response("common_parent", lambda builder, network: builder.common_parents(network, [lei])[0])
+
+
+@api.post("/group/common-parent")
+def get_common_parents(groups: List[List[str]] = Body(..., embed=True)):
+    """
+    This endpoint answers many common parent queries at once. The body is
+    {"groups": [["A", "B"], ["C", "D", "E"], ...]}, and the result has one entry
+    per group, as returned by GET /group/common-parent:
+
+        {"results": [{"leis": ["A", "B"], "same_group": true, "common_parent": {...}}, ...]}
+
+    :param groups:
+    :return:
+    """
+    check_groups(groups)
+    return hierarchy_response(
+        "common_parent", lambda builder, network: {"results": builder.common_parents(network, groups)}
+    )
+
+
+async def build_batch_structure(structure_id: int, key: tuple, leis: list, current: Dataset) -> bytes:
+    """
+    Builds one structure of a batch and returns it as a line of newline
+    delimited json, followed by one line per LEI that refers to it. Encoded
+    structures are inserted into their lines as they are.
+    """
+    timings = Timings()
+    try:
+        data = await structure_executor.get_or_build(structure_cache, key + (current.version, "full"), leis[0],
+                                                     timings, g=current.network)
+        line = b'{"structure":%d,"data":%s}\n' % (structure_id, data)
+        record_timings(timings, timings.notes["cache"])
+    except Overloaded:
+        line = dumps({"structure": structure_id, "error": "too many pending structure requests"}) + b"\n"
+        record_timings(timings, "overloaded")
+    except asyncio.TimeoutError:
+        line = dumps({"structure": structure_id, "error": "building the structure timed out"}) + b"\n"
+        record_timings(timings, "timeout")
+    return line + b"".join(dumps({"lei": lei, "structure": structure_id}) + b"\n" for lei in leis)
+
+
+async def iter_structure_batch(groups: dict, current: Dataset):
+    """
+    Builds every distinct structure of a batch once and yields its lines, see
+    build_batch_structure, in the order of the groups. Up to batch_concurrency
+    structures are built at the same time, the builds that are still running
+    are cancelled if the client goes away.
+    """
+    running = collections.deque()
+    try:
+        for structure_id, (key, leis) in enumerate(groups.items()):
+            running.append(asyncio.ensure_future(build_batch_structure(structure_id, key, leis, current)))
+            if len(running) >= batch_concurrency:
+                yield await running.popleft()
+        while running:
+            yield await running.popleft()
+    finally:
+        for task in running:
+            task.cancel()
+
+
+@api.post("/company/structure:batch")
+async def get_company_structures(leis: List[str] = Body(..., embed=True)):
+    """
+    This endpoint returns the holding structures of many node ids at once, as
+    newline delimited json. Node ids that share a structure are grouped, and
+    every structure is built and sent only once:
+
+        {"structure": 0, "data": {"nodes": [...], "edges": [...]}}
+        {"lei": "...", "structure": 0}
+
+    A structure that could not be built has an "error" instead of "data".
+    :param leis:
+    :return:
+    """
+    if len(leis) > batch_max_leis:
+        raise HTTPException(status_code=413, detail="at most {} node ids per batch".format(batch_max_leis))
+    current = dataset
+    # grouping looks up the structure key of every LEI, which takes a while for big batches
+    groups = await asyncio.get_event_loop().run_in_executor(None, Builder().structure_groups, current.network, leis)
+    return StreamingResponse(iter_structure_batch(groups, current), media_type="application/x-ndjson")
+
+
+@api.get("/metrics")
+def get_metrics():
+    """
+    This endpoint returns the metrics of the server in the Prometheus text format.
+    :return:
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@api.get("/export/structures")
+def export_structures():
+    """
+    This endpoint streams every holding structure as newline delimited json, one
+    line per distinct structure with its root, its node ids, nodes and edges.
+    :return:
+    """
+    return StreamingResponse(iter_structures_ndjson(dataset.network), media_type="application/x-ndjson")
+
+
+@api.post("/admin/delta")
+def post_delta(rr: str = Body(None), lei: str = Body(None), x_admin_token: str = Header(None)):
+    """
+    This endpoint applies GLEIF delta files from the data directory to the
+    served dataset without a reload, see apply_delta. Requires the ADMIN_TOKEN
+    in the X-Admin-Token header.
+    :param rr: name of the RR delta file
+    :param lei: name of the LEI delta file
+    :return:
+    """
+    check_admin_token(x_admin_token)
+    delta = Delta.from_csv(rr=data_file(rr) if rr else None, lei=data_file(lei) if lei else None)
+    if len(delta) == 0:
+        raise HTTPException(status_code=400, detail="the delta files contain no changes")
+    updated = apply_delta(delta)
+    return {"version": updated.version, "relationships": len(delta.relationships), "names": len(delta.names)}
+
+
+@api.post("/admin/reload", status_code=202)
+def post_reload(x_admin_token: str = Header(None)):
+    """
+    This endpoint reloads the dataset from the data files in the background. The
+    current dataset keeps serving until the new one is loaded completely.
+    Requires the ADMIN_TOKEN in the X-Admin-Token header.
+    :return:
+    """
+    check_admin_token(x_admin_token)
+    return {"started": dataset_reloader.reload(), "version": dataset.version}
+
+
+@api.get("/admin/reload")
+def get_reload(x_admin_token: str = Header(None)):
+    """
+    This endpoint returns the state of the dataset reloads.
+    :return:
+    """
+    check_admin_token(x_admin_token)
+    return dict(dataset_reloader.status(), version=dataset.version)
+
+
+@api.get("/admin/profile")
+def get_profile(seconds: float = Query(10, gt=0, le=60), interval: float = Query(0.005, ge=0.001, le=1),
+                x_admin_token: str = Header(None)):
+    """
+    This endpoint samples the stacks of the server threads for the given number
+    of seconds and returns them in the folded format of flamegraph.pl and
+    speedscope. Requires the ADMIN_TOKEN in the X-Admin-Token header.
+    :param seconds: how long to sample
+    :param interval: seconds between samples
+    :return:
+    """
+    check_admin_token(x_admin_token)
+    profiler = SamplingProfiler(interval).profile(seconds)
+    return PlainTextResponse(profiler.folded(), headers={"X-Profile-Samples": str(profiler.sampled)})
@@ -1,9 +1,212 @@
+import gzip
+import importlib
+import json
+import os
+import sys
+import threading
+
+import pytest
 from starlette.testclient import TestClient
-#  from app import api
 
-#  client = TestClient(api)
+from algorithms import executor
+from algorithms.cache import StructureCache
+from algorithms.encoding import COMPRESSIONS, FORMATS
+
+RR_HEADER = (
+    'Relationship.StartNode.NodeID,Relationship.EndNode.NodeID,Relationship.RelationshipType,'
+    'Relationship.RelationshipStatus,Registration.RegistrationStatus\n'
+)
+RR_CSV = RR_HEADER + (
+    'B,A,IS_DIRECTLY_CONSOLIDATED_BY,ACTIVE,PUBLISHED\n'
+    'C,B,IS_DIRECTLY_CONSOLIDATED_BY,ACTIVE,PUBLISHED\n'
+    'C,A,IS_ULTIMATELY_CONSOLIDATED_BY,ACTIVE,PUBLISHED\n'
+    'E,D,IS_DIRECTLY_CONSOLIDATED_BY,ACTIVE,PUBLISHED\n'
+    'F,D,IS_DIRECTLY_CONSOLIDATED_BY,ACTIVE,PUBLISHED\n'
+)
+LEI_CSV = 'LEI,Entity.LegalName\nA,a\nB,b\nC,c\nD,d\nE,e\nF,f\n'
+TOKEN = {'X-Admin-Token': 'secret'}
+IDENTITY = {'Accept-Encoding': 'identity'}
+
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+    """
+    The app module, loaded with a small dataset. It reads its settings on
+    import, so it is imported once the data directory is set.
+    """
+    data = tmp_path_factory.mktemp('data')
+    (data / 'gleif_rr.csv').write_text(RR_CSV)
+    (data / 'gleif_lei.csv').write_text(LEI_CSV)
+    (data / 'delta_rr.csv').write_text(RR_HEADER + 'G,A,IS_DIRECTLY_CONSOLIDATED_BY,ACTIVE,PUBLISHED\n')
+    (data / 'empty_rr.csv').write_text(RR_HEADER)
+    previous = os.environ.get('DATA_PATH')
+    os.environ['DATA_PATH'] = str(data)
+    sys.modules.pop('app', None)
+    try:
+        yield importlib.import_module('app')
+    finally:
+        sys.modules.pop('app', None)
+        if previous is None:
+            del os.environ['DATA_PATH']
+        else:
+            os.environ['DATA_PATH'] = previous
+
+
+@pytest.fixture
+def client(app, monkeypatch):
+    # every test starts with an empty cache and the loaded dataset
+    monkeypatch.setattr(app, 'structure_cache', StructureCache(max_bytes=1024 * 1024))
+    monkeypatch.setattr(app, 'dataset', app.dataset)
+    monkeypatch.setattr(app.structure_executor, 'g', app.structure_executor.g)
+    monkeypatch.setattr(app, 'admin_token', 'secret')
+    return TestClient(app.api)
+
+
+def server_timing(response) -> dict:
+    entries = [entry.split(';', 1) for entry in response.headers['Server-Timing'].split(', ')]
+    return {name: value for name, value in entries}
+
+
+def test_structure_is_cached_per_version_and_format(app, client):
+    key = app.Builder().structure_key(app.dataset.network, 'C')
+
+    response = client.get('/company/C/structure', headers=IDENTITY)
+    assert response.status_code == 200
+    assert {node['id'] for node in response.json()['nodes']} == {'A', 'B', 'C'}
+    assert server_timing(response)['cache'] == 'desc="miss"'
+    assert key + (app.dataset.version, 'full') in app.structure_cache
+
+    # A is the ultimate parent of C, so it shares the structure
+    response = client.get('/company/A/structure', headers=IDENTITY)
+    assert server_timing(response)['cache'] == 'desc="hit"'
+
+    response = client.get('/company/C/structure', params={'format': 'compact'}, headers=IDENTITY)
+    assert server_timing(response)['cache'] == 'desc="miss"'
+    assert key + (app.dataset.version, 'compact') in app.structure_cache
+
+
+def test_structure_format(client):
+    response = client.get('/company/C/structure', headers=IDENTITY)
+    assert response.headers['Content-Type'] == FORMATS['full']
+
+    for params, headers in [({'format': 'compact'}, {}), ({}, {'Accept': FORMATS['compact']})]:
+        response = client.get('/company/C/structure', params=params, headers=dict(IDENTITY, **headers))
+        assert response.status_code == 200
+        assert response.headers['Content-Type'] == FORMATS['compact']
+        assert 'Accept' in response.headers['Vary']
+
+    assert client.get('/company/C/structure', params={'format': 'xml'}).status_code == 400
+
+
+def test_structure_compression(app, client, monkeypatch):
+    uncompressed = client.get('/company/C/structure', headers=IDENTITY)
+    assert 'Content-Encoding' not in uncompressed.headers
+
+    monkeypatch.setattr(app, 'compress_min_bytes', 0)
+    response = client.get('/company/C/structure', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.content == uncompressed.content
+    assert app.structure_cache.get(
+        app.Builder().structure_key(app.dataset.network, 'C') + (app.dataset.version, 'full', 'gzip')
+    ) is not None
+    assert 'compress' in server_timing(response)
+
+    response = client.get('/company/C/structure', headers={'Accept-Encoding': 'br, gzip;q=0.5'})
+    assert response.headers['Content-Encoding'] == COMPRESSIONS[0]
+
+    # smaller structures are sent as they are
+    monkeypatch.setattr(app, 'compress_min_bytes', len(uncompressed.content) + 1)
+    response = client.get('/company/C/structure', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_structure_overloaded(app, client, monkeypatch):
+    monkeypatch.setattr(app.structure_executor, 'max_pending', 0)
+    response = client.get('/company/C/structure')
+    assert response.status_code == 503
+
+
+def test_structure_timeout(app, client, monkeypatch):
+    released = threading.Event()
+    structure = executor.Builder.structure
+
+    def blocked(self, *args, **kwargs):
+        released.wait(5)
+        return structure(self, *args, **kwargs)
+
+    monkeypatch.setattr(executor.Builder, 'structure', blocked)
+    monkeypatch.setattr(app.structure_executor, 'timeout', 0.05)
+    try:
+        response = client.get('/company/C/structure')
+    finally:
+        released.set()
+    assert response.status_code == 504
+
+
+def test_structure_server_timing(client):
+    timing = server_timing(client.get('/company/C/structure', headers=IDENTITY))
+    assert {'cache', 'queue', 'encode', 'total', 'nodes', 'edges'} <= set(timing)
+    assert timing['total'].startswith('dur=')
+    assert timing['nodes'] == 'desc=3'
+
+
+def test_structure_batch(app, client):
+    response = client.post('/company/structure:batch', json={'leis': ['C', 'E', 'A', 'UNKNOWN', 'C']})
+    assert response.status_code == 200
+    assert response.headers['Content-Type'] == 'application/x-ndjson'
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    structures = [line for line in lines if 'data' in line]
+    assert [line['structure'] for line in structures] == [0, 1, 2]
+    references = {line['lei']: line['structure'] for line in lines if 'lei' in line}
+    assert references == {'C': 0, 'A': 0, 'E': 1, 'UNKNOWN': 2}
+    assert {node['id'] for node in structures[1]['data']['nodes']} == {'D', 'E', 'F'}
+    # every structure is followed by the LEIs that refer to it
+    assert lines.index(structures[1]) == lines.index({'lei': 'E', 'structure': 1}) - 1
+
+
+def test_structure_batch_limits(app, client, monkeypatch):
+    monkeypatch.setattr(app, 'batch_max_leis', 2)
+    assert client.post('/company/structure:batch', json={'leis': ['A', 'B', 'C']}).status_code == 413
+
+    monkeypatch.setattr(app, 'batch_max_leis', 10)
+    monkeypatch.setattr(app.structure_executor, 'max_pending', 0)
+    lines = client.post('/company/structure:batch', json={'leis': ['A']}).text.splitlines()
+    assert json.loads(lines[0]) == {'structure': 0, 'error': 'too many pending structure requests'}
+
+
+def test_admin_token(app, client, monkeypatch):
+    assert client.get('/admin/reload').status_code == 403
+    assert client.get('/admin/reload', headers={'X-Admin-Token': 'wrong'}).status_code == 403
+    assert client.get('/admin/reload', headers=TOKEN).status_code == 200
+
+    monkeypatch.setattr(app, 'admin_token', None)
+    response = client.get('/admin/reload', headers=TOKEN)
+    assert response.status_code == 403
+    assert 'ADMIN_TOKEN' in response.json()['detail']
+
+
+def test_admin_delta(app, client):
+    version = app.dataset.version
+    assert client.post('/admin/delta', json={'rr': 'delta_rr.csv'}).status_code == 403
+    assert client.post('/admin/delta', json={'rr': '../gleif_rr.csv'}, headers=TOKEN).status_code == 400
+    assert client.post('/admin/delta', json={'rr': 'empty_rr.csv'}, headers=TOKEN).status_code == 400
+    assert client.post('/admin/delta', json={}, headers=TOKEN).status_code == 400
+    assert app.dataset.version == version
+
+    client.get('/company/E/structure', headers=IDENTITY)
+    response = client.post('/admin/delta', json={'rr': 'delta_rr.csv'}, headers=TOKEN)
+    assert response.status_code == 200
+    assert response.json() == {'version': version + 1, 'relationships': 1, 'names': 0}
+
+    # structures the delta does not touch stay cached under the new version
+    assert server_timing(client.get('/company/E/structure', headers=IDENTITY))['cache'] == 'desc="hit"'
+    response = client.get('/company/C/structure', headers=IDENTITY)
+    assert {node['id'] for node in response.json()['nodes']} == {'A', 'B', 'C', 'G'}
+
 
-#  def test_read_main():
-#      response = client.get("/")
-#      assert response.status_code == 200
-#      assert response.json() == {"msg": "Hello World"}
+def test_compressed_payload_is_gzip(app, client, monkeypatch):
+    monkeypatch.setattr(app, 'compress_min_bytes', 0)
+    key = app.Builder().structure_key(app.dataset.network, 'E') + (app.dataset.version, 'full')
+    client.get('/company/E/structure', headers={'Accept-Encoding': 'gzip'})
+    assert gzip.decompress(app.structure_cache.get(key + ('gzip',))) == app.structure_cache.get(key)
@@ -0,0 +1,243 @@
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+from algorithms.compact import CompactGraph
+from algorithms.encoding import dumps
+from algorithms.graph import Graph
+from algorithms.graph_builder import DirectNodeGraphWithParentNetworkBuilder as Builder
+from algorithms.names import NameStore
+from algorithms.snapshot import Snapshot
+from algorithms.synthetic import SyntheticGleif
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+RESULTS_PATH = os.path.join(ROOT_DIR, "benchmarks")
+
+
+def peak_rss_mb() -> float:
+    """
+    Returns the peak resident memory of this process so far, in MB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def percentiles(seconds: list) -> dict:
+    """
+    Summarizes latencies in milliseconds.
+    """
+    ordered = sorted(seconds)
+
+    def at(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+
+    return {
+        "count": len(ordered),
+        "p50_ms": at(0.5),
+        "p90_ms": at(0.9),
+        "p99_ms": at(0.99),
+        "max_ms": round(ordered[-1] * 1000, 3),
+        "total_s": round(sum(ordered), 3),
+    }
+
+
+def commit() -> str:
+    try:
+        sha = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR,
+                                      universal_newlines=True).strip()
+        dirty = subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT_DIR,
+                                        universal_newlines=True).strip()
+        return sha + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+class Benchmark:
+    """
+    Runs the benchmark stages on synthetic data and collects their results.
+    """
+
+    def __init__(self, generator: SyntheticGleif, data_dir: str, queries: int, requests: int, seed: int):
+        self.generator = generator
+        self.data_dir = data_dir
+        self.queries = queries
+        self.requests = requests
+        self.seed = seed
+        self.rr_path = os.path.join(data_dir, "gleif_rr.csv")
+        self.lei_path = os.path.join(data_dir, "gleif_lei.csv")
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        yield
+        self.stages[name] = {"seconds": round(time.perf_counter() - start, 4), "peak_rss_mb": round(peak_rss_mb(), 1)}
+
+    def sample(self, g) -> list:
+        """
+        Picks the query nodes: random ones, plus the roots of the largest
+        components, which dominate the tail latencies.
+        """
+        r = random.Random(self.seed)
+        nodes = list(g.nodes)
+        index = g.component_index
+        largest = sorted(index.component_ids(), key=lambda i: -len(index.members_of(i)))[:5]
+        return r.sample(nodes, min(self.queries, len(nodes))) + [index.members_of(i)[0] for i in largest]
+
+    def queries_of(self, g, name: str) -> dict:
+        """
+        Times the stages of a structure request for every sampled node.
+        """
+        builder = Builder()
+        timings = {"build": [], "set_levels": [], "set_levels_bfs": [], "to_array": [], "encode": []}
+        for node in self.sample(g):
+            start = time.perf_counter()
+            structure, parent = builder.build(g, node)
+            timings["build"].append(time.perf_counter() - start)
+            root = parent if parent is not None else node
+
+            start = time.perf_counter()
+            structure.set_levels(root)
+            timings["set_levels_bfs"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            structure.set_levels(root, levels=g.level_index)
+            timings["set_levels"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            payload = structure.to_array()
+            timings["to_array"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            dumps(payload)
+            timings["encode"].append(time.perf_counter() - start)
+        return {"{}[{}]".format(stage, name): percentiles(seconds) for stage, seconds in timings.items()}
+
+    def endpoint(self) -> dict:
+        """
+        Measures the end-to-end latency of the structure endpoint, first with an
+        empty cache and then with a warm one.
+        """
+        os.environ["DATA_PATH"] = self.data_dir
+        from fastapi.testclient import TestClient
+        import app
+
+        nodes = random.Random(self.seed).sample(list(app.dataset.network.nodes), self.requests)
+        results = {}
+        with TestClient(app.api) as client:
+            for name in ("cold", "warm"):
+                seconds = []
+                for node in nodes:
+                    start = time.perf_counter()
+                    response = client.get("/company/{}/structure".format(node))
+                    seconds.append(time.perf_counter() - start)
+                    assert response.status_code == 200, response.text
+                results["endpoint[{}]".format(name)] = percentiles(seconds)
+        return results
+
+    def run(self) -> dict:
+        with self.stage("generate"):
+            relationships, names = self.generator.write_csv(self.rr_path, self.lei_path)
+        with self.stage("Graph.from_csv"):
+            g = Graph.from_csv(self.rr_path)
+        with self.stage("Graph.build_indexes"):
+            g.build_indexes()
+        with self.stage("Graph.set_lookup_table"):
+            Graph.set_lookup_table(self.lei_path)
+        with self.stage("Graph.compile_snapshot"):
+            snapshot_path = os.path.join(self.data_dir, "bench.snapshot")
+            Graph.compile_snapshot(self.rr_path, self.lei_path, snapshot_path)
+        with self.stage("CompactGraph.from_snapshot"):
+            snapshot = Snapshot.open(snapshot_path)
+            compact = CompactGraph.from_snapshot(snapshot).build_indexes()
+            compact.lookup_table = NameStore.from_snapshot(snapshot)
+
+        latencies = {}
+        latencies.update(self.queries_of(g, "Graph"))
+        latencies.update(self.queries_of(compact, "CompactGraph"))
+        if self.requests:
+            latencies.update(self.endpoint())
+
+        return {
+            "commit": commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "params": dict(vars(self.generator), queries=self.queries, requests=self.requests),
+            "data": {"relationships": relationships, "names": names, "nodes": len(g.nodes)},
+            "stages": self.stages,
+            "latencies": latencies,
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+        }
+
+
+def flatten(results: dict) -> dict:
+    metrics = {"{}.seconds".format(name): stage["seconds"] for name, stage in results["stages"].items()}
+    for name, latency in results["latencies"].items():
+        metrics.update({"{}.{}".format(name, key): value for key, value in latency.items() if key != "count"})
+    metrics["peak_rss_mb"] = results["peak_rss_mb"]
+    return metrics
+
+
+def compare(old: dict, new: dict, threshold: float) -> int:
+    """
+    Prints the metrics of two runs side by side. Returns the number of metrics
+    that got worse by more than the threshold factor.
+    """
+    old_metrics, new_metrics = flatten(old), flatten(new)
+    print("{:<48} {:>12} {:>12} {:>8}".format("metric ({} -> {})".format(old["commit"], new["commit"]),
+                                               "old", "new", "ratio"))
+    regressions = 0
+    for name, value in new_metrics.items():
+        if name not in old_metrics:
+            continue
+        ratio = value / old_metrics[name] if old_metrics[name] else float("inf") if value else 1.0
+        worse = ratio > threshold and value - old_metrics[name] > 0.001
+        regressions += worse
+        print("{:<48} {:>12} {:>12} {:>8.2f}{}".format(name, old_metrics[name], value, ratio, "  !" if worse else ""))
+    return regressions
+
+
+def main():
+    """
+    Benchmarks loading, structure queries and the structure endpoint on
+    synthetic GLEIF data, and saves the results as json. With --compare, two
+    saved results are compared instead.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--groups", type=int, default=2000, help="number of company groups to generate")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--queries", type=int, default=200, help="structure queries per engine")
+    parser.add_argument("--requests", type=int, default=200, help="endpoint requests per pass, 0 to skip")
+    parser.add_argument("--data-dir", help="directory for the generated files, a temporary one by default")
+    parser.add_argument("--out", help="result file, benchmarks/<timestamp>-<commit>.json by default")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files")
+    parser.add_argument("--threshold", type=float, default=1.2, help="ratio that counts as a regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as old, open(args.compare[1]) as new:
+            sys.exit(1 if compare(json.load(old), json.load(new), args.threshold) else 0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        generator = SyntheticGleif(groups=args.groups, seed=args.seed)
+        results = Benchmark(generator, args.data_dir or tmp, args.queries, args.requests, args.seed).run()
+
+    out = args.out or os.path.join(RESULTS_PATH, "{}-{}.json".format(time.strftime("%Y%m%d-%H%M%S"), results["commit"]))
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print("Wrote {}".format(out))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+import argparse
+import os
+
+from algorithms.graph import Graph
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+DATA_PATH = os.path.join(ROOT_DIR, "data")
+
+
+def main():
+    """
+    Compiles the GLEIF csv files into the binary snapshot loaded by the app.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--rr", default=os.path.join(DATA_PATH, "gleif_rr.csv"), help="relationship csv file")
+    parser.add_argument("--lei", default=os.path.join(DATA_PATH, "gleif_lei.csv"), help="LEI csv file")
+    parser.add_argument("--out", default=os.path.join(DATA_PATH, "gleif.snapshot"), help="snapshot file to write")
+    args = parser.parse_args()
+
+    snapshot = Graph.compile_snapshot(args.rr, args.lei, args.out)
+    print("Wrote {} LEIs and {} relationships to {}".format(len(snapshot), snapshot.edge_count, args.out))
+
+
+if __name__ == "__main__":
+    main()
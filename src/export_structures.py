@@ -0,0 +1,38 @@
+import argparse
+import os
+import sys
+
+from algorithms.dataset import Dataset
+from algorithms.export import iter_structures_ndjson
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+DATA_PATH = os.path.join(ROOT_DIR, "data")
+
+
+def main():
+    """
+    Exports every holding structure of the GLEIF data as newline delimited json,
+    one line per distinct structure with its root, its LEIs, nodes and edges.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--rr", default=os.path.join(DATA_PATH, "gleif_rr.csv"), help="relationship csv file")
+    parser.add_argument("--lei", default=os.path.join(DATA_PATH, "gleif_lei.csv"), help="LEI csv file")
+    parser.add_argument("--snapshot", default=os.path.join(DATA_PATH, "gleif.snapshot"),
+                        help="snapshot file, used instead of the csv files if it exists")
+    parser.add_argument("--out", default="-", help="file to write, - for stdout")
+    parser.add_argument("--processes", type=int, default=1, help="worker processes")
+    parser.add_argument("--chunksize", type=int, default=256, help="components per worker task")
+    args = parser.parse_args()
+
+    network = Dataset.load(args.rr, args.lei, args.snapshot).network
+
+    out = sys.stdout if args.out == "-" else open(args.out, "w")
+    try:
+        out.writelines(iter_structures_ndjson(network, processes=args.processes, chunksize=args.chunksize))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()